@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = ".jackcache.json"
+
+
+def hash_file(path: str) -> str:
+    """Returns the hex digest of the file's contents."""
+    with open(path, 'rb') as file:
+        return hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+
+
+class BuildCache:
+    """
+    On-disk manifest of an incremental build. For every .jack file it records the source hash and the
+    size and mtime of the .vm file it produced, together with the compiler version and the options used.
+    A file is up to date when all of these still match, so a warm rebuild only hashes the sources.
+    """
+
+    def __init__(self, directory: str, version: str, options: dict) -> None:
+        """Loads the manifest of the given directory, discarding it if the version or options changed."""
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.version = version
+        self.options = options
+        self.entries = {}
+        self.source_hashes = {}
+        try:
+            with open(self.path, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return
+        if manifest.get("version") == version and manifest.get("options") == options:
+            self.entries = manifest.get("files", {})
+
+    def is_up_to_date(self, input_path: str, output_path: str) -> bool:
+        """Checks whether input_path must be recompiled. Remembers its hash for update()."""
+        source_hash = hash_file(input_path)
+        self.source_hashes[input_path] = source_hash
+        entry = self.entries.get(os.path.basename(input_path))
+        if entry is None or entry["source"] != source_hash:
+            return False
+        try:
+            output_stat = os.stat(output_path)
+        except OSError:
+            return False
+        return entry["output"] == [output_stat.st_size, output_stat.st_mtime_ns]
+
+    def update(self, input_path: str, output_path: str, succeeded: bool) -> None:
+        """Records the result of compiling input_path. Failed files are dropped from the manifest."""
+        name = os.path.basename(input_path)
+        if not succeeded:
+            self.entries.pop(name, None)
+            return
+        output_stat = os.stat(output_path)
+        self.entries[name] = {
+            "source": self.source_hashes.get(input_path) or hash_file(input_path),
+            "output": [output_stat.st_size, output_stat.st_mtime_ns]}
+
+    def save(self) -> None:
+        """Writes the manifest back to disk."""
+        manifest = {"version": self.version, "options": self.options,
+                    "files": dict(sorted(self.entries.items()))}
+        with open(self.path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, separators=(",", ":"))
@@ -0,0 +1,153 @@
+import os
+import re
+import typing
+
+# Class and subroutine declarations, and the comments and string literals that may contain text looking
+# like one. Only the declarations have a named group that matches. The lookahead lets the scan skip
+# most positions with a single character test.
+DECLARATION_REGEX = re.compile(r"""
+    (?=[/"cfm])
+    (?: //[^\n]* | /\*.*?\*/ | "[^"\n]*"
+      | \bclass\s+(?P<class_name>\w+)
+      | \b(?P<kind>constructor|function|method)\s+\w+\s+(?P<name>\w+)\s*\((?P<parameters>[^)]*)\))
+""", re.VERBOSE | re.DOTALL)
+
+# The words of a source, a superset of the class names it refers to.
+WORD_REGEX = re.compile(r"[A-Za-z_]\w*")
+
+# Subroutines of the standard OS classes: kind and number of parameters.
+OS_CLASSES = {
+    "Math": {"abs": ("FUNCTION", 1), "multiply": ("FUNCTION", 2), "divide": ("FUNCTION", 2),
+             "min": ("FUNCTION", 2), "max": ("FUNCTION", 2), "sqrt": ("FUNCTION", 1), "init": ("FUNCTION", 0)},
+    "String": {"new": ("CONSTRUCTOR", 1), "dispose": ("METHOD", 0), "length": ("METHOD", 0),
+               "charAt": ("METHOD", 1), "setCharAt": ("METHOD", 2), "appendChar": ("METHOD", 1),
+               "eraseLastChar": ("METHOD", 0), "intValue": ("METHOD", 0), "setInt": ("METHOD", 1),
+               "backSpace": ("FUNCTION", 0), "doubleQuote": ("FUNCTION", 0), "newLine": ("FUNCTION", 0)},
+    "Array": {"new": ("FUNCTION", 1), "dispose": ("METHOD", 0)},
+    "Output": {"moveCursor": ("FUNCTION", 2), "printChar": ("FUNCTION", 1), "printString": ("FUNCTION", 1),
+               "printInt": ("FUNCTION", 1), "println": ("FUNCTION", 0), "backSpace": ("FUNCTION", 0),
+               "init": ("FUNCTION", 0)},
+    "Screen": {"clearScreen": ("FUNCTION", 0), "setColor": ("FUNCTION", 1), "drawPixel": ("FUNCTION", 2),
+               "drawLine": ("FUNCTION", 4), "drawRectangle": ("FUNCTION", 4), "drawCircle": ("FUNCTION", 3),
+               "init": ("FUNCTION", 0)},
+    "Keyboard": {"keyPressed": ("FUNCTION", 0), "readChar": ("FUNCTION", 0), "readLine": ("FUNCTION", 1),
+                 "readInt": ("FUNCTION", 1), "init": ("FUNCTION", 0)},
+    "Memory": {"peek": ("FUNCTION", 1), "poke": ("FUNCTION", 2), "alloc": ("FUNCTION", 1),
+               "deAlloc": ("FUNCTION", 1), "init": ("FUNCTION", 0)},
+    "Sys": {"halt": ("FUNCTION", 0), "error": ("FUNCTION", 1), "wait": ("FUNCTION", 1), "init": ("FUNCTION", 0)},
+}
+
+
+class ClassIndex:
+    """
+    The classes of a program and the kind and parameter count of each of their subroutines, so calls into
+    other classes can be resolved and checked while a single class is compiled. It is built by a quick
+    regex scan of the sources rather than a parse, and starts out with the standard OS classes; a class of
+    the program with the same name replaces the OS one. Files indexed with add_file can later be re-indexed
+    or dropped one at a time, so a long-running process can keep the index up to date and find the
+    files to recompile when the declarations of a class change.
+    """
+
+    def __init__(self) -> None:
+        # class name -> {subroutine name: (kind, number of parameters)}
+        self.classes = {name: dict(subroutines) for name, subroutines in OS_CLASSES.items()}
+        # .jack path -> the class it declares, for the files indexed with add_file.
+        self.file_classes = {}
+        # .jack path -> the words of the file, which include the names of the classes it refers to.
+        self.file_words = {}
+
+    @classmethod
+    def from_files(cls, paths: typing.Iterable[str]) -> "ClassIndex":
+        """Indexes the given .jack files; files that cannot be read are skipped."""
+        index = cls()
+        for path in paths:
+            try:
+                index.add_file(path)
+            except OSError:
+                continue
+        return index
+
+    @classmethod
+    def from_directory(cls, directory: str) -> "ClassIndex":
+        """Indexes every .jack file of a directory."""
+        return cls.from_files(os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+                              if filename.endswith(".jack"))
+
+    @classmethod
+    def from_signatures(cls, signatures: tuple) -> "ClassIndex":
+        """Rebuilds an index from the snapshot that signatures() returned."""
+        index = cls()
+        index.classes = {class_name: dict(subroutines) for class_name, subroutines in signatures}
+        return index
+
+    def signatures(self, source: str = None) -> tuple:
+        """
+        Returns an immutable snapshot of the declarations in the index, for use as a cache key. With a source,
+        only the classes whose names occur in it are included: all that its calls can be resolved against, so
+        a class gets the same snapshot in every program that declares the classes it uses the same way.
+        """
+        if source is None:
+            class_names = sorted(self.classes)
+        else:
+            class_names = sorted(set(WORD_REGEX.findall(source)).intersection(self.classes))
+        return tuple((class_name, tuple(sorted(self.classes[class_name].items()))) for class_name in class_names)
+
+    def add_source(self, source: str) -> typing.Optional[str]:
+        """Indexes the declarations of one class. Returns the name of the class, or None if none is declared."""
+        class_name = None
+        subroutines = None
+        for match in DECLARATION_REGEX.finditer(source):
+            if match["class_name"] is not None and subroutines is None:
+                class_name = match["class_name"]
+                subroutines = self.classes[class_name] = {}
+            elif match["kind"] is not None and subroutines is not None:
+                parameters = match["parameters"].strip()
+                subroutines[match["name"]] = (match["kind"].upper(), parameters.count(",") + 1 if parameters else 0)
+        return class_name
+
+    def add_file(self, path: str) -> None:
+        """Indexes the .jack file at path, replacing what an earlier add_file of the same path declared."""
+        with open(path, 'r') as jack_file:
+            source = jack_file.read()
+        self.remove_file(path)
+        self.file_classes[path] = self.add_source(source)
+        self.file_words[path] = frozenset(WORD_REGEX.findall(source))
+
+    def remove_file(self, path: str) -> None:
+        """Drops the class that add_file indexed from path; an OS class it replaced comes back."""
+        class_name = self.file_classes.pop(path, None)
+        self.file_words.pop(path, None)
+        if class_name in OS_CLASSES:
+            self.classes[class_name] = dict(OS_CLASSES[class_name])
+        elif class_name is not None:
+            del self.classes[class_name]
+
+    def files_naming(self, class_names: typing.Iterable[str]) -> typing.List[str]:
+        """Returns the files indexed with add_file whose source names any of the given classes."""
+        class_names = set(class_names)
+        return sorted(path for path, words in self.file_words.items() if not words.isdisjoint(class_names))
+
+    def lookup(self, class_name: str, subroutine_name: str) -> typing.Optional[typing.Tuple[str, int]]:
+        """Returns (kind, number of parameters) of a subroutine, or None if it is not known."""
+        subroutines = self.classes.get(class_name)
+        return None if subroutines is None else subroutines.get(subroutine_name)
+
+    def check_call(self, class_name: str, subroutine_name: str, as_method: bool,
+                   n_arguments: int) -> typing.Optional[str]:
+        """
+        Returns a description of what is wrong with a call of class_name.subroutine_name, or None if it is
+        fine. as_method tells whether the call passes an object; n_arguments does not count the object.
+        """
+        if class_name not in self.classes:
+            return f"unknown class {class_name} in call to {class_name}.{subroutine_name}"
+        signature = self.classes[class_name].get(subroutine_name)
+        if signature is None:
+            return f"class {class_name} has no subroutine {subroutine_name}"
+        kind, n_parameters = signature
+        if as_method and kind != "METHOD":
+            return f"{kind.lower()} {class_name}.{subroutine_name} is called on an object"
+        if not as_method and kind == "METHOD":
+            return f"method {class_name}.{subroutine_name} is called without an object"
+        if n_arguments != n_parameters:
+            return f"{class_name}.{subroutine_name} takes {n_parameters} argument(s) but is given {n_arguments}"
+        return None
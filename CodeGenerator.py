@@ -0,0 +1,504 @@
+import typing
+
+from ClassIndex import ClassIndex
+from ConstantFolder import reduce_strength
+from JackAST import (Node, Constant, StringConstant, This, Variable, ArrayAccess, Call, UnaryOp, BinaryOp,
+                     Statement, Let, If, While, Do, Return, Subroutine, Class)
+from SymbolTable import SymbolTable
+from VMWriter import VMWriter
+
+OP_VM = {'+': "add", '-': "sub", "&amp;": "and", '|': "or",
+         "&lt;": "lt", "&gt;": "gt", '=': "eq"}
+
+UNARY_OP = {'~': "not", '-': "neg", '#': "shiftright", '^': "shiftleft"}
+
+# not (x < k) is x > k - 1 and not (k < x) is k + 1 > x, and likewise for >: (inverse, step of k).
+INVERSE_COMPARISON = {"&lt;": ("&gt;", -1), "&gt;": ("&lt;", 1)}
+
+
+def is_offset(index: Node) -> bool:
+    """Whether an array index is a constant that can be used as the offset of the that segment."""
+    return type(index) is Constant and 0 <= index.value <= 32767
+
+
+def is_boolean(node: Node) -> bool:
+    """Whether an expression is always true (-1) or false (0), so ~ and & | act on it as logic."""
+    match node:
+        case Constant():
+            return node.value in (0, -1)
+        case UnaryOp():
+            return node.op == '~' and is_boolean(node.operand)
+        case BinaryOp():
+            return node.op in ("&lt;", "&gt;", '=') or (
+                node.op in ("&amp;", '|') and is_boolean(node.left) and is_boolean(node.right))
+    return False
+
+
+def reads_array(node: Node) -> bool:
+    """Whether an expression reads an array entry, which sets pointer 1."""
+    match node:
+        case ArrayAccess():
+            return True
+        case Call():
+            return any(reads_array(argument) for argument in node.arguments)
+        case UnaryOp():
+            return reads_array(node.operand)
+        case BinaryOp():
+            return reads_array(node.left) or reads_array(node.right)
+    return False
+
+
+class CodeGenerator:
+    """
+    Generates the VM code of a class from its abstract syntax tree into a VMWriter.
+    If strength_reduction is set, multiplications and divisions by suitable constants are turned into
+    shifts and adds. If pool_strings is set, each distinct string literal is built once per class into a
+    static slot, by the first use that finds the slot still null. With a class_index, calls are resolved
+    against the declarations of the whole program: an unqualified call of a function does not pass this,
+    and calls that do not match a declaration are collected in warnings.
+    If fast_arrays is set, array entries at constant indices are addressed as that k, stores of values that
+    cannot disturb pointer 1 skip the spill through temp 0, and pointer 1 is reused by accesses to the same
+    array within a statement.
+    If direct_branches is set, if and while statements branch on their conditions directly: a condition
+    is not turned into a boolean only to be negated, & and | short-circuit where the skipped operand has
+    no side effects, and while loops test at the bottom so the loop body falls through to the test.
+    Each statement starts with a comment line unless comments is unset. If source_map is set, the comment
+    is written as a marker that also holds the statement's token index (see VMWriter.write_marker).
+    """
+
+    def __init__(self, vm_writer: VMWriter, strength_reduction: bool = False, pool_strings: bool = False,
+                 class_index: ClassIndex = None, fast_arrays: bool = False, direct_branches: bool = False,
+                 comments: bool = True, source_map: bool = False) -> None:
+        self.vm_writer = vm_writer
+        self.strength_reduction = strength_reduction
+        self.pool_strings = pool_strings
+        self.class_index = class_index
+        self.fast_arrays = fast_arrays
+        self.direct_branches = direct_branches
+        self.comments = comments
+        self.source_map = source_map
+        # The array variable whose base address pointer 1 holds, if known. Only valid within a statement,
+        # and forgotten at every call, which an inlined body may turn into code that sets pointer 1.
+        self.that_base = None
+        self.warnings = []
+        self.symbol_table = SymbolTable()
+        self.class_name = ""
+        self.subroutine_name = ""
+        self.label_if_counter = 0
+        self.label_while_counter = 0
+        self.label_skip_counter = 0
+        self.label_string_counter = 0
+        # String literal -> static slot.
+        self.string_pool = {}
+        self.expression_generators = {
+            Constant: self.generate_constant, Variable: self.generate_variable, BinaryOp: self.generate_binary,
+            Call: self.generate_call, ArrayAccess: self.generate_array_access, UnaryOp: self.generate_unary,
+            StringConstant: self.generate_string, This: self.generate_this}
+
+    def generate_class(self, node: Class) -> None:
+        """Generates the code of every subroutine of a class."""
+        self.class_name = node.name
+        for var_dec in node.class_var_decs:
+            for name in var_dec.names:
+                self.symbol_table.define(name, var_dec.type, var_dec.kind)
+        for subroutine in node.subroutines:
+            self.generate_subroutine(subroutine)
+
+    def generate_subroutine(self, node: Subroutine) -> None:
+        self.symbol_table.start_subroutine()
+        if node.kind == "METHOD":
+            self.symbol_table.define("this", "Array", "ARG")
+        for type, name in node.parameters:
+            self.symbol_table.define(name, type, "ARG")
+        for var_dec in node.var_decs:
+            for name in var_dec.names:
+                self.symbol_table.define(name, var_dec.type, var_dec.kind)
+
+        self.subroutine_name = self.class_name + "." + node.name
+        self.vm_writer.write_function(self.subroutine_name, self.symbol_table.get_local_variable_count())
+
+        if node.kind == "METHOD":
+            self.vm_writer.write_push("argument", 0)
+            self.vm_writer.write_pop("pointer", 0)
+
+        if node.kind == "CONSTRUCTOR":
+            self.vm_writer.write_push("constant", self.symbol_table.get_field_variable_count())
+            self.vm_writer.write_call("Memory.alloc", 1)
+            self.vm_writer.write_pop("pointer", 0)
+
+        self.generate_statements(node.statements)
+
+    def generate_statements(self, statements: typing.List[Statement]) -> None:
+        for statement in statements:
+            if self.source_map:
+                self.vm_writer.write_marker(f"// {statement.comment}", statement.token_index)
+            elif self.comments:
+                self.vm_writer.write_to_file(f"// {statement.comment}")
+            self.that_base = None
+            match statement:
+                case Let():
+                    self.generate_let(statement)
+                case If():
+                    self.generate_if(statement)
+                case While():
+                    self.generate_while(statement)
+                case Do():
+                    self.generate_expression(statement.call)
+                    self.vm_writer.write_pop("temp", 0)
+                case Return():
+                    if statement.value is None:
+                        self.vm_writer.write_push("constant", 0)
+                    else:
+                        self.generate_expression(statement.value)
+                    self.vm_writer.write_return()
+
+    def generate_let(self, node: Let) -> None:
+        symbol = self.symbol_table.resolve(node.name)
+        if node.index is not None and self.fast_arrays:
+            self.generate_array_store(node)
+        elif node.index is not None:
+            self.generate_expression(node.index)
+            self.vm_writer.write_push(symbol.segment, symbol.index)
+            self.vm_writer.write_arithmetic("add")
+            self.generate_expression(node.value)
+            self.vm_writer.write_pop("temp", 0)
+            self.vm_writer.write_pop("pointer", 1)
+            self.vm_writer.write_push("temp", 0)
+            self.vm_writer.write_pop("that", 0)
+        else:
+            self.generate_expression(node.value)
+            self.vm_writer.write_pop(symbol.segment, symbol.index)
+
+    def generate_array_store(self, node: Let) -> None:
+        """
+        let name[index] = value in fast_arrays mode. Evaluation is reordered only where neither side can
+        call anything, so no side effect can observe the difference.
+        """
+        value_calls = self.may_call(node.value)
+        if is_offset(node.index):
+            if value_calls:
+                self.push_identifier(node.name)
+                self.generate_expression(node.value)
+                self.write_spilled_store(node.index.value)
+            else:
+                self.generate_expression(node.value)
+                self.point_that_at(node.name)
+                self.vm_writer.write_pop("that", node.index.value)
+            return
+        if not value_calls and not reads_array(node.value):
+            self.write_array_address(node)
+            self.generate_expression(node.value)
+        elif not value_calls and not self.may_call(node.index):
+            self.generate_expression(node.value)
+            self.write_array_address(node)
+        else:
+            self.generate_expression(node.index)
+            self.push_identifier(node.name)
+            self.vm_writer.write_arithmetic("add")
+            self.generate_expression(node.value)
+            self.write_spilled_store(0)
+            return
+        self.vm_writer.write_pop("that", 0)
+
+    def write_array_address(self, node: Let) -> None:
+        """Sets pointer 1 to the address of name[index]."""
+        self.generate_expression(node.index)
+        self.push_identifier(node.name)
+        self.vm_writer.write_arithmetic("add")
+        self.vm_writer.write_pop("pointer", 1)
+        self.that_base = None
+
+    def write_spilled_store(self, offset: int) -> None:
+        """Stores the value on top of the stack at offset from the address below it."""
+        self.vm_writer.write_pop("temp", 0)
+        self.vm_writer.write_pop("pointer", 1)
+        self.vm_writer.write_push("temp", 0)
+        self.vm_writer.write_pop("that", offset)
+        self.that_base = None
+
+    def point_that_at(self, name: str) -> None:
+        """Sets pointer 1 to the base address of an array variable, unless it already holds it."""
+        if self.that_base != name:
+            self.push_identifier(name)
+            self.vm_writer.write_pop("pointer", 1)
+            self.that_base = name
+
+    def may_call(self, node: Node) -> bool:
+        """Whether evaluating an expression may call a subroutine. A pooled string literal may build itself."""
+        match node:
+            case Call() | StringConstant():
+                return True
+            case ArrayAccess():
+                return self.may_call(node.index)
+            case UnaryOp():
+                return self.may_call(node.operand)
+            case BinaryOp():
+                # Without strength reduction, * and / are calls of Math.multiply and Math.divide.
+                return node.op in ("*", "/") or self.may_call(node.left) or self.may_call(node.right)
+        return False
+
+    def generate_while(self, node: While) -> None:
+        if self.direct_branches:
+            self.generate_rotated_while(node)
+            return
+        self.label_while_counter += 1
+        self.vm_writer.write_label("L" + str(self.label_while_counter))
+        self.generate_expression(node.condition)
+        self.vm_writer.write_arithmetic("not")
+        self.vm_writer.write_if("L" + str(self.label_while_counter + 1))
+        self.generate_statements(node.statements)
+        self.vm_writer.write_goto("L" + str(self.label_while_counter))
+        self.label_while_counter += 1
+        self.vm_writer.write_label("L" + str(self.label_while_counter))
+
+    def generate_rotated_while(self, node: While) -> None:
+        """
+        A while loop with its test at the bottom, entered by a jump to the test. The loop goes on while its
+        condition is -1, like the default code, so a condition that may be any other nonzero value is
+        still tested at the top.
+        """
+        self.label_while_counter += 1
+        label_body = "WhileBody" + str(self.label_while_counter)
+        label_test = "WhileTest" + str(self.label_while_counter)
+        if not is_boolean(node.condition):
+            label_end = "WhileEnd" + str(self.label_while_counter)
+            self.vm_writer.write_label(label_test)
+            self.generate_expression(node.condition)
+            self.vm_writer.write_arithmetic("not")
+            self.vm_writer.write_if(label_end)
+            self.generate_statements(node.statements)
+            self.vm_writer.write_goto(label_test)
+            self.vm_writer.write_label(label_end)
+            return
+        self.vm_writer.write_goto(label_test)
+        self.vm_writer.write_label(label_body)
+        self.generate_statements(node.statements)
+        self.vm_writer.write_label(label_test)
+        self.that_base = None
+        self.generate_branch(node.condition, label_body, True)
+
+    def generate_direct_if(self, node: If) -> None:
+        """An if statement whose then branch falls through from the test of the condition."""
+        self.label_if_counter += 1
+        label_false = 'FalseIf' + str(self.label_if_counter)
+        label_end = 'EndIf' + str(self.label_if_counter)
+        if node.else_statements is None:
+            self.generate_branch(node.condition, label_end, False)
+            self.generate_statements(node.statements)
+        else:
+            self.generate_branch(node.condition, label_false, False)
+            self.generate_statements(node.statements)
+            self.vm_writer.write_goto(label_end)
+            self.vm_writer.write_label(label_false)
+            self.generate_statements(node.else_statements)
+        self.vm_writer.write_label(label_end)
+
+    def generate_branch(self, node: Node, label: str, when: bool) -> None:
+        """
+        Jumps to label if the condition is true (when is True) or false, and falls through otherwise.
+        As in an if statement, any nonzero value is true.
+        """
+        node_type = type(node)
+        if node_type is Constant:
+            if (node.value != 0) == when:
+                self.vm_writer.write_goto(label)
+            return
+        if node_type is UnaryOp and node.op == '~' and is_boolean(node.operand):
+            self.generate_branch(node.operand, label, not when)
+            return
+        if node_type is BinaryOp:
+            if node.op in ("&amp;", '|') and is_boolean(node) and not self.may_call(node.right):
+                if (node.op == '|') == when:
+                    # a | b is true as soon as a is, a & b false as soon as a is.
+                    self.generate_branch(node.left, label, when)
+                    self.generate_branch(node.right, label, when)
+                else:
+                    self.label_skip_counter += 1
+                    label_skip = "Skip" + str(self.label_skip_counter)
+                    self.generate_branch(node.left, label_skip, not when)
+                    self.generate_branch(node.right, label, when)
+                    self.vm_writer.write_label(label_skip)
+                    self.that_base = None
+                return
+            if not when and self.generate_negation(node):
+                self.vm_writer.write_if(label)
+                return
+        self.generate_expression(node)
+        if when:
+            self.vm_writer.write_if(label)
+        elif is_boolean(node):
+            self.vm_writer.write_arithmetic("not")
+            self.vm_writer.write_if(label)
+        else:
+            # not only turns -1 into 0, so it cannot negate any other nonzero value.
+            self.label_skip_counter += 1
+            label_skip = "Skip" + str(self.label_skip_counter)
+            self.vm_writer.write_if(label_skip)
+            self.vm_writer.write_goto(label)
+            self.vm_writer.write_label(label_skip)
+
+    def generate_negation(self, node: BinaryOp) -> bool:
+        """
+        Pushes a value that is nonzero exactly when the comparison node is false, if that takes no not:
+        x = 0 is false when x is nonzero, and a < or > with a constant operand has an exact inverse.
+        Returns whether anything was pushed.
+        """
+        left, right = node.left, node.right
+        if node.op == '=':
+            if type(right) is Constant and right.value == 0:
+                self.generate_expression(left)
+                return True
+            if type(left) is Constant and left.value == 0:
+                self.generate_expression(right)
+                return True
+            return False
+        if node.op not in INVERSE_COMPARISON:
+            return False
+        inverse, step = INVERSE_COMPARISON[node.op]
+        if type(right) is Constant and -32768 <= right.value + step <= 32767:
+            self.generate_expression(left)
+            self.vm_writer.write_constant(right.value + step)
+        elif type(left) is Constant and -32768 <= left.value - step <= 32767:
+            self.vm_writer.write_constant(left.value - step)
+            self.generate_expression(right)
+        else:
+            return False
+        self.vm_writer.write_arithmetic(OP_VM[inverse])
+        return True
+
+    def generate_if(self, node: If) -> None:
+        if self.direct_branches:
+            self.generate_direct_if(node)
+            return
+        self.generate_expression(node.condition)
+        self.label_if_counter += 1
+        label_true = 'TrueIf' + str(self.label_if_counter)
+        label_false = 'FalseIf' + str(self.label_if_counter)
+        label_end = 'EndIf' + str(self.label_if_counter)
+        self.vm_writer.write_if(label_true)
+        self.vm_writer.write_goto(label_false)
+        self.vm_writer.write_label(label_true)
+        self.generate_statements(node.statements)
+        self.vm_writer.write_goto(label_end)
+        self.vm_writer.write_label(label_false)
+        if node.else_statements is not None:
+            self.generate_statements(node.else_statements)
+        self.vm_writer.write_label(label_end)
+
+    def generate_expression(self, node: Node) -> None:
+        self.expression_generators[type(node)](node)
+
+    def generate_constant(self, node: Constant) -> None:
+        self.vm_writer.write_constant(node.value)
+
+    def generate_variable(self, node: Variable) -> None:
+        self.push_identifier(node.name)
+
+    def generate_array_access(self, node: ArrayAccess) -> None:
+        if self.fast_arrays and is_offset(node.index):
+            self.point_that_at(node.name)
+            self.vm_writer.write_push("that", node.index.value)
+            return
+        self.generate_expression(node.index)
+        self.push_identifier(node.name)
+        self.vm_writer.write_arithmetic("add")
+        self.vm_writer.write_pop("pointer", 1)
+        self.vm_writer.write_push("that", 0)
+        self.that_base = None
+
+    def generate_unary(self, node: UnaryOp) -> None:
+        self.generate_expression(node.operand)
+        self.vm_writer.write_arithmetic(UNARY_OP[node.op])
+
+    def generate_this(self, node: This) -> None:
+        self.vm_writer.write_push("pointer", 0)
+
+    def generate_binary(self, node: BinaryOp) -> None:
+        if self.strength_reduction:
+            if isinstance(node.right, Constant):
+                code = reduce_strength(node.op, node.right.value)
+                if code is not None:
+                    self.generate_expression(node.left)
+                    self.vm_writer.instructions += code
+                    return
+            elif isinstance(node.left, Constant) and node.op == "*":
+                # Multiplication commutes and a constant has no side effects, so it can be moved to the right.
+                code = reduce_strength(node.op, node.left.value)
+                if code is not None:
+                    self.generate_expression(node.right)
+                    self.vm_writer.instructions += code
+                    return
+        self.generate_expression(node.left)
+        self.generate_expression(node.right)
+        self.write_operation(node.op)
+
+    def write_operation(self, op: str) -> None:
+        match op:
+            case "*":
+                self.vm_writer.write_call("Math.multiply", 2)
+                self.that_base = None
+            case "/":
+                self.vm_writer.write_call("Math.divide", 2)
+                self.that_base = None
+            case _:
+                self.vm_writer.write_arithmetic(OP_VM[op])
+
+    def generate_string(self, node: StringConstant) -> None:
+        string = node.value
+        if self.pool_strings:
+            slot = self.string_pool.get(string)
+            if slot is None:
+                # Pool slots come after the declared statics, which all precede the subroutines.
+                slot = self.symbol_table.var_count("STATIC") + len(self.string_pool)
+                self.string_pool[string] = slot
+            # push static slot; if-goto L; (build the string); pop static slot; label L; push static slot
+            self.label_string_counter += 1
+            label = "StringPool" + str(self.label_string_counter)
+            self.vm_writer.write_push("static", slot)
+            self.vm_writer.write_if(label)
+            self.write_string(string)
+            self.vm_writer.write_pop("static", slot)
+            self.vm_writer.write_label(label)
+            self.vm_writer.write_push("static", slot)
+        else:
+            self.write_string(string)
+
+    def write_string(self, string: str) -> None:
+        self.vm_writer.write_push("constant", len(string))
+        self.vm_writer.write_call("String.new", 1)
+        for char in string:
+            self.vm_writer.write_push("constant", ord(char))
+            self.vm_writer.write_call("String.appendChar", 2)
+        self.that_base = None
+
+    def push_identifier(self, identifier: str) -> None:
+        symbol = self.symbol_table.resolve(identifier)
+        self.vm_writer.write_push(symbol.segment, symbol.index)
+
+    def generate_call(self, node: Call) -> None:
+        num_args = len(node.arguments)
+        if node.receiver is None:
+            class_name = self.class_name
+            # Without an index every unqualified call is taken to be a method call on this.
+            signature = None if self.class_index is None else self.class_index.lookup(class_name, node.name)
+            as_method = signature is None or signature[0] == "METHOD"
+            if as_method:
+                num_args += 1
+                self.vm_writer.write_push("pointer", 0)
+        else:
+            symbol = self.symbol_table.lookup(node.receiver)
+            as_method = symbol is not None
+            if symbol is None:
+                class_name = node.receiver
+            else:
+                class_name = symbol.type
+                self.vm_writer.write_push(symbol.segment, symbol.index)
+                num_args += 1
+        if self.class_index is not None:
+            problem = self.class_index.check_call(class_name, node.name, as_method, len(node.arguments))
+            if problem is not None:
+                self.warnings.append(f"{self.subroutine_name}: {problem}")
+        for argument in node.arguments:
+            self.generate_expression(argument)
+        self.vm_writer.write_call(class_name + "." + node.name, num_args)
+        self.that_base = None
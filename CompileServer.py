@@ -0,0 +1,223 @@
+import json
+import os
+import select
+import socket
+import stat
+import sys
+import time
+import typing
+
+from ClassIndex import ClassIndex
+from JackCompiler import CompileResult, compile_path, print_summary
+
+# Seconds a client connection may take to send its request before the server drops it.
+REQUEST_TIMEOUT = 5.0
+
+
+def request(socket_path: str, message: dict) -> dict:
+    """Sends one request to a running CompileServer and returns its reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(json.dumps(message).encode() + b"\n")
+        with connection.makefile('rb') as reply:
+            return json.loads(reply.readline())
+
+
+def is_socket(path: str) -> bool:
+    """Checks if path is a Unix socket, without following a symbolic link."""
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+class CompileServer:
+    """
+    Keeps the compiler loaded and watches a directory of .jack files. The directory is polled for files whose
+    mtime or size changed, and only those are recompiled, together with the files that name a class whose
+    declarations changed when calls are resolved. Optionally it also answers requests on a Unix
+    socket, one JSON object per line and connection:
+        {"command": "compile", "path": "Main.jack"}   compiles a file now, changed or not
+        {"command": "compile"}                        compiles the files that changed since the last poll
+        {"command": "shutdown"}                       stops the server
+    Every reply is a JSON object with "ok" and, for compile requests, the per-file "results". A failed request
+    gets "ok": false and an "error" message. The path of a compile request must name a .jack file inside the
+    watched directory.
+    If bytecode is set, every class is also written as a .vmb file. If resolve_calls is set, calls are resolved
+    against the declarations of every class in the directory, as JackCompiler --resolve-calls does.
+    """
+
+    def __init__(self, directory: str, options: dict = None, bytecode: bool = False,
+                 resolve_calls: bool = False) -> None:
+        self.directory = directory
+        self.options = dict(options or {})
+        self.bytecode = bytecode
+        # .jack path -> (mtime_ns, size) when it was last compiled.
+        self.stamps = {}
+        # The declarations of the directory, kept up to date one file at a time as files change.
+        self.class_index = None
+        if resolve_calls:
+            self.class_index = self.options["class_index"] = ClassIndex()
+        # Classes whose declarations changed since the last compile, by files that were removed.
+        self.changed_classes = set()
+        self.running = False
+
+    def changed_files(self) -> typing.List[str]:
+        """
+        Returns the .jack files that are new or modified since they were last compiled. Files that were removed
+        are dropped from the class index.
+        """
+        changed = []
+        present = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".jack") or not entry.is_file():
+                    continue
+                present.add(entry.path)
+                file_stat = entry.stat()
+                if self.stamps.get(entry.path) != (file_stat.st_mtime_ns, file_stat.st_size):
+                    changed.append(entry.path)
+        for path in set(self.stamps) - present:
+            del self.stamps[path]
+            if self.class_index is not None:
+                self.changed_classes.add(self.class_index.file_classes.get(path))
+                self.class_index.remove_file(path)
+        return sorted(changed)
+
+    def reindex(self, input_path: str) -> typing.Set[str]:
+        """Indexes a file again. Returns the classes whose declarations changed: none, or the old and new class."""
+        old_class = self.class_index.file_classes.get(input_path)
+        old_subroutines = self.class_index.classes.get(old_class)
+        self.class_index.add_file(input_path)
+        new_class = self.class_index.file_classes[input_path]
+        if new_class == old_class and self.class_index.classes.get(new_class) == old_subroutines:
+            return set()
+        return {old_class, new_class}
+
+    def compile(self, paths: typing.List[str]) -> typing.List[CompileResult]:
+        """
+        Compiles the given .jack files in this process and records their stamps. Only these files are
+        re-indexed, all of them before any is compiled, since their declarations may have changed. When
+        calls are resolved, the other files that name a class whose declarations changed are compiled again
+        as well, so their calls are checked against the new declarations.
+        """
+        results = []
+        stats = {}
+        changed_classes, self.changed_classes = self.changed_classes, set()
+        for input_path in paths:
+            try:
+                file_stat = os.stat(input_path)
+                if self.class_index is not None:
+                    changed_classes |= self.reindex(input_path)
+                stats[input_path] = file_stat
+            except OSError as error:
+                results.append(CompileResult(input_path, 0.0, f"{type(error).__name__}: {error}", {}))
+        changed_classes.discard(None)
+        dependents = []
+        if changed_classes:
+            dependents = [path for path in self.class_index.files_naming(changed_classes)
+                          if path not in stats and path in self.stamps]
+        for input_path in list(stats) + dependents:
+            results.append(compile_path(input_path, os.path.splitext(input_path)[0] + ".vm", self.options,
+                                        bytecode=self.bytecode))
+            if input_path in stats:
+                file_stat = stats[input_path]
+                self.stamps[input_path] = (file_stat.st_mtime_ns, file_stat.st_size)
+        return results
+
+    def poll(self) -> typing.List[CompileResult]:
+        """Recompiles the files that changed and prints a summary if there were any."""
+        start = time.perf_counter()
+        results = self.compile(self.changed_files())
+        if results:
+            print_summary(results, time.perf_counter() - start)
+            sys.stdout.flush()
+        return results
+
+    def request_path(self, path: typing.Any) -> typing.Optional[str]:
+        """Returns the path of the .jack file that a request names, or None unless it is one inside the directory."""
+        if not isinstance(path, str) or not path.endswith(".jack"):
+            return None
+        input_path = os.path.join(self.directory, os.path.normpath(path))
+        directory = os.path.realpath(self.directory)
+        if os.path.commonpath([directory, os.path.realpath(input_path)]) != directory:
+            return None
+        return input_path
+
+    def handle(self, message: typing.Any) -> dict:
+        """Executes a request and returns the reply."""
+        if not isinstance(message, dict):
+            return {"ok": False, "error": "bad request: expected a JSON object"}
+        match message.get("command"):
+            case "compile":
+                if "path" in message:
+                    input_path = self.request_path(message["path"])
+                    if input_path is None:
+                        return {"ok": False, "error": f"bad request: {message['path']!r} is not a .jack file "
+                                                      f"in {self.directory}"}
+                    results = self.compile([input_path])
+                else:
+                    results = self.compile(self.changed_files())
+                return {"ok": all(result.error is None for result in results),
+                        "results": [{"path": result.input_path, "elapsed": result.elapsed, "error": result.error}
+                                    for result in results]}
+            case "shutdown":
+                self.running = False
+                return {"ok": True}
+        return {"ok": False, "error": f"unknown command {message.get('command')!r}"}
+
+    def serve_connection(self, connection: socket.socket) -> None:
+        """
+        Reads one request from a client connection and writes the reply. A request that fails is answered with
+        an error reply, and a client that sends nothing within REQUEST_TIMEOUT is dropped, so neither can stop
+        the server.
+        """
+        connection.settimeout(REQUEST_TIMEOUT)
+        try:
+            with connection, connection.makefile('rwb') as stream:
+                line = stream.readline()
+                try:
+                    reply = self.handle(json.loads(line))
+                except ValueError as error:
+                    reply = {"ok": False, "error": f"bad request: {error}"}
+                except Exception as error:
+                    reply = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+                stream.write(json.dumps(reply).encode() + b"\n")
+        except OSError:
+            # The client timed out or went away; there is no one left to reply to.
+            pass
+
+    def serve(self, socket_path: str = None, poll_interval: float = 0.5) -> None:
+        """
+        Compiles the whole directory, then polls it every poll_interval seconds until a shutdown request
+        arrives. Socket requests are answered between polls, as soon as they arrive.
+        A socket left at socket_path by an earlier server is replaced; any other file there raises
+        FileExistsError, so a mistyped path cannot delete a source file.
+        """
+        listener = None
+        if socket_path is not None:
+            if is_socket(socket_path):
+                os.unlink(socket_path)
+            elif os.path.lexists(socket_path):
+                raise FileExistsError(f"{socket_path} exists and is not a socket")
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(socket_path)
+            listener.listen()
+        self.running = True
+        try:
+            while self.running:
+                self.poll()
+                if listener is None:
+                    time.sleep(poll_interval)
+                    continue
+                deadline = time.monotonic() + poll_interval
+                while self.running:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0 or not select.select([listener], [], [], timeout)[0]:
+                        break
+                    self.serve_connection(listener.accept()[0])
+        finally:
+            if listener is not None:
+                listener.close()
+                if is_socket(socket_path):
+                    os.unlink(socket_path)
@@ -0,0 +1,160 @@
+import typing
+
+from JackAST import Node, Constant, ArrayAccess, Call, UnaryOp, BinaryOp, Let, If, While, Do, Return, Class
+from VMWriter import PUSH, POP, ARITHMETIC, push_word, to_word
+
+# Largest number of set bits a constant multiplier may have to be expanded into a shift/add chain.
+MAX_ADD_CHAIN_BITS = 3
+
+# temp 1 holds the operand that a shift/add chain reads more than once. Nothing else uses temp 1,
+# and the value is never live across another expression.
+SCRATCH = (POP, "temp", 1), (PUSH, "temp", 1)
+
+
+def fold_binary(op: str, x: int, y: int) -> typing.Optional[int]:
+    """
+    Returns the 16-bit value of x op y, or None if it cannot be computed at compile time.
+    op is a symbol as returned by JackTokenizer.symbol(). Division truncates towards zero, as Math.divide does.
+    """
+    match op:
+        case "+":
+            return to_word(x + y)
+        case "-":
+            return to_word(x - y)
+        case "*":
+            return to_word(x * y)
+        case "/":
+            if y == 0:
+                return None
+            quotient = abs(x) // abs(y)
+            return to_word(quotient if (x < 0) == (y < 0) else -quotient)
+        case "&amp;":
+            return x & y
+        case "|":
+            return x | y
+        case "&lt;":
+            return -1 if x < y else 0
+        case "&gt;":
+            return -1 if x > y else 0
+        case "=":
+            return -1 if x == y else 0
+    return None
+
+
+def fold_unary(op: str, x: int) -> int:
+    """Returns the 16-bit value of the unary op applied to x. shiftright is an arithmetic shift."""
+    match op:
+        case "-":
+            return to_word(-x)
+        case "~":
+            return ~x
+        case "^":
+            return to_word(x << 1)
+    return x >> 1
+
+
+def multiply_by(constant: int) -> typing.Optional[list]:
+    """
+    Returns instructions that multiply the value on top of the stack by a constant using shifts and adds,
+    or None if Math.multiply is cheaper.
+    """
+    magnitude = abs(constant)
+    if magnitude == 0 or bin(magnitude).count("1") > MAX_ADD_CHAIN_BITS:
+        return None
+    bits = bin(magnitude)[3:]
+    if "1" not in bits:
+        code = [(ARITHMETIC, "shiftleft", 0)] * len(bits)
+    else:
+        # Horner's rule over the bits below the leading one: shift, then add the operand back for a 1.
+        code = [SCRATCH[0], SCRATCH[1]]
+        for bit in bits:
+            code.append((ARITHMETIC, "shiftleft", 0))
+            if bit == "1":
+                code += [SCRATCH[1], (ARITHMETIC, "add", 0)]
+    if constant < 0:
+        code.append((ARITHMETIC, "neg", 0))
+    return code
+
+
+def divide_by(constant: int) -> typing.Optional[list]:
+    """
+    Returns instructions that divide the value on top of the stack by a constant power of two, rounding
+    towards zero like Math.divide, or None if the constant is not a power of two.
+    """
+    magnitude = abs(constant)
+    if magnitude == 0 or magnitude & (magnitude - 1):
+        return None
+    shift = magnitude.bit_length() - 1
+    code = []
+    if shift:
+        # A negative dividend is biased by 2^shift - 1 so that the arithmetic shift rounds towards zero.
+        code += [SCRATCH[0], SCRATCH[1], SCRATCH[1], (PUSH, "constant", 0), (ARITHMETIC, "lt", 0)]
+        code += push_word(magnitude - 1)
+        code += [(ARITHMETIC, "and", 0), (ARITHMETIC, "add", 0)]
+        code += [(ARITHMETIC, "shiftright", 0)] * shift
+    if constant < 0:
+        code.append((ARITHMETIC, "neg", 0))
+    return code
+
+
+def reduce_strength(op: str, constant: int) -> typing.Optional[list]:
+    """
+    Returns cheaper instructions that apply op with a constant right operand to the value on top of the stack,
+    or None if the generic operation should be used.
+    """
+    if op == "*":
+        return multiply_by(constant)
+    if op == "/":
+        return divide_by(constant)
+    return None
+
+
+def fold_expression(node: Node) -> Node:
+    """Returns the expression with every operation on constant operands replaced by its value."""
+    match node:
+        case BinaryOp():
+            node.left = fold_expression(node.left)
+            node.right = fold_expression(node.right)
+            if isinstance(node.left, Constant) and isinstance(node.right, Constant):
+                value = fold_binary(node.op, node.left.value, node.right.value)
+                if value is not None:
+                    return Constant(value)
+        case UnaryOp():
+            node.operand = fold_expression(node.operand)
+            if isinstance(node.operand, Constant):
+                return Constant(fold_unary(node.op, node.operand.value))
+        case ArrayAccess():
+            node.index = fold_expression(node.index)
+        case Call():
+            node.arguments = [fold_expression(argument) for argument in node.arguments]
+    return node
+
+
+def fold_statements(statements: list) -> None:
+    """Folds the expressions of statements in place."""
+    for statement in statements:
+        match statement:
+            case Let():
+                if statement.index is not None:
+                    statement.index = fold_expression(statement.index)
+                statement.value = fold_expression(statement.value)
+            case If():
+                statement.condition = fold_expression(statement.condition)
+                fold_statements(statement.statements)
+                if statement.else_statements is not None:
+                    fold_statements(statement.else_statements)
+            case While():
+                statement.condition = fold_expression(statement.condition)
+                fold_statements(statement.statements)
+            case Do():
+                statement.call = fold_expression(statement.call)
+            case Return():
+                if statement.value is not None:
+                    statement.value = fold_expression(statement.value)
+
+
+def fold_constants(node: Class) -> Class:
+    """The constant folding pass: folds the constant subexpressions of every subroutine of a class."""
+    for subroutine in node.subroutines:
+        fold_statements(subroutine.statements)
+    return node
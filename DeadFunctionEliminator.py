@@ -0,0 +1,72 @@
+import typing
+
+from VMWriter import CALL, FUNCTION, RAW
+
+# Functions the program is started from: Main.main, and the OS bootstrap, which calls the init functions.
+ENTRY_POINTS = ("Main.main", "Sys.init", "Memory.init", "Math.init", "Screen.init", "Output.init", "Keyboard.init")
+
+
+def split_functions(instructions: typing.List[tuple]) -> typing.List[typing.Tuple[str, int, int]]:
+    """Returns (function name, start, end) for every function in a class's instruction list."""
+    starts = [(position, instruction[1]) for position, instruction in enumerate(instructions)
+              if instruction[0] == FUNCTION]
+    bounds = []
+    for index, (start, name) in enumerate(starts):
+        end = starts[index + 1][0] if index + 1 < len(starts) else len(instructions)
+        bounds.append((name, start, end))
+    return bounds
+
+
+class DeadFunctionEliminator:
+    """
+    Removes the functions a whole program never calls. The call graph is built from the call instructions
+    of every class and walked from the entry points; every function it does not reach is dropped.
+    Each removed function is recorded in removed with the reason, and its size in removed_sizes.
+    """
+
+    def __init__(self, roots: typing.Iterable[str] = ENTRY_POINTS) -> None:
+        self.roots = tuple(roots)
+        self.removed = {}
+        self.removed_sizes = {}
+
+    def eliminate(self, programs: typing.Dict[str, typing.List[tuple]]) -> typing.Dict[str, typing.List[tuple]]:
+        """
+        Takes the instruction lists of all classes of a program, keyed by class, and returns them without the
+        unreachable functions. If the program defines none of the entry points nothing is removed.
+        """
+        bounds = {key: split_functions(instructions) for key, instructions in programs.items()}
+        callees = {}
+        for key, instructions in programs.items():
+            for name, start, end in bounds[key]:
+                callees[name] = {instruction[1] for instruction in instructions[start:end]
+                                 if instruction[0] == CALL}
+        reachable = set()
+        pending = [root for root in self.roots if root in callees]
+        if not pending:
+            return programs
+        while pending:
+            name = pending.pop()
+            if name in reachable:
+                continue
+            reachable.add(name)
+            pending.extend(callee for callee in callees[name] if callee in callees and callee not in reachable)
+
+        callers = {}
+        for name, called in callees.items():
+            for callee in called:
+                callers.setdefault(callee, []).append(name)
+        result = {}
+        for key, instructions in programs.items():
+            kept = []
+            for name, start, end in bounds[key]:
+                if name in reachable:
+                    kept += instructions[start:end]
+                    continue
+                dead_callers = sorted(callers.get(name, []))
+                if dead_callers:
+                    self.removed[name] = "only called from unreachable " + ", ".join(dead_callers)
+                else:
+                    self.removed[name] = "never called"
+                self.removed_sizes[name] = sum(instruction[0] != RAW for instruction in instructions[start:end])
+            result[key] = kept
+        return result
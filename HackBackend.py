@@ -0,0 +1,402 @@
+import typing
+
+from VMWriter import PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN, RAW
+
+# Hack RAM addresses of the VM registers and fixed segments.
+SEGMENT_POINTERS = {"local": "LCL", "argument": "ARG", "this": "THIS", "that": "THAT"}
+FIXED_BASES = {"temp": 5, "pointer": 3}
+
+# Pops y into D and leaves A at x, which becomes the result.
+BINARY_ASM = {"add": "M=D+M", "sub": "M=M-D", "and": "M=D&M", "or": "M=D|M"}
+UNARY_ASM = {"neg": "M=-M", "not": "M=!M"}
+# Operations that jump to a shared stub with the return address in D.
+STUB_OPERATIONS = {"eq": "$EQ", "lt": "$LT", "gt": "$GT", "shiftright": "$SHIFTRIGHT"}
+
+# The shared routines. $CALL expects the return address in D, the callee in R13 and the argument count in
+# R14. The operation stubs expect the return address in D and their operands on the stack. Comparisons are
+# exact for all 16-bit values: when the signs differ x - y may overflow, so the sign of x decides.
+# $SHIFTRIGHT copies bits 15..1 of x one at a time, keeping the destination bit in the free word above
+# the stack, so that no segment register is touched.
+STUBS = """($CALL)
+@SP
+A=M
+M=D
+@LCL
+D=M
+@SP
+AM=M+1
+M=D
+@ARG
+D=M
+@SP
+AM=M+1
+M=D
+@THIS
+D=M
+@SP
+AM=M+1
+M=D
+@THAT
+D=M
+@SP
+AM=M+1
+M=D
+@SP
+MD=M+1
+@LCL
+M=D
+@R14
+D=D-M
+@5
+D=D-A
+@ARG
+M=D
+@R13
+A=M
+0;JMP
+($RETURN)
+@LCL
+D=M
+@R13
+M=D
+@5
+A=D-A
+D=M
+@R14
+M=D
+@SP
+AM=M-1
+D=M
+@ARG
+A=M
+M=D
+D=A+1
+@SP
+M=D
+@R13
+AM=M-1
+D=M
+@THAT
+M=D
+@R13
+AM=M-1
+D=M
+@THIS
+M=D
+@R13
+AM=M-1
+D=M
+@ARG
+M=D
+@R13
+AM=M-1
+D=M
+@LCL
+M=D
+@R14
+A=M
+0;JMP
+($EQ)
+@R15
+M=D
+@SP
+AM=M-1
+D=M
+A=A-1
+D=M-D
+@$TRUE
+D;JEQ
+@$FALSE
+0;JMP
+($LT)
+@R15
+M=D
+@SP
+AM=M-1
+D=M
+@R13
+M=D
+@SP
+A=M-1
+D=M
+@$LT.NEGATIVE
+D;JLT
+@R13
+D=M
+@$FALSE
+D;JLT
+@$LT.SAME
+0;JMP
+($LT.NEGATIVE)
+@R13
+D=M
+@$TRUE
+D;JGE
+($LT.SAME)
+@R13
+D=M
+@SP
+A=M-1
+D=M-D
+@$TRUE
+D;JLT
+@$FALSE
+0;JMP
+($GT)
+@R15
+M=D
+@SP
+AM=M-1
+D=M
+@R13
+M=D
+@SP
+A=M-1
+D=M
+@$GT.NEGATIVE
+D;JLT
+@R13
+D=M
+@$TRUE
+D;JLT
+@$GT.SAME
+0;JMP
+($GT.NEGATIVE)
+@R13
+D=M
+@$FALSE
+D;JGE
+($GT.SAME)
+@R13
+D=M
+@SP
+A=M-1
+D=M-D
+@$TRUE
+D;JGT
+($FALSE)
+@SP
+A=M-1
+M=0
+@R15
+A=M
+0;JMP
+($TRUE)
+@SP
+A=M-1
+M=-1
+@R15
+A=M
+0;JMP
+($SHIFTRIGHT)
+@R15
+M=D
+@SP
+A=M-1
+D=M
+@R13
+M=D
+@SP
+A=M-1
+M=0
+@R13
+D=M
+@$SHIFTRIGHT.POSITIVE
+D;JGE
+@16384
+D=-A
+D=D-A
+@SP
+A=M-1
+M=D
+($SHIFTRIGHT.POSITIVE)
+@2
+D=A
+@R14
+M=D
+@SP
+A=M
+M=1
+($SHIFTRIGHT.LOOP)
+@R14
+D=M
+@R13
+D=D&M
+@$SHIFTRIGHT.NEXT
+D;JEQ
+@SP
+A=M
+D=M
+A=A-1
+M=D|M
+($SHIFTRIGHT.NEXT)
+@SP
+A=M
+D=M
+M=D+M
+@R14
+D=M
+MD=D+M
+@$SHIFTRIGHT.LOOP
+D;JNE
+@R15
+A=M
+0;JMP
+"""
+
+PUSH_D = "@SP\nM=M+1\nA=M-1\nM=D\n"
+POP_D = "@SP\nAM=M-1\nD=M\n"
+
+
+def parse_vm(text: str) -> typing.List[typing.Tuple[int, str, int]]:
+    """
+    Parses hand-written VM text, e.g. an OS class, into VMWriter instructions. Comments, indentation and
+    blank lines are ignored.
+    """
+    commands = {"push": PUSH, "pop": POP, "label": LABEL, "goto": GOTO, "if-goto": IF_GOTO, "call": CALL,
+                "function": FUNCTION}
+    instructions = []
+    for line in text.splitlines():
+        words = line.split("//", 1)[0].split()
+        if not words:
+            continue
+        if words[0] == "return":
+            instructions.append((RETURN, "", 0))
+        elif len(words) == 1:
+            instructions.append((ARITHMETIC, words[0], 0))
+        elif words[0] in commands:
+            instructions.append((commands[words[0]], words[1], int(words[2]) if len(words) > 2 else 0))
+        else:
+            raise ValueError(f"unknown VM command {line.strip()!r}")
+    return instructions
+
+
+class HackBackend:
+    """
+    Translates the VM instructions of a whole program into Hack assembly in one pass, without going
+    through VM text. Calls, returns, comparisons and shifts right jump to routines that are emitted once
+    for the whole program instead of being expanded at every site, which keeps the ROM image small.
+    The bootstrap sets SP to 256 and calls Sys.init, or Main.main if the program has no Sys.init.
+    """
+
+    def __init__(self) -> None:
+        self.lines = []
+        self.class_name = ""
+        self.function_name = ""
+        self.return_counter = 0
+
+    def translate(self, classes: typing.Dict[str, typing.List[tuple]]) -> str:
+        """
+        Takes the instructions of every class of a program, keyed by class name, and returns the assembly.
+        Raises ValueError if the program calls a function it does not define or uses an unknown command.
+        """
+        defined = {instruction[1] for instructions in classes.values() for instruction in instructions
+                   if instruction[0] == FUNCTION}
+        called = {instruction[1] for instructions in classes.values() for instruction in instructions
+                  if instruction[0] == CALL}
+        missing = sorted(called - defined)
+        if missing:
+            raise ValueError(f"call to undefined function(s): {', '.join(missing)}")
+        entry = "Sys.init" if "Sys.init" in defined else "Main.main"
+        if entry not in defined:
+            raise ValueError("the program has neither Sys.init nor Main.main")
+        self.lines = ["@256\nD=A\n@SP\nM=D\n"]
+        self.function_name = "$bootstrap"
+        self.write_call(entry, 0)
+        self.lines.append("($HALT)\n@$HALT\n0;JMP\n")
+        self.lines.append(STUBS)
+        for class_name, instructions in classes.items():
+            self.class_name = class_name
+            for instruction in instructions:
+                self.write_instruction(*instruction)
+        return "".join(self.lines)
+
+    def write_instruction(self, opcode: int, name: str, number: int) -> None:
+        lines = self.lines
+        if opcode == PUSH:
+            self.write_push(name, number)
+        elif opcode == POP:
+            self.write_pop(name, number)
+        elif opcode == ARITHMETIC:
+            self.write_arithmetic(name)
+        elif opcode == LABEL:
+            lines.append(f"({self.function_name}${name})\n")
+        elif opcode == GOTO:
+            lines.append(f"@{self.function_name}${name}\n0;JMP\n")
+        elif opcode == IF_GOTO:
+            lines.append(f"{POP_D}@{self.function_name}${name}\nD;JNE\n")
+        elif opcode == CALL:
+            self.write_call(name, number)
+        elif opcode == FUNCTION:
+            self.function_name = name
+            self.write_function(name, number)
+        elif opcode == RETURN:
+            lines.append("@$RETURN\n0;JMP\n")
+        elif opcode != RAW:
+            raise ValueError(f"unknown opcode {opcode}")
+
+    def write_push(self, segment: str, index: int) -> None:
+        if segment == "constant":
+            if index <= 1:
+                self.lines.append(f"@SP\nM=M+1\nA=M-1\nM={index}\n")
+                return
+            load = f"@{index}\nD=A\n"
+        elif segment in SEGMENT_POINTERS:
+            pointer = SEGMENT_POINTERS[segment]
+            if index == 0:
+                load = f"@{pointer}\nA=M\nD=M\n"
+            elif index == 1:
+                load = f"@{pointer}\nA=M+1\nD=M\n"
+            else:
+                load = f"@{index}\nD=A\n@{pointer}\nA=D+M\nD=M\n"
+        else:
+            load = f"@{self.fixed_address(segment, index)}\nD=M\n"
+        self.lines.append(load + PUSH_D)
+
+    def write_pop(self, segment: str, index: int) -> None:
+        if segment in SEGMENT_POINTERS:
+            pointer = SEGMENT_POINTERS[segment]
+            if index <= 6:
+                # Stepping A up to the address is shorter than spilling it to R13 for small indices.
+                step = "A=M+1\n" + "A=A+1\n" * (index - 1) if index else "A=M\n"
+                self.lines.append(f"{POP_D}@{pointer}\n{step}M=D\n")
+            else:
+                self.lines.append(f"@{index}\nD=A\n@{pointer}\nD=D+M\n@R13\nM=D\n{POP_D}@R13\nA=M\nM=D\n")
+        elif segment == "constant":
+            raise ValueError("cannot pop into constant")
+        else:
+            self.lines.append(f"{POP_D}@{self.fixed_address(segment, index)}\nM=D\n")
+
+    def fixed_address(self, segment: str, index: int) -> str:
+        if segment == "static":
+            return f"{self.class_name}.{index}"
+        if segment in FIXED_BASES:
+            return str(FIXED_BASES[segment] + index)
+        raise ValueError(f"unknown segment {segment!r}")
+
+    def write_arithmetic(self, command: str) -> None:
+        if command in BINARY_ASM:
+            self.lines.append(f"{POP_D}A=A-1\n{BINARY_ASM[command]}\n")
+        elif command in UNARY_ASM:
+            self.lines.append(f"@SP\nA=M-1\n{UNARY_ASM[command]}\n")
+        elif command == "shiftleft":
+            self.lines.append("@SP\nA=M-1\nD=M\nM=D+M\n")
+        elif command in STUB_OPERATIONS:
+            label = self.return_label()
+            self.lines.append(f"@{label}\nD=A\n@{STUB_OPERATIONS[command]}\n0;JMP\n({label})\n")
+        else:
+            raise ValueError(f"unknown arithmetic command {command!r}")
+
+    def write_call(self, function: str, n_args: int) -> None:
+        label = self.return_label()
+        self.lines.append(f"@{n_args}\nD=A\n@R14\nM=D\n@{function}\nD=A\n@R13\nM=D\n"
+                          f"@{label}\nD=A\n@$CALL\n0;JMP\n({label})\n")
+
+    def write_function(self, function: str, n_locals: int) -> None:
+        self.lines.append(f"({function})\n")
+        if n_locals:
+            self.lines.append("@SP\nA=M\n" + "M=0\nA=A+1\n" * n_locals + "D=A\n@SP\nM=D\n")
+
+    def return_label(self) -> str:
+        self.return_counter += 1
+        return f"{self.function_name}$ret.{self.return_counter}"
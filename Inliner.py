@@ -0,0 +1,152 @@
+import typing
+
+from DeadFunctionEliminator import split_functions
+from VMWriter import PUSH, POP, LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN, RAW
+
+# Largest callee body, in instructions without the function header, that is inlined by default.
+DEFAULT_THRESHOLD = 8
+
+# The method prologue that sets this from the first argument.
+METHOD_PROLOGUE = [(PUSH, "argument", 0), (POP, "pointer", 0)]
+
+
+class Callee:
+    """A small leaf function that can be inlined, with the facts about it the call sites need."""
+
+    __slots__ = ("name", "class_name", "n_locals", "body", "uses_static", "takes_this")
+
+    def __init__(self, name: str, n_locals: int, body: typing.List[tuple]) -> None:
+        self.name = name
+        self.class_name = name.split(".")[0]
+        self.n_locals = n_locals
+        self.body = body
+        self.uses_static = any(instruction[1] == "static" for instruction in body
+                               if instruction[0] in (PUSH, POP))
+        # A method whose first argument is only used to set this can take it straight into pointer 1.
+        self.takes_this = (body[:2] == METHOD_PROLOGUE and
+                           (PUSH, "argument", 0) not in body[2:])
+
+
+class Inliner:
+    """
+    Inlines small leaf functions at their call sites across the classes of a whole program.
+    A callee qualifies if it calls nothing and its body is at most threshold instructions long. At a call site
+    its arguments and locals move into extra locals of the caller, and its this/pointer 0 is remapped to
+    that/pointer 1, which is never live across a call. Every decision is recorded in decisions.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD) -> None:
+        self.threshold = threshold
+        self.decisions = []
+        self.site_counter = 0
+
+    def candidates(self, programs: typing.Dict[str, typing.List[tuple]]) -> typing.Dict[str, Callee]:
+        """Finds the functions that can be inlined and records why the others cannot."""
+        called = {instruction[1] for instructions in programs.values()
+                  for instruction in instructions if instruction[0] == CALL}
+        callees = {}
+        for instructions in programs.values():
+            for name, start, end in split_functions(instructions):
+                if name not in called:
+                    continue
+                body = [instruction for instruction in instructions[start + 1:end] if instruction[0] != RAW]
+                reason = self.rejection(body)
+                if reason is None:
+                    callees[name] = Callee(name, instructions[start][2], body)
+                else:
+                    self.decisions.append(f"not inlined {name}: {reason}")
+        return callees
+
+    def rejection(self, body: typing.List[tuple]) -> typing.Optional[str]:
+        """Returns why a function body cannot be inlined, or None if it can."""
+        if any(instruction[0] == CALL for instruction in body):
+            return "not a leaf (it calls other functions)"
+        if len(body) > self.threshold:
+            return f"too large ({len(body)} > {self.threshold} instructions)"
+        segments = {instruction[1] for instruction in body if instruction[0] in (PUSH, POP)}
+        uses_this = "this" in segments or (PUSH, "pointer", 0) in body or (POP, "pointer", 0) in body
+        uses_that = "that" in segments or (PUSH, "pointer", 1) in body or (POP, "pointer", 1) in body
+        if uses_this and uses_that:
+            return "uses both this and that"
+        if not body or body[-1][0] != RETURN:
+            return "does not end with a return"
+        return None
+
+    def inline(self, programs: typing.Dict[str, typing.List[tuple]]) -> typing.Dict[str, typing.List[tuple]]:
+        """Returns the instruction lists of all classes, keyed like programs, with the call sites inlined."""
+        callees = self.candidates(programs)
+        sites = {}
+        result = {}
+        for key, instructions in programs.items():
+            code = []
+            for name, start, end in split_functions(instructions):
+                code += self.inline_function(name, instructions[start:end], callees, sites)
+            result[key] = code
+        for name in sorted(callees):
+            if name in sites:
+                callers = ", ".join(f"{caller} x{count}" for caller, count in sorted(sites[name].items()))
+                self.decisions.append(f"inlined {name} into {callers}")
+        return result
+
+    def inline_function(self, name: str, code: typing.List[tuple], callees: typing.Dict[str, Callee],
+                        sites: dict) -> typing.List[tuple]:
+        """Inlines the call sites of one function and grows its local count to hold the callees' variables."""
+        _, _, n_locals = code[0]
+        class_name = name.split(".")[0]
+        extra_locals = 0
+        result = [code[0]]
+        for instruction in code[1:]:
+            callee = callees.get(instruction[1]) if instruction[0] == CALL else None
+            if callee is None or callee.name == name:
+                result.append(instruction)
+                continue
+            if callee.uses_static and callee.class_name != class_name:
+                self.decisions.append(f"not inlined {callee.name} into {name}: its statics belong to another class")
+                result.append(instruction)
+                continue
+            result += self.expand(callee, instruction[2], n_locals)
+            extra_locals = max(extra_locals, instruction[2] + callee.n_locals)
+            callers = sites.setdefault(callee.name, {})
+            callers[name] = callers.get(name, 0) + 1
+        if extra_locals:
+            result[0] = (FUNCTION, name, n_locals + extra_locals)
+        return result
+
+    def expand(self, callee: Callee, n_args: int, first_local: int) -> typing.List[tuple]:
+        """Returns the callee's body rewritten to run inline, with its arguments taken from the stack."""
+        self.site_counter += 1
+        suffix = f"$inline{self.site_counter}"
+        end_label = callee.name + suffix
+        body = callee.body
+        code = []
+        # Arguments are on the stack with the last one on top.
+        for index in range(n_args - 1, -1, -1):
+            if index == 0 and callee.takes_this:
+                code.append((POP, "pointer", 1))
+                body = body[2:]
+            else:
+                code.append((POP, "local", first_local + index))
+        for index in range(callee.n_locals):
+            code += [(PUSH, "constant", 0), (POP, "local", first_local + n_args + index)]
+        returns = sum(instruction[0] == RETURN for instruction in body)
+        for opcode, segment, index in body:
+            if opcode in (PUSH, POP):
+                if segment == "argument":
+                    segment, index = "local", first_local + index
+                elif segment == "local":
+                    index = first_local + n_args + index
+                elif segment == "this":
+                    segment = "that"
+                elif segment == "pointer":
+                    index = 1
+                code.append((opcode, segment, index))
+            elif opcode in (LABEL, GOTO, IF_GOTO):
+                code.append((opcode, segment + suffix, 0))
+            elif opcode == RETURN:
+                if returns > 1:
+                    code.append((GOTO, end_label, 0))
+            else:
+                code.append((opcode, segment, index))
+        if returns > 1:
+            code[-1] = (LABEL, end_label, 0)
+        return code
@@ -0,0 +1,197 @@
+import typing
+
+# Nodes of the abstract syntax tree that JackParser builds for a class. Every node uses __slots__,
+# since a large class has hundreds of thousands of them. Binary operators are kept in the form
+# JackTokenizer.symbol() returns them, e.g. "&lt;", so they can be looked up in the same tables.
+
+
+class Node:
+    """Base class of all nodes. Two nodes are equal if they have the same type and fields."""
+
+    __slots__ = ()
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Constant(Node):
+    """An integer constant, or true (-1), false or null (0)."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: int) -> None:
+        self.value = value
+
+
+class StringConstant(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+
+class This(Node):
+    __slots__ = ()
+
+
+class Variable(Node):
+    __slots__ = ("name",)
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class ArrayAccess(Node):
+    """name[index]."""
+
+    __slots__ = ("name", "index")
+
+    def __init__(self, name: str, index: Node) -> None:
+        self.name = name
+        self.index = index
+
+
+class Call(Node):
+    """
+    A subroutine call. receiver is None for a method of the current class, f(...), otherwise it is the
+    class or variable name before the dot; the parser cannot tell which, since that depends on the symbols.
+    """
+
+    __slots__ = ("receiver", "name", "arguments")
+
+    def __init__(self, receiver: typing.Optional[str], name: str, arguments: typing.List[Node]) -> None:
+        self.receiver = receiver
+        self.name = name
+        self.arguments = arguments
+
+
+class UnaryOp(Node):
+    __slots__ = ("op", "operand")
+
+    def __init__(self, op: str, operand: Node) -> None:
+        self.op = op
+        self.operand = operand
+
+
+class BinaryOp(Node):
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op: str, left: Node, right: Node) -> None:
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class Statement(Node):
+    """
+    Base class of the statements. comment is the text of the statement's first two tokens, which the
+    generated code carries as a comment line. token_index is the position of the first token in the
+    tokenizer, or -1 for a statement that a pass made up.
+    """
+
+    __slots__ = ("comment", "token_index")
+
+
+class Let(Statement):
+    """let name = value, or let name[index] = value if index is not None."""
+
+    __slots__ = ("name", "index", "value")
+
+    def __init__(self, comment: str, name: str, index: typing.Optional[Node], value: Node,
+                 token_index: int = -1) -> None:
+        self.comment = comment
+        self.token_index = token_index
+        self.name = name
+        self.index = index
+        self.value = value
+
+
+class If(Statement):
+    """else_statements is None if there is no else clause."""
+
+    __slots__ = ("condition", "statements", "else_statements")
+
+    def __init__(self, comment: str, condition: Node, statements: typing.List[Statement],
+                 else_statements: typing.Optional[typing.List[Statement]], token_index: int = -1) -> None:
+        self.comment = comment
+        self.token_index = token_index
+        self.condition = condition
+        self.statements = statements
+        self.else_statements = else_statements
+
+
+class While(Statement):
+    __slots__ = ("condition", "statements")
+
+    def __init__(self, comment: str, condition: Node, statements: typing.List[Statement],
+                 token_index: int = -1) -> None:
+        self.comment = comment
+        self.token_index = token_index
+        self.condition = condition
+        self.statements = statements
+
+
+class Do(Statement):
+    __slots__ = ("call",)
+
+    def __init__(self, comment: str, call: Node, token_index: int = -1) -> None:
+        self.comment = comment
+        self.token_index = token_index
+        self.call = call
+
+
+class Return(Statement):
+    """value is None for return;."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, comment: str, value: typing.Optional[Node], token_index: int = -1) -> None:
+        self.comment = comment
+        self.token_index = token_index
+        self.value = value
+
+
+class VarDec(Node):
+    """A declaration of one or more variables; kind is STATIC, FIELD or VAR."""
+
+    __slots__ = ("kind", "type", "names")
+
+    def __init__(self, kind: str, type: str, names: typing.List[str]) -> None:
+        self.kind = kind
+        self.type = type
+        self.names = names
+
+
+class Subroutine(Node):
+    """
+    A constructor, function or method; kind is CONSTRUCTOR, FUNCTION or METHOD. parameters holds
+    (type, name) pairs. token_start and token_end delimit the subroutine's tokens in the tokenizer.
+    """
+
+    __slots__ = ("kind", "return_type", "name", "parameters", "var_decs", "statements", "token_start", "token_end")
+
+    def __init__(self, kind: str, return_type: str, name: str, parameters: typing.List[typing.Tuple[str, str]],
+                 var_decs: typing.List[VarDec], statements: typing.List[Statement],
+                 token_start: int = 0, token_end: int = 0) -> None:
+        self.kind = kind
+        self.return_type = return_type
+        self.name = name
+        self.parameters = parameters
+        self.var_decs = var_decs
+        self.statements = statements
+        self.token_start = token_start
+        self.token_end = token_end
+
+
+class Class(Node):
+    __slots__ = ("name", "class_var_decs", "subroutines")
+
+    def __init__(self, name: str, class_var_decs: typing.List[VarDec], subroutines: typing.List[Subroutine]) -> None:
+        self.name = name
+        self.class_var_decs = class_var_decs
+        self.subroutines = subroutines
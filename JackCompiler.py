@@ -1,32 +1,494 @@
+import argparse
+import concurrent.futures
+import functools
+import hashlib
+import importlib
+import io
+import json
 import os
 import sys
+import time
 import typing
+import SourceMap
+from BuildCache import BuildCache, MANIFEST_NAME
+from ClassIndex import ClassIndex
 from CompilationEngine import CompilationEngine
+from DeadFunctionEliminator import DeadFunctionEliminator, ENTRY_POINTS
+from HackBackend import HackBackend, parse_vm
+from Inliner import Inliner, DEFAULT_THRESHOLD
 from JackTokenizer import JackTokenizer
+from PeepholeOptimizer import PeepholeOptimizer
 from SymbolTable import SymbolTable
+from VMBytecode import encode
 from VMWriter import VMWriter
 
-def compile_file(input_file: typing.TextIO, output_file: typing.TextIO) -> None:
-    """Compiles a single file."""
+VERSION = "1.2"
+
+# The modules whose code decides the generated code. code_version hashes their sources, so that incremental
+# builds start over after any change to them, whether or not VERSION was bumped.
+CODEGEN_MODULES = ("JackTokenizer", "JackParser", "JackAST", "SymbolTable", "ClassIndex", "PassManager",
+                   "ConstantFolder", "LoopInvariants", "CodeGenerator", "PeepholeOptimizer", "CompilationEngine",
+                   "Inliner", "DeadFunctionEliminator", "HackBackend", "VMWriter", "VMBytecode", "SourceMap")
+
+# Number of distinct (source, options) pairs whose compiled code compile_source keeps for reuse.
+SOURCE_CACHE_SIZE = 4096
+
+
+class CompileResult(typing.NamedTuple):
+    """The outcome of compiling one file. instructions is only kept for whole-program builds."""
+    input_path: str
+    elapsed: float
+    error: typing.Optional[str]
+    report: dict
+    instructions: typing.Optional[list] = None
+
+
+@functools.lru_cache(maxsize=None)
+def code_version() -> str:
+    """Returns VERSION followed by a hash of the sources of this module and of CODEGEN_MODULES."""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in [__file__] + [importlib.import_module(name).__file__ for name in CODEGEN_MODULES]:
+        with open(path, 'rb') as module_file:
+            digest.update(module_file.read())
+    return f"{VERSION}+{digest.hexdigest()}"
+
+
+def compile_file(input_file: typing.TextIO, output_file: typing.TextIO, **options) -> dict:
+    """Compiles a single file. Options are passed on to the CompilationEngine; returns its report."""
+    tokenizer = JackTokenizer(input_file)
+    engine = CompilationEngine(tokenizer, output_file, **options)
+    engine.compile_class()
+    return engine.report
+
+
+def compile_instructions(input_file: typing.TextIO, **options) -> typing.Tuple[list, dict]:
+    """Compiles a single file into its VM instruction buffer instead of text. Returns (instructions, report)."""
     tokenizer = JackTokenizer(input_file)
-    engine = CompilationEngine(tokenizer, output_file)
+    engine = CompilationEngine(tokenizer, None, **options)
     engine.compile_class()
+    return engine.vm_writer.instructions, engine.report
+
+
+@functools.lru_cache(maxsize=SOURCE_CACHE_SIZE)
+def cached_instructions(source: str, options: tuple) -> typing.Tuple[str, tuple]:
+    """Compiles a class held in memory. Returns its name and instructions; the instructions must not be modified."""
+    options = dict(options)
+    if options.get("class_index") is not None:
+        options["class_index"] = ClassIndex.from_signatures(options["class_index"])
+    tokenizer = JackTokenizer(io.StringIO(source))
+    engine = CompilationEngine(tokenizer, None, **options)
+    engine.compile_class()
+    return engine.class_name, tuple(engine.vm_writer.instructions)
+
+
+def compile_cached(source: str, options: dict) -> typing.Tuple[str, tuple]:
+    """
+    Compiles a class through the cache of cached_instructions. A class index is mutable, so it is keyed by a
+    snapshot of the signatures of the classes that the source names, which is all the compiled code depends on.
+    """
+    class_index = options.get("class_index")
+    if class_index is not None:
+        options = dict(options, class_index=class_index.signatures(source))
+    return cached_instructions(source, tuple(sorted(options.items())))
+
+
+def vm_output(instructions: tuple, as_instructions: bool) -> typing.Union[str, list]:
+    """Returns cached instructions as VM text, or as a new instruction list if as_instructions is set."""
+    if as_instructions:
+        return list(instructions)
+    writer = VMWriter(None)
+    writer.set_instructions(instructions)
+    return writer.to_text()
+
+
+def compile_source(source: str, as_instructions: bool = False, resolve_calls: bool = False,
+                   **options) -> typing.Union[str, list]:
+    """
+    Compiles the source of one class without touching the file system and returns its VM text, or its
+    (opcode, name, number) instruction list if as_instructions is set. Options are passed on to the
+    CompilationEngine. If resolve_calls is set and no class_index is given, calls are resolved against the
+    class itself and the OS classes, as --resolve-calls does for a directory holding only this class.
+    Results are cached by source and options, so classes that many programs share, such as library
+    classes, are only compiled once per process. Safe to call from several threads.
+    """
+    if resolve_calls and options.get("class_index") is None:
+        options["class_index"] = ClassIndex()
+        options["class_index"].add_source(source)
+    _, instructions = compile_cached(source, options)
+    return vm_output(instructions, as_instructions)
+
+
+def compile_class_source(item: typing.Tuple[str, str], as_instructions: bool = False, **options):
+    """Compiles one (class name, source) pair; checks that the source defines that class."""
+    class_name, source = item
+    class_found, instructions = compile_cached(source, options)
+    if class_found != class_name:
+        raise ValueError(f"the source given for {class_name} defines class {class_found}")
+    return vm_output(instructions, as_instructions)
+
+
+def compile_sources(sources: typing.Iterable[typing.Tuple[str, str]], as_instructions: bool = False,
+                    workers: int = 1, resolve_calls: bool = False,
+                    **options) -> typing.Dict[str, typing.Union[str, list]]:
+    """
+    Compiles many (class name, source) pairs in memory and returns the VM text (or instruction list) of
+    each, keyed by class name. If resolve_calls is set and no class_index is given, calls are resolved
+    against every class of the batch and the OS classes, as --resolve-calls does on the command line.
+    With workers > 1 the classes are spread over a process pool. The first class that fails to compile
+    raises its error.
+    """
+    sources = list(sources)
+    if resolve_calls and options.get("class_index") is None:
+        options["class_index"] = ClassIndex()
+        for _, source in sources:
+            options["class_index"].add_source(source)
+    worker = functools.partial(compile_class_source, as_instructions=as_instructions, **options)
+    if workers <= 1 or len(sources) <= 1:
+        outputs = map(worker, sources)
+        return {class_name: output for (class_name, _), output in zip(sources, outputs)}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(len(sources) // (workers * 4), 1)
+        outputs = pool.map(worker, sources, chunksize=chunksize)
+        return {class_name: output for (class_name, _), output in zip(sources, outputs)}
+
+
+def write_if_changed(output_path: str, text: typing.Union[str, bytes]) -> bool:
+    """Writes text to output_path unless the file already holds exactly these bytes. Returns whether it wrote."""
+    data = text if isinstance(text, bytes) else text.encode()
+    try:
+        with open(output_path, 'rb') as output_file:
+            if output_file.read() == data:
+                return False
+    except OSError:
+        pass
+    with open(output_path, 'wb') as output_file:
+        output_file.write(data)
+    return True
+
+
+def bytecode_path(output_path: str) -> str:
+    """Returns the path of the .vmb file written next to a .vm file."""
+    return os.path.splitext(output_path)[0] + ".vmb"
+
+
+def write_output(output_path: str, writer: VMWriter, bytecode: bool) -> None:
+    """Writes the buffered instructions of writer as VM text and, if bytecode is set, as a .vmb file."""
+    write_if_changed(output_path, writer.to_text())
+    if bytecode:
+        write_if_changed(bytecode_path(output_path), encode(writer.instructions))
+
+
+def compile_path(input_path: str, output_path: str, options: dict = None,
+                 whole_program: bool = False, bytecode: bool = False) -> CompileResult:
+    """
+    Compiles the .jack file at input_path into output_path. The .vm file is only rewritten when its
+    contents change, so downstream tools that look at mtimes do not rebuild needlessly.
+    If bytecode is set, the code is also written in binary form to the .vmb file next to output_path.
+    With the source_map option, the source map is written next to output_path as well.
+    For a whole-program build nothing is written; the instructions are returned in the result instead.
+    With the profile option the time spent in each phase is added to the report under "phases".
+    Runs inside a worker process, so errors are returned rather than raised.
+    """
+    options = options or {}
+    start = time.perf_counter()
+    instructions = None
+    try:
+        with open(input_path, 'r') as input_file:
+            tokenizer = JackTokenizer(input_file)
+        tokenized = time.perf_counter()
+        engine = CompilationEngine(tokenizer, None if whole_program or bytecode else io.StringIO(), **options)
+        engine.compile_class()
+        compiled = time.perf_counter()
+        report = engine.report
+        if whole_program:
+            instructions = engine.vm_writer.instructions
+        elif bytecode:
+            write_output(output_path, engine.vm_writer, bytecode)
+        else:
+            write_if_changed(output_path, engine.vm_writer.output_stream.getvalue())
+        if engine.source_mappings is not None and not whole_program:
+            write_if_changed(SourceMap.source_map_path(output_path),
+                             SourceMap.dumps(engine.source_mappings, os.path.basename(input_path)))
+        if options.get("profile"):
+            report["phases"] = {"tokenize": tokenized - start, "compile": compiled - tokenized}
+            if not whole_program:
+                report["phases"]["io"] = time.perf_counter() - compiled
+    except Exception as error:
+        return CompileResult(input_path, time.perf_counter() - start, f"{type(error).__name__}: {error}", {})
+    return CompileResult(input_path, time.perf_counter() - start, None, report, instructions)
+
+
+def compile_paths(jobs: typing.List[typing.Tuple[str, str]], workers: int, options: dict = None,
+                  whole_program: bool = False, bytecode: bool = False) -> typing.List[CompileResult]:
+    """
+    Compiles (input path, output path) pairs, spreading them over a process pool of the given size.
+    Results are returned in the order of the jobs, whichever worker finishes first.
+    """
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        return [compile_path(input_path, output_path, options, whole_program, bytecode)
+                for input_path, output_path in jobs]
+    worker = functools.partial(compile_path, options=options, whole_program=whole_program, bytecode=bytecode)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(worker, *zip(*jobs)))
+
+
+def link_program(jobs: typing.List[typing.Tuple[str, str]], results: typing.List[CompileResult],
+                 inliner: Inliner = None, eliminator: DeadFunctionEliminator = None,
+                 optimize: bool = False, bytecode: bool = False, asm_path: str = None,
+                 libraries: typing.Dict[str, list] = None) -> bool:
+    """
+    Runs the whole-program passes over the compiled classes and writes them: the inliner first, then
+    dead-function elimination, then the peephole optimizer again if optimize is set, since inlining
+    exposes new patterns. The passes are skipped if a file failed to compile, since its calls are unknown.
+    If bytecode is set, each class is also written as a .vmb file.
+    With an asm_path, the whole program, together with the classes in libraries (VM code that was not
+    compiled from Jack, e.g. the OS, keyed by path), is translated into Hack assembly in that one file
+    instead, and no .vm files are written. Nothing is written then if a file failed to compile.
+    Returns whether the passes ran.
+    """
+    programs = {input_path: result.instructions for (input_path, _), result in zip(jobs, results)
+                if result.error is None}
+    linked = len(programs) == len(jobs)
+    if asm_path is not None and linked:
+        programs.update(libraries or {})
+    if linked:
+        if inliner is not None:
+            programs = inliner.inline(programs)
+        if eliminator is not None:
+            programs = eliminator.eliminate(programs)
+        if optimize and inliner is not None:
+            # The return types are not known here, so the rules that need them stay off.
+            programs = {key: PeepholeOptimizer().optimize(instructions) for key, instructions in programs.items()}
+    if asm_path is not None:
+        if linked:
+            classes = {os.path.splitext(os.path.basename(path))[0]: instructions
+                       for path, instructions in programs.items()}
+            write_if_changed(asm_path, HackBackend().translate(classes))
+        return linked
+    for input_path, output_path in jobs:
+        if input_path in programs:
+            writer = VMWriter(None)
+            writer.set_instructions(programs[input_path])
+            write_output(output_path, writer, bytecode)
+    return linked
+
+
+def print_elimination_report(eliminator: DeadFunctionEliminator) -> None:
+    """Prints the functions a whole-program build removed and why."""
+    for name, reason in sorted(eliminator.removed.items()):
+        print(f"removed {name} ({eliminator.removed_sizes[name]} instruction(s)): {reason}")
+    total = sum(eliminator.removed_sizes.values())
+    print(f"{len(eliminator.removed)} unreachable function(s) removed, {total} instruction(s)")
+
+
+def print_summary(results: list, wall_time: float, skipped: int = 0) -> None:
+    """Prints the per-file timing summary, the optimization reports and any errors."""
+    for input_path, elapsed, error, report, _ in results:
+        status = "ok" if error is None else f"error: {error}"
+        print(f"{elapsed * 1000:9.2f} ms  {os.path.basename(input_path)}  {status}")
+        for subroutine, removed in report.get("peephole", {}).items():
+            print(f"{'':12}  peephole: {subroutine} -{removed} instruction(s)")
+        for warning in report.get("warnings", []):
+            print(f"{'':12}  warning: {warning}")
+    failed = sum(result.error is not None for result in results)
+    print(f"{len(results)} file(s) compiled, {skipped} up to date, {failed} failed, {wall_time * 1000:.2f} ms total")
+
+
+def print_profile(results: list) -> None:
+    """Prints the phase timings and the per-subroutine code statistics of every file as tables."""
+    for input_path, _, error, report, _ in results:
+        if error is not None:
+            continue
+        phases = "  ".join(f"{phase} {elapsed * 1000:.2f} ms" for phase, elapsed in report["phases"].items())
+        print(f"{os.path.basename(input_path)}: {phases}")
+        if report.get("passes"):
+            print("  passes: " + "  ".join(f"{name} {elapsed * 1000:.2f} ms" for name, elapsed in report["passes"].items()))
+        print(f"  {'subroutine':<32}{'tokens':>8}{'instructions':>14}{'multiply':>10}{'divide':>8}{'string bytes':>14}")
+        for name, stats in report.get("subroutines", {}).items():
+            print(f"  {name:<32}{stats['tokens']:>8}{stats['instructions']:>14}{stats['multiply']:>10}"
+                  f"{stats['divide']:>8}{stats['string_bytes']:>14}")
+
+
+def profile_json(results: list) -> str:
+    """Returns the phase timings and per-subroutine code statistics of every file as a JSON document."""
+    files = []
+    for input_path, elapsed, error, report, _ in results:
+        files.append({"path": input_path, "elapsed": elapsed, "error": error,
+                      "phases": report.get("phases", {}), "passes": report.get("passes", {}),
+                      "subroutines": report.get("subroutines", {})})
+    return json.dumps({"version": code_version(), "files": files}, indent=2)
+
+
+def default_jobs() -> int:
+    """Returns the number of cores available to this process."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
 
 if "__main__" == __name__:
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: JackCompiler <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
+    parser = argparse.ArgumentParser(prog="JackCompiler", description="Compiles .jack files into .vm files.")
+    parser.add_argument("path", help="a .jack file or a directory of .jack files")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help="number of worker processes (default: all available cores)")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="run the peephole optimizer over the generated code")
+    parser.add_argument("--fold-constants", action="store_true",
+                        help="fold constant subexpressions and turn multiplications and divisions by "
+                             "suitable constants into shifts and adds")
+    parser.add_argument("--pool-strings", action="store_true",
+                        help="build each distinct string literal once per class into a static slot "
+                             "(for programs that do not mutate or dispose literals)")
+    parser.add_argument("--fast-arrays", action="store_true",
+                        help="address array entries at constant indices directly, skip the temp spill of "
+                             "simple array stores and reuse pointer 1 within a statement")
+    parser.add_argument("--direct-branches", action="store_true",
+                        help="branch on if and while conditions directly, short-circuit & and | where "
+                             "that skips no side effects, and test loops at the bottom")
+    parser.add_argument("--hoist-invariants", action="store_true",
+                        help="compute the pure subexpressions that a while loop cannot change once, into extra "
+                             "locals before the loop")
+    parser.add_argument("--resolve-calls", action="store_true",
+                        help="resolve calls against the declarations of every class in the directory, so an "
+                             "unqualified call of a function does not pass this, and warn about calls that "
+                             "match no declaration")
+    parser.add_argument("--no-comments", action="store_true",
+                        help="do not start the code of each statement with a comment line")
+    parser.add_argument("--source-map", action="store_true",
+                        help="also write a source map next to each .vm file (Main.vm.map) that maps each VM "
+                             "command to the Jack line and column it was generated from")
+    parser.add_argument("--bytecode", action="store_true",
+                        help="also write each class as compact binary VM bytecode, in a .vmb file next to "
+                             "its .vm file")
+    parser.add_argument("--asm", action="store_true",
+                        help="translate the whole program, including the .vm files of the directory that have "
+                             "no .jack source (e.g. the OS), into a single Hack .asm file instead of .vm files")
+    parser.add_argument("-w", "--whole-program", action="store_true",
+                        help="compile the directory as one program and drop the functions that cannot be "
+                             "reached from Main.main or the OS entry points")
+    parser.add_argument("--keep", action="append", default=[], metavar="FUNCTION",
+                        help="an extra entry point for --whole-program, e.g. Game.callback (repeatable)")
+    parser.add_argument("--inline", action="store_true",
+                        help="inline small leaf subroutines at their call sites across the directory")
+    parser.add_argument("--inline-threshold", type=int, default=DEFAULT_THRESHOLD, metavar="N",
+                        help=f"largest subroutine body, in VM instructions, that --inline inlines "
+                             f"(default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help=f"skip files whose source, compiler version and options are unchanged since the "
+                             f"last build (manifest kept in {MANIFEST_NAME})")
+    parser.add_argument("--profile", nargs="?", const="table", choices=("table", "json"),
+                        help="report the time spent tokenizing, compiling and writing each file, and the "
+                             "tokens, VM instructions, Math.multiply/Math.divide calls and string literal "
+                             "bytes of each subroutine; json prints only the report, as JSON")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and recompile the .jack files of the directory as they change")
+    parser.add_argument("--poll-interval", type=float, default=0.5, metavar="SECONDS",
+                        help="how often --watch checks the directory for changes (default: 0.5)")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="with --watch, also accept compile requests on a Unix socket at PATH")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.watch and (args.whole_program or args.inline):
+        parser.error("--watch compiles files one at a time and cannot be combined with --whole-program or --inline")
+    if args.socket and not args.watch:
+        parser.error("--socket requires --watch")
+    if args.source_map and (args.whole_program or args.inline or args.asm):
+        parser.error("--source-map maps the code of each file as compiled and cannot be combined with "
+                     "--whole-program, --inline or --asm")
+    if args.asm and (args.watch or args.incremental or args.bytecode):
+        parser.error("--asm writes no .vm files and cannot be combined with --watch, --incremental or --bytecode")
+    argument_path = os.path.abspath(args.path)
     if os.path.isdir(argument_path):
         files_to_assemble = [
             os.path.join(argument_path, filename)
-            for filename in os.listdir(argument_path)]
+            for filename in sorted(os.listdir(argument_path))]
     else:
         files_to_assemble = [argument_path]
+    jobs = []
     for input_path in files_to_assemble:
         filename, extension = os.path.splitext(input_path)
         if extension.lower() != ".jack":
             continue
         output_path = filename + ".vm"
-        with open(input_path, 'r') as input_file, \
-                open(output_path, 'w') as output_file:
-            compile_file(input_file, output_file)
+        jobs.append((input_path, output_path))
+    # Options that change the generated code; a change invalidates the whole incremental manifest.
+    options = {"optimize": args.optimize, "fold_constants": args.fold_constants,
+               "pool_strings": args.pool_strings, "fast_arrays": args.fast_arrays,
+               "direct_branches": args.direct_branches, "hoist_invariants": args.hoist_invariants,
+               "comments": not args.no_comments, "source_map": args.source_map}
+    cache_options = dict(options, whole_program=args.whole_program, keep=sorted(args.keep),
+                         inline=args.inline and args.inline_threshold, bytecode=args.bytecode,
+                         resolve_calls=args.resolve_calls)
+    if args.profile:
+        options["profile"] = True
+    if args.watch:
+        if not os.path.isdir(argument_path):
+            parser.error("--watch needs a directory")
+        from CompileServer import CompileServer
+        try:
+            CompileServer(argument_path, options, args.bytecode, args.resolve_calls).serve(args.socket,
+                                                                                           args.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        except FileExistsError as error:
+            sys.exit(f"JackCompiler: {error}")
+        sys.exit(0)
+    # Inlining and dead-function elimination need every class of the program before anything is written.
+    link = args.whole_program or args.inline or args.asm
+    start = time.perf_counter()
+    source_directory = argument_path if os.path.isdir(argument_path) else os.path.dirname(argument_path)
+    skipped = 0
+    cache = None
+    if args.incremental:
+        cache = BuildCache(source_directory, code_version(), cache_options)
+        stale_jobs = [job for job in jobs if not cache.is_up_to_date(*job) or
+                      args.bytecode and not os.path.exists(bytecode_path(job[1])) or
+                      args.source_map and not os.path.exists(SourceMap.source_map_path(job[1]))]
+        # A whole-program build can only skip files if nothing in the program changed.
+        if not link or not stale_jobs:
+            skipped = len(jobs) - len(stale_jobs)
+            jobs = stale_jobs
+    if args.resolve_calls and jobs:
+        # Calls are resolved against the declarations of every class next to the compiled files.
+        options["class_index"] = ClassIndex.from_directory(source_directory)
+    results = compile_paths(jobs, args.jobs, options, link, args.bytecode)
+    inliner = Inliner(args.inline_threshold) if args.inline else None
+    eliminator = DeadFunctionEliminator(ENTRY_POINTS + tuple(args.keep)) if args.whole_program else None
+    asm_path = None
+    libraries = {}
+    if args.asm:
+        # Dir/Dir.asm for a directory, as the VM translator names it, and Prog.asm for Prog.jack.
+        asm_path = (os.path.join(argument_path, os.path.basename(argument_path) + ".asm")
+                    if os.path.isdir(argument_path) else os.path.splitext(argument_path)[0] + ".asm")
+        sources = {os.path.splitext(input_path)[0] for input_path, _ in jobs}
+        for path in files_to_assemble:
+            filename, extension = os.path.splitext(path)
+            if extension.lower() == ".vm" and filename not in sources:
+                with open(path, 'r') as vm_file:
+                    libraries[path] = parse_vm(vm_file.read())
+    try:
+        if link and jobs and not link_program(jobs, results, inliner, eliminator, args.optimize, args.bytecode,
+                                              asm_path, libraries):
+            inliner = eliminator = None
+    except ValueError as error:
+        print(f"error: {error}", file=sys.stderr)
+        sys.exit(1)
+    if cache is not None:
+        for (input_path, output_path), result in zip(jobs, results):
+            cache.update(input_path, output_path, result.error is None)
+        cache.save()
+    if args.profile == "json":
+        print(profile_json(results))
+    else:
+        print_summary(results, time.perf_counter() - start, skipped)
+        if inliner is not None:
+            for decision in inliner.decisions:
+                print(decision)
+        if eliminator is not None:
+            print_elimination_report(eliminator)
+        if args.profile:
+            print_profile(results)
+    if any(result.error is not None for result in results):
+        sys.exit(1)
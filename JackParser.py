@@ -0,0 +1,388 @@
+import typing
+
+import JackTokenizer
+from JackTokenizer import KEYWORD, SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER, INVALID
+from JackAST import (Node, Constant, StringConstant, This, Variable, ArrayAccess, Call, UnaryOp, BinaryOp,
+                     Statement, Let, If, While, Do, Return, VarDec, Subroutine, Class)
+
+OP = frozenset(('+', '-', '*', '/', '&', '|', '<', '>', '='))
+
+UNARY_OP = ('-', '~', '#', '^')
+
+# Tokens at which error recovery stops skipping: a statement starts, or a class member starts.
+STATEMENT_KEYWORDS = frozenset(("let", "do", "if", "while", "return"))
+MEMBER_KEYWORDS = frozenset(("static", "field", "constructor", "function", "method"))
+
+PRIMITIVE_TYPES = frozenset(("int", "char", "boolean"))
+
+
+class ParseError(Exception):
+    """A syntax error at a token. Raised inside the parser and recorded where it recovers."""
+
+    def __init__(self, message: str, index: int) -> None:
+        super().__init__(message)
+        self.index = index
+
+
+class JackSyntaxError(SyntaxError):
+    """All the syntax errors of a class. errors holds (line, column, message) triples in source order."""
+
+    def __init__(self, errors: typing.List[typing.Tuple[int, int, str]]) -> None:
+        super().__init__(f"{len(errors)} syntax error(s)" +
+                         "".join(f"\n  {line}:{column}: {message}" for line, column, message in errors))
+        self.errors = errors
+
+
+class JackParser:
+    """
+    Builds the abstract syntax tree of a class from the tokens of a JackTokenizer. Every structural token
+    is checked, and every loop stops at the end of the input. After a syntax error the parser skips to the
+    next statement or class member and goes on, so that one pass reports all the errors of the file.
+    """
+
+    def __init__(self, tokenizer: "JackTokenizer.JackTokenizer") -> None:
+        self.jack_tokenizer = tokenizer
+        self.errors = []
+        self.error_indices = set()
+
+    def fail(self, expected: str) -> typing.NoReturn:
+        """Raises a ParseError at the current token, which is not what was expected."""
+        tokenizer = self.jack_tokenizer
+        if tokenizer.at_end():
+            found = "the end of the input"
+        elif tokenizer.token_type_code() == INVALID and tokenizer.current_token[0] == '"':
+            found = "an unterminated string"
+        else:
+            found = repr(tokenizer.current_token)
+        raise ParseError(f"expected {expected}, found {found}", tokenizer.current_token_index)
+
+    def expect(self, token: str) -> None:
+        """Consumes the current token, which must be the given one."""
+        if self.jack_tokenizer.current_token != token:
+            self.fail(repr(token))
+        self.jack_tokenizer.advance()
+
+    def expect_identifier(self, what: str) -> str:
+        """Consumes the current token, which must be an identifier, and returns it."""
+        tokenizer = self.jack_tokenizer
+        if tokenizer.token_type_code() != IDENTIFIER:
+            self.fail(what)
+        identifier = tokenizer.current_token
+        tokenizer.advance()
+        return identifier
+
+    def expect_type(self, allow_void: bool = False) -> str:
+        """Consumes a type: int, char, boolean, a class name or, for a return type, void."""
+        tokenizer = self.jack_tokenizer
+        type = tokenizer.current_token
+        if type in PRIMITIVE_TYPES or (allow_void and type == "void"):
+            tokenizer.advance()
+            return type
+        return self.expect_identifier("a type")
+
+    def record(self, error: ParseError) -> None:
+        """Records an error. Errors cascading from one at the same token are only reported once."""
+        if error.index not in self.error_indices:
+            self.error_indices.add(error.index)
+            line, column = self.jack_tokenizer.position(error.index)
+            self.errors.append((line, column, str(error)))
+
+    def parse_class(self) -> Class:
+        """Parses a complete class. Raises JackSyntaxError listing every syntax error found."""
+        tokenizer = self.jack_tokenizer
+        tokenizer.advance()
+        class_name = ""
+        class_var_decs = []
+        subroutines = []
+        try:
+            self.expect("class")
+            class_name = self.expect_identifier("a class name")
+            self.expect("{")
+        except ParseError as error:
+            self.record(error)
+            self.skip_member(tokenizer.current_token_index)
+        while tokenizer.current_token != '}':
+            if tokenizer.at_end():
+                self.record(ParseError("expected '}' at the end of the class, found the end of the input",
+                                       tokenizer.current_token_index))
+                break
+            start = tokenizer.current_token_index
+            try:
+                match tokenizer.keyword():
+                    case "FIELD" | "STATIC":
+                        class_var_decs.append(self.parse_var_dec())
+                    case "CONSTRUCTOR" | "METHOD" | "FUNCTION":
+                        subroutines.append(self.parse_subroutine())
+                    case _:
+                        self.fail(f"a class member in class {class_name}")
+            except ParseError as error:
+                self.record(error)
+                self.skip_member(start)
+        tokenizer.advance()
+        if not tokenizer.at_end():
+            self.record(ParseError(f"expected the end of the input after class {class_name}, "
+                                   f"found {tokenizer.current_token!r}", tokenizer.current_token_index))
+        if self.errors:
+            raise JackSyntaxError(sorted(self.errors))
+        return Class(class_name, class_var_decs, subroutines)
+
+    def skip_member(self, start: int) -> None:
+        """
+        Skips to the next class member after a syntax error, always past the token at start. Stops at the
+        closing curly bracket of the class, which is taken to be the last token of the input.
+        """
+        tokenizer = self.jack_tokenizer
+        if tokenizer.current_token_index <= start:
+            tokenizer.advance()
+        last = len(tokenizer.token_values) - 1
+        while not tokenizer.at_end() and tokenizer.current_token not in MEMBER_KEYWORDS:
+            if tokenizer.current_token == '}' and tokenizer.current_token_index == last:
+                return
+            tokenizer.advance()
+
+    def skip_statement(self, start: int) -> None:
+        """
+        Skips to the next statement after a syntax error, always past the token at start: past the next
+        semicolon or block, or up to a closing curly bracket, a statement keyword or a class member keyword.
+        """
+        tokenizer = self.jack_tokenizer
+        if tokenizer.current_token_index <= start:
+            tokenizer.advance()
+        while not tokenizer.at_end():
+            token = tokenizer.current_token
+            if token == ';':
+                tokenizer.advance()
+                return
+            if token == '{':
+                # The statement failed before its block, e.g. in an if condition: the block goes with it.
+                depth = 0
+                while not tokenizer.at_end() and tokenizer.current_token not in MEMBER_KEYWORDS:
+                    if tokenizer.current_token == '{':
+                        depth += 1
+                    elif tokenizer.current_token == '}':
+                        depth -= 1
+                        if depth == 0:
+                            tokenizer.advance()
+                            return
+                    tokenizer.advance()
+                return
+            if token == '}' or token in STATEMENT_KEYWORDS or token in MEMBER_KEYWORDS:
+                return
+            tokenizer.advance()
+
+    def parse_var_dec(self) -> VarDec:
+        """Parses a static, field or var declaration."""
+        kind = self.jack_tokenizer.keyword()
+        self.jack_tokenizer.advance()
+        type = self.expect_type()
+        names = [self.expect_identifier("a variable name")]
+        while self.jack_tokenizer.get_token() != ';':
+            self.expect(",")
+            names.append(self.expect_identifier("a variable name"))
+        self.jack_tokenizer.advance()
+        return VarDec(kind, type, names)
+
+    def parse_subroutine(self) -> Subroutine:
+        """Parses a constructor, function or method."""
+        token_start = self.jack_tokenizer.current_token_index
+        kind = self.jack_tokenizer.keyword()
+        self.jack_tokenizer.advance()
+        return_type = self.expect_type(allow_void=True)
+        name = self.expect_identifier("a subroutine name")
+        parameters = self.parse_parameter_list()
+        self.expect("{")
+        var_decs = []
+        while self.jack_tokenizer.keyword() == "VAR":
+            var_decs.append(self.parse_var_dec())
+        statements = self.parse_statements()
+        self.expect("}")
+        return Subroutine(kind, return_type, name, parameters, var_decs, statements,
+                          token_start, self.jack_tokenizer.current_token_index)
+
+    def parse_parameter_list(self) -> typing.List[typing.Tuple[str, str]]:
+        """Parses a parameter list, including the enclosing parentheses. Returns (type, name) pairs."""
+        parameters = []
+        self.expect("(")
+        while self.jack_tokenizer.get_token() != ')':
+            if parameters:
+                self.expect(",")
+            type = self.expect_type()
+            parameters.append((type, self.expect_identifier("a parameter name")))
+        self.jack_tokenizer.advance()
+        return parameters
+
+    def parse_statements(self) -> typing.List[Statement]:
+        """
+        Parses a sequence of statements. Does not handle the enclosing curly bracket tokens { and }. Stops
+        at the end of the input or at a class member keyword, which the caller reports as a missing }.
+        """
+        tokenizer = self.jack_tokenizer
+        statements = []
+        while tokenizer.current_token != '}':
+            if tokenizer.at_end() or tokenizer.current_token in MEMBER_KEYWORDS:
+                break
+            start = tokenizer.current_token_index
+            try:
+                statements.append(self.parse_statement())
+            except ParseError as error:
+                self.record(error)
+                self.skip_statement(start)
+        return statements
+
+    def parse_statement(self) -> Statement:
+        tokenizer = self.jack_tokenizer
+        if tokenizer.token_type_code() != KEYWORD:
+            self.fail("a statement")
+        comment = f"{tokenizer.get_token()} {tokenizer.next_token()}"
+        token_index = tokenizer.current_token_index
+        match tokenizer.keyword():
+            case "LET":
+                return self.parse_let(comment, token_index)
+            case "IF":
+                return self.parse_if(comment, token_index)
+            case "WHILE":
+                return self.parse_while(comment, token_index)
+            case "DO":
+                return self.parse_do(comment, token_index)
+            case "RETURN":
+                return self.parse_return(comment, token_index)
+            case _:
+                self.fail("a statement")
+
+    def parse_return(self, comment: str, token_index: int) -> Return:
+        self.jack_tokenizer.advance()
+        value = None
+        if self.jack_tokenizer.get_token() != ';':
+            value = self.parse_expression()
+        self.expect(";")
+        return Return(comment, value, token_index)
+
+    def parse_let(self, comment: str, token_index: int) -> Let:
+        self.jack_tokenizer.advance()
+        name = self.expect_identifier("a variable name")
+        index = None
+        if self.jack_tokenizer.get_token() == '[':
+            self.jack_tokenizer.advance()
+            index = self.parse_expression()
+            self.expect("]")
+        self.expect("=")
+        value = self.parse_expression()
+        self.expect(";")
+        return Let(comment, name, index, value, token_index)
+
+    def parse_do(self, comment: str, token_index: int) -> Do:
+        self.jack_tokenizer.advance()
+        start = self.jack_tokenizer.current_token_index
+        call = self.parse_expression()
+        if not isinstance(call, Call):
+            raise ParseError("expected a subroutine call after do", start)
+        self.expect(";")
+        return Do(comment, call, token_index)
+
+    def parse_block(self) -> typing.List[Statement]:
+        """Parses statements enclosed in curly brackets."""
+        self.expect("{")
+        statements = self.parse_statements()
+        self.expect("}")
+        return statements
+
+    def parse_while(self, comment: str, token_index: int) -> While:
+        self.jack_tokenizer.advance()
+        self.expect("(")
+        condition = self.parse_expression()
+        self.expect(")")
+        return While(comment, condition, self.parse_block(), token_index)
+
+    def parse_if(self, comment: str, token_index: int) -> If:
+        self.jack_tokenizer.advance()
+        self.expect("(")
+        condition = self.parse_expression()
+        self.expect(")")
+        statements = self.parse_block()
+        else_statements = None
+        if self.jack_tokenizer.get_token().lower() == 'else':
+            self.jack_tokenizer.advance()
+            else_statements = self.parse_block()
+        return If(comment, condition, statements, else_statements, token_index)
+
+    def parse_expression(self) -> Node:
+        """Parses an expression. Binary operators have no precedence and associate to the left."""
+        tokenizer = self.jack_tokenizer
+        node = self.parse_term()
+        while tokenizer.current_token in OP:
+            op = tokenizer.symbol()
+            tokenizer.advance()
+            node = BinaryOp(op, node, self.parse_term())
+        return node
+
+    def parse_term(self) -> Node:
+        """
+        Parses a term. If the current token is an identifier, a single lookahead token, which may be [, (, or .,
+        distinguishes between a variable, an array entry and a subroutine call.
+        """
+        tokenizer = self.jack_tokenizer
+        type_code = tokenizer.token_type_code()
+        if type_code == IDENTIFIER:
+            identifier = tokenizer.current_token
+            tokenizer.advance()
+            match tokenizer.current_token:
+                case "(" | ".":
+                    return self.parse_call(identifier)
+                case "[":
+                    tokenizer.advance()
+                    node = ArrayAccess(identifier, self.parse_expression())
+                    if tokenizer.current_token != ']':
+                        self.fail("']'")
+                case _:
+                    return Variable(identifier)
+        elif type_code == INT_CONST:
+            node = Constant(tokenizer.int_val())
+        elif type_code == SYMBOL:
+            symbol = tokenizer.current_token
+            if symbol == '(':
+                tokenizer.advance()
+                node = self.parse_expression()
+                if tokenizer.current_token != ')':
+                    self.fail("')'")
+            elif symbol in UNARY_OP:
+                tokenizer.advance()
+                return UnaryOp(symbol, self.parse_term())
+            else:
+                self.fail("an expression")
+        elif type_code == STRING_CONST:
+            node = StringConstant(tokenizer.string_val())
+        else:
+            match tokenizer.keyword():
+                case "TRUE":
+                    node = Constant(-1)
+                case "FALSE" | "NULL":
+                    node = Constant(0)
+                case "THIS":
+                    node = This()
+                case _:
+                    self.fail("an expression")
+        tokenizer.advance()
+        return node
+
+    def parse_call(self, identifier: str) -> Call:
+        """Parses a call whose first identifier has been consumed; the current token is ( or ."""
+        receiver = None
+        name = identifier
+        if self.jack_tokenizer.get_token() == ".":
+            self.jack_tokenizer.advance()
+            receiver = identifier
+            name = self.expect_identifier("a subroutine name")
+        self.expect("(")
+        arguments = self.parse_expression_list()
+        self.expect(")")
+        return Call(receiver, name, arguments)
+
+    def parse_expression_list(self) -> typing.List[Node]:
+        """Parses a (possibly empty) comma-separated list of expressions, up to the closing parenthesis."""
+        expressions = []
+        if self.jack_tokenizer.get_token() != ')':
+            expressions.append(self.parse_expression())
+        while self.jack_tokenizer.get_token() == ',':
+            self.jack_tokenizer.advance()
+            expressions.append(self.parse_expression())
+        return expressions
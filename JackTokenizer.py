@@ -1,5 +1,11 @@
-import typing
+import array
+import bisect
+import mmap
+import os
 import re
+import stat
+import sys
+import typing
 
 
 KEYWORDS = ["class", "constructor", "function", "method", "field",
@@ -12,126 +18,209 @@ SYMBOLS = ['{', '}', '(', ')', '[',
            '-', '*', '/', '&', '|',
            '<', '>', '=', '~', '^', '#']
 
-PATTERN = r'[A-Za-z0-9_]+|[^\sA-Za-z0-9_]'
+# Token type codes stored in the compact token stream, and the constants token_type() returns for them.
+# INVALID marks a stray character or an unterminated string; END is the type past the last token.
+KEYWORD, SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER, INVALID, END = range(7)
+
+TOKEN_TYPES = ("KEYWORD", "SYMBOL", "INT_CONST", "STRING_CONST", "IDENTIFIER", "INVALID", "END")
+
+IDENTIFIER_REGEX = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+NEWLINE_REGEX = re.compile(rb"\n")
+NON_ASCII_REGEX = re.compile(rb"[^\x00-\x7f]")
+# The bytes that continue a UTF-8 encoded character rather than start one.
+CONTINUATION_REGEX = re.compile(rb"[\x80-\xbf]+")
+
+SYMBOL_ESCAPES = {'<': "&lt;", '>': "&gt;", '&': "&amp;"}
+
+# Single master regex used to scan a whole source buffer in one pass. Whitespace and comments match
+# without the "token" group; an unterminated block comment swallows the rest of the buffer and an
+# unterminated string runs to the end of its line, the same way the line-based scanner behaved.
+TOKEN_REGEX = re.compile(rb"""
+      \s+
+    | //[^\r\n]*
+    | /\*.*?(?:\*/|\Z)
+    | (?P<token>
+          "(?:[^"\r\n]|(?<=\\)")*"?
+        | '(?:[^'\r\n]|(?<=\\)')*'?
+        | [A-Za-z0-9_]+
+        | [\xc0-\xff][\x80-\xbf]*
+        | [^\sA-Za-z0-9_]
+      )
+    """, re.VERBOSE | re.DOTALL)
+
+
+def scan_tokens(buffer) -> typing.Iterator[typing.Tuple[int, str]]:
+    """
+    Lazily yields (offset, token) pairs for a bytes-like buffer (bytes, mmap, memoryview) without slicing it.
+    The offset is the byte position at which the token starts.
+    """
+    for matcher in TOKEN_REGEX.finditer(buffer):
+        token = matcher.group("token")
+        if token is not None:
+            yield matcher.start(), token.decode()
+
+
+def index_lines(buffer, line_starts: array.array, continuation_bytes: array.array = None) -> None:
+    """
+    Appends the offset of every line after the first to line_starts and, if continuation_bytes is given, the
+    offset of every UTF-8 continuation byte to it, so that byte offsets can be turned into lines and columns.
+    """
+    line_starts.extend(matcher.end() for matcher in NEWLINE_REGEX.finditer(buffer))
+    if continuation_bytes is None:
+        return
+    # Most sources are plain ASCII, which a quick check rules out; an mmap is searched rather than copied.
+    ascii_only = buffer.isascii() if isinstance(buffer, bytes) else NON_ASCII_REGEX.search(buffer) is None
+    if not ascii_only:
+        for matcher in CONTINUATION_REGEX.finditer(buffer):
+            continuation_bytes.extend(range(matcher.start(), matcher.end()))
+
+
+def scan_stream(input_stream: typing.TextIO, line_starts: array.array = None,
+                continuation_bytes: array.array = None) -> typing.Iterator[typing.Tuple[int, str]]:
+    """
+    Lazily yields the (offset, token) pairs of an input stream. Streams backed by a non-empty regular file are
+    memory-mapped, so the source is never copied into memory; other streams, such as pipes, are read and
+    encoded first. If line_starts is given, the source is indexed into it and continuation_bytes first (see
+    index_lines).
+    """
+    try:
+        file_stat = os.fstat(input_stream.fileno())
+    except (AttributeError, OSError, ValueError):
+        file_stat = None
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode) or file_stat.st_size == 0:
+        data = input_stream.read().encode()
+        if line_starts is not None:
+            index_lines(data, line_starts, continuation_bytes)
+        yield from scan_tokens(data)
+        return
+    with mmap.mmap(input_stream.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        if line_starts is not None:
+            index_lines(buffer, line_starts, continuation_bytes)
+        yield from scan_tokens(buffer)
+
+
+def classify(token: str) -> int:
+    """Returns the type code of a token. Called once per distinct token value."""
+    if token in KEYWORDS:
+        return KEYWORD
+
+    elif token in SYMBOLS:
+        return SYMBOL
+
+    elif token.isdigit():
+        return INT_CONST
+
+    elif token[0] == '"':
+        return STRING_CONST if len(token) > 1 and token[-1] == '"' else INVALID
+
+    elif IDENTIFIER_REGEX.fullmatch(token):
+        return IDENTIFIER
+
+    return INVALID
 
 
 class JackTokenizer:
+    """
+    Tokenizes a whole .jack file up front into a compact token stream: parallel arrays of type codes,
+    interned value ids and source offsets. Each distinct token value is classified once, so the
+    advance / token_type / keyword / next_token API only does array lookups.
+    """
 
     def __init__(self, input_stream: typing.TextIO) -> None:
         """Opens the input .jack file / stream and gets ready to tokenize it."""
-        input_lines = input_stream.read().splitlines()
-        self.tokens_list = []
-        self.text_to_tokens(input_lines)
+        self.token_types = array.array('B')
+        self.token_values = array.array('I')
+        self.token_offsets = array.array('Q')
+        self.line_starts = array.array('Q')
+        # Offsets of the bytes that continue a multibyte character, which do not count as columns.
+        self.continuation_bytes = array.array('Q')
+        # Interned value table, indexed by the ids stored in token_values.
+        self.value_ids = {}
+        self.values = []
+        self.value_types = []
+        self.value_keywords = []
+        for offset, token in scan_stream(input_stream, self.line_starts, self.continuation_bytes):
+            self.append_token(token, offset)
         self.current_token = ""
         self.current_token_index = -1
 
+    def append_token(self, token: str, offset: int) -> None:
+        """Appends a token to the stream, interning and classifying its value if it is new."""
+        value_id = self.value_ids.get(token)
+        if value_id is None:
+            value_id = len(self.values)
+            token = sys.intern(token)
+            self.value_ids[token] = value_id
+            self.values.append(token)
+            self.value_types.append(classify(token))
+            self.value_keywords.append(token.upper())
+        self.token_types.append(self.value_types[value_id])
+        self.token_values.append(value_id)
+        self.token_offsets.append(offset)
+
     def text_to_tokens(self, input_lines):
-        """Converts input lines into a list of tokens."""
-
-        handled_lines = []
-        comment = False
-
-        # Iterate over each line in the input.
-        for line in input_lines:
-            i = 0
-            tokens_list = []
-            while i < len(line):
-                # If we're inside a block comment, continue processing until we find the end of the comment.
-                if comment:
-                    end_index = line.find('*/', i)
-                    if end_index != -1:
-                        comment = False
-                        i = end_index + 2
-                    else:
-                        break
-                elif (line[i] == '/' and
-                      i + 1 < len(line) and
-                      line[i + 1] == '*'):
-                    comment = True
-                    i += 2
-                elif line[i] in ['"', "'"]:
-                    quote_str = line[i]
-                    end_index = i + 1
-                    while (end_index < len(line) and
-                           (line[end_index] != quote_str or
-                            line[end_index - 1] == '\\')):
-                        end_index += 1
-                    if end_index < len(line):
-                        tokens_list.append(line[i:end_index + 1])
-                        i = end_index + 1
-                    else:
-                        tokens_list.append(line[i:])
-                        break
-                elif (i + 1 < len(line) and
-                      line[i] == '/' and
-                      line[i + 1] == '/'):
-                    break
-                elif line[i].isspace():
-                    i += 1
-                else:
-                    matcher = re.match(PATTERN, line[i:])
-                    if matcher:
-                        tokens_list.append(matcher.group(0))
-                        i += len(matcher.group(0))
-                    else:
-                        i += 1
-            if tokens_list:
-                handled_lines.append(tokens_list)
-                for token in tokens_list:
-                    self.tokens_list.append(token)
+        """Converts input lines into tokens and appends them to the stream."""
+        for offset, token in scan_tokens("\n".join(input_lines).encode()):
+            self.append_token(token, offset)
 
     def get_tokens_list(self):
         # simple get function to pass on the token list
-        return self.tokens_list
+        values = self.values
+        return [values[value_id] for value_id in self.token_values]
 
     def has_more_tokens(self) -> bool:
         """Checks if there are more tokens in the input."""
-        return self.current_token_index < len(self.tokens_list) - 1
+        return self.current_token_index < len(self.token_values) - 1
 
     def advance(self) -> None:
         """
-        Gets the next token from the input and makes it the current token.
-        This method should be called only if hasMoreTokens is true. Initially, there is no current token.
+        Gets the next token from the input and makes it the current token. Initially, there is no current
+        token. Advancing past the last token reaches the end of the input, where the current token is ""
+        and its type is END; advancing further stays there.
         """
-        if self.has_more_tokens():
+        if self.current_token_index < len(self.token_values) - 1:
             self.current_token_index += 1
-            self.current_token = self.tokens_list[self.current_token_index]
+            self.current_token = self.values[self.token_values[self.current_token_index]]
+        else:
+            self.current_token_index = len(self.token_values)
+            self.current_token = ""
+
+    def at_end(self) -> bool:
+        """Checks if advance has gone past the last token."""
+        return self.current_token_index >= len(self.token_values)
 
     def token_type(self) -> str:
         """Returns the type of the current token as a constant."""
-        if self.current_token in KEYWORDS:
-            return "KEYWORD"
-
-        elif self.current_token in SYMBOLS:
-            return "SYMBOL"
-
-        elif self.current_token.isdigit():
-            return "INT_CONST"
-
-        elif self.current_token[0] == '"' and self.current_token[-1] == '"':
-            return "STRING_CONST"
+        return TOKEN_TYPES[self.token_type_code()]
 
-        return "IDENTIFIER"
+    def token_type_code(self) -> int:
+        """Returns the numeric type code of the current token (KEYWORD, SYMBOL, ...)."""
+        index = self.current_token_index
+        if index < 0:
+            raise RuntimeError("there is no current token before the first call to advance")
+        try:
+            return self.token_types[index]
+        except IndexError:
+            return END
 
     def keyword(self) -> str:
-        """Returns the keyword which is the current token as a constant.
+        """Returns the keyword which is the current token as a constant, or "" at the end of the input.
         This method should be called only if tokenType is KEYWORD."""
-        return str(self.current_token).upper()
+        index = self.current_token_index
+        if index < 0:
+            raise RuntimeError("there is no current token before the first call to advance")
+        try:
+            return self.value_keywords[self.token_values[index]]
+        except IndexError:
+            return ""
 
     def symbol(self) -> str:
         """Returns the character which is the current token. Should be called only if tokenType is SYMBOL."""
-        if self.current_token == '<':
-            return "&lt;"
-        if self.current_token == '>':
-            return "&gt;"
-        if self.current_token == '&':
-            return "&amp;"
-
-        return self.current_token
+        return SYMBOL_ESCAPES.get(self.current_token, self.current_token)
 
     def identifier(self) -> str:
         """Returns the string which is the current token. Should be called only if tokenType is IDENTIFIER."""
-        return str(self.current_token)
+        return self.current_token
 
     def int_val(self) -> int:
         """Returns the integer value of the current token. Should be called only if tokenType is INT_CONST."""
@@ -145,5 +234,33 @@ class JackTokenizer:
     def get_token(self):
         return self.current_token
 
+    def get_offset(self) -> int:
+        """Returns the byte offset in the source at which the current token starts."""
+        if self.current_token_index < 0:
+            raise RuntimeError("there is no current token before the first call to advance")
+        return self.token_offsets[self.current_token_index]
+
     def next_token(self):
-        return self.tokens_list[self.current_token_index+1]
+        if self.current_token_index + 1 < len(self.token_values):
+            return self.values[self.token_values[self.current_token_index + 1]]
+        return ""
+
+    def position(self, index: int = None) -> typing.Tuple[int, int]:
+        """
+        Returns the 1-based line and column at which the token at index (by default the current one)
+        starts. Past the last token, this is where the input ends. Columns count characters, not bytes.
+        """
+        if index is None:
+            index = self.current_token_index
+        if 0 <= index < len(self.token_offsets):
+            offset = self.token_offsets[index]
+        elif self.token_offsets and index >= 0:
+            offset = self.token_offsets[-1] + len(self.values[self.token_values[-1]].encode())
+        else:
+            offset = 0
+        line = bisect.bisect_right(self.line_starts, offset)
+        line_start = self.line_starts[line - 1] if line else 0
+        continuations = self.continuation_bytes
+        if continuations:
+            offset -= bisect.bisect_left(continuations, offset) - bisect.bisect_left(continuations, line_start)
+        return line + 1, offset - line_start + 1
@@ -0,0 +1,228 @@
+import typing
+
+from CodeGenerator import is_boolean
+from JackAST import (Node, Constant, StringConstant, This, Variable, ArrayAccess, Call, UnaryOp, BinaryOp,
+                     Statement, Let, If, While, Do, Return, VarDec, Subroutine, Class)
+from SymbolTable import SymbolTable
+
+# Hoisted values live in extra locals with these names, which no Jack identifier can clash with.
+TEMP_PREFIX = "$invariant"
+
+LEAVES = (Constant, StringConstant, This, Variable)
+
+
+class LoopEffects:
+    """What the statements and condition of a loop may change: the variables they assign and memory."""
+
+    def __init__(self) -> None:
+        self.assigned = set()
+        # A call may change any field, static or array entry. An array store may change any of them too,
+        # since Jack code can point an array at an object or at the statics (as in let ram = 0).
+        self.calls = False
+        self.stores_arrays = False
+
+    def add_statements(self, statements: typing.List[Statement]) -> None:
+        for statement in statements:
+            match statement:
+                case Let():
+                    if statement.index is None:
+                        self.assigned.add(statement.name)
+                    else:
+                        self.stores_arrays = True
+                        self.add_expression(statement.index)
+                    self.add_expression(statement.value)
+                case If():
+                    self.add_expression(statement.condition)
+                    self.add_statements(statement.statements)
+                    if statement.else_statements is not None:
+                        self.add_statements(statement.else_statements)
+                case While():
+                    self.add_expression(statement.condition)
+                    self.add_statements(statement.statements)
+                case Do():
+                    self.add_expression(statement.call)
+                case Return():
+                    if statement.value is not None:
+                        self.add_expression(statement.value)
+
+    def add_expression(self, node: Node) -> None:
+        match node:
+            case Call() | StringConstant():
+                # A string literal calls String.new and String.appendChar.
+                self.calls = True
+                for argument in getattr(node, "arguments", ()):
+                    self.add_expression(argument)
+            case ArrayAccess():
+                self.add_expression(node.index)
+            case UnaryOp():
+                self.add_expression(node.operand)
+            case BinaryOp():
+                self.add_expression(node.left)
+                self.add_expression(node.right)
+
+
+class LoopInvariantHoister:
+    """
+    Moves the pure subexpressions of while loops that the loop cannot change into extra locals that are
+    assigned once before the loop. An invariant array address whose entry may change is hoisted as the
+    address, so the loop reads name[0] through the local. The extra locals are declared as one more var
+    declaration of the subroutine, which raises the local count of its function command; loops that
+    are not nested share them.
+    """
+
+    def __init__(self, symbol_table: SymbolTable) -> None:
+        self.symbol_table = symbol_table
+        self.temps_used = 0
+        # Per loop: the effects of the loop, and hoisted expression (by repr) -> temp name.
+        self.effects = None
+        self.hoisted = {}
+        self.first_temp = 0
+
+    def hoist_subroutine(self, node: Subroutine) -> None:
+        self.temps_used = 0
+        self.hoist_statements(node.statements, 0)
+        if self.temps_used:
+            node.var_decs.append(VarDec("VAR", "int", [TEMP_PREFIX + str(i) for i in range(self.temps_used)]))
+
+    def hoist_statements(self, statements: typing.List[Statement], first_temp: int) -> None:
+        """Hoists out of the loops in statements, using the temps from first_temp on."""
+        position = 0
+        while position < len(statements):
+            statement = statements[position]
+            if isinstance(statement, While):
+                hoisted = self.hoist_loop(statement, first_temp)
+                statements[position:position] = hoisted
+                position += len(hoisted)
+                self.hoist_statements(statement.statements, first_temp + len(hoisted))
+            elif isinstance(statement, If):
+                self.hoist_statements(statement.statements, first_temp)
+                if statement.else_statements is not None:
+                    self.hoist_statements(statement.else_statements, first_temp)
+            position += 1
+
+    def hoist_loop(self, node: While, first_temp: int) -> typing.List[Let]:
+        """Rewrites a loop, outermost first, and returns the assignments of its temps."""
+        self.effects = LoopEffects()
+        self.effects.add_expression(node.condition)
+        self.effects.add_statements(node.statements)
+        self.hoisted = {}
+        self.first_temp = first_temp
+        node.condition = self.rewrite(node.condition)
+        self.rewrite_statements(node.statements)
+        assignments = [Let(f"let {name}", name, None, value, node.token_index)
+                       for name, value in self.hoisted.values()]
+        self.temps_used = max(self.temps_used, first_temp + len(assignments))
+        return assignments
+
+    def rewrite_statements(self, statements: typing.List[Statement]) -> None:
+        for statement in statements:
+            match statement:
+                case Let():
+                    if statement.index is not None:
+                        address = self.hoist_address(statement.name, statement.index)
+                        if address is None:
+                            statement.index = self.rewrite(statement.index)
+                        else:
+                            statement.name, statement.index = address.name, address.index
+                    statement.value = self.rewrite(statement.value)
+                case If():
+                    statement.condition = self.rewrite(statement.condition)
+                    self.rewrite_statements(statement.statements)
+                    if statement.else_statements is not None:
+                        self.rewrite_statements(statement.else_statements)
+                case While():
+                    statement.condition = self.rewrite(statement.condition)
+                    self.rewrite_statements(statement.statements)
+                case Do():
+                    statement.call.arguments = [self.rewrite(argument) for argument in statement.call.arguments]
+                case Return():
+                    if statement.value is not None:
+                        statement.value = self.rewrite(statement.value)
+
+    def rewrite(self, node: Node) -> Node:
+        """Returns the expression with its largest hoistable subexpressions replaced by temps."""
+        if self.is_worth_hoisting(node) and self.is_invariant(node):
+            return self.temp_for(node)
+        match node:
+            case ArrayAccess():
+                address = self.hoist_address(node.name, node.index)
+                if address is not None:
+                    return address
+                node.index = self.rewrite(node.index)
+            case Call():
+                node.arguments = [self.rewrite(argument) for argument in node.arguments]
+            case UnaryOp():
+                node.operand = self.rewrite(node.operand)
+            case BinaryOp():
+                node.left = self.rewrite(node.left)
+                node.right = self.rewrite(node.right)
+        return node
+
+    def hoist_address(self, name: str, index: Node) -> typing.Optional[ArrayAccess]:
+        """Returns temp[0] for name[index] if its address is invariant and worth computing once."""
+        if isinstance(index, LEAVES) or not self.is_invariant(Variable(name)) or not self.is_invariant(index):
+            return None
+        return ArrayAccess(self.temp_for(BinaryOp('+', Variable(name), index)).name, Constant(0))
+
+    def is_worth_hoisting(self, node: Node) -> bool:
+        """
+        Leaves cost no more than reading a temp. Booleans are left in place, since direct branches and
+        short-circuiting only apply to conditions they can see are booleans.
+        """
+        if isinstance(node, LEAVES) or is_boolean(node):
+            return False
+        return not (isinstance(node, UnaryOp) and node.op == '-' and isinstance(node.operand, Constant))
+
+    def is_invariant(self, node: Node) -> bool:
+        """Whether an expression is pure and yields the same value in every iteration of the loop."""
+        match node:
+            case Constant() | This():
+                return True
+            case Variable():
+                kind = self.symbol_table.kind_of(node.name)
+                if kind is None or node.name in self.effects.assigned:
+                    return False
+                return kind in ("ARG", "VAR") or not (self.effects.calls or self.effects.stores_arrays)
+            case ArrayAccess():
+                return (not self.effects.calls and not self.effects.stores_arrays
+                        and self.is_invariant(Variable(node.name)) and self.is_invariant(node.index))
+            case UnaryOp():
+                return self.is_invariant(node.operand)
+            case BinaryOp():
+                # Math.divide stops the program on a zero divisor, which must not happen before the loop.
+                if node.op == '/' and not (isinstance(node.right, Constant) and node.right.value != 0):
+                    return False
+                return self.is_invariant(node.left) and self.is_invariant(node.right)
+        return False
+
+    def temp_for(self, node: Node) -> Variable:
+        """Returns the temp that holds an invariant expression, allocating one for a new expression."""
+        key = repr(node)
+        entry = self.hoisted.get(key)
+        if entry is None:
+            name = TEMP_PREFIX + str(self.first_temp + len(self.hoisted))
+            entry = self.hoisted[key] = (name, node)
+            # Loops nested in this one see the temp as a local that they do not assign.
+            if self.symbol_table.lookup(name) is None:
+                self.symbol_table.define(name, "int", "VAR")
+        return Variable(entry[0])
+
+
+def hoist_invariants(node: Class) -> Class:
+    """The loop-invariant code motion pass: hoists invariant subexpressions out of every while loop."""
+    symbol_table = SymbolTable()
+    for var_dec in node.class_var_decs:
+        for name in var_dec.names:
+            symbol_table.define(name, var_dec.type, var_dec.kind)
+    hoister = LoopInvariantHoister(symbol_table)
+    for subroutine in node.subroutines:
+        symbol_table.start_subroutine()
+        if subroutine.kind == "METHOD":
+            symbol_table.define("this", "Array", "ARG")
+        for type, name in subroutine.parameters:
+            symbol_table.define(name, type, "ARG")
+        for var_dec in subroutine.var_decs:
+            for name in var_dec.names:
+                symbol_table.define(name, var_dec.type, var_dec.kind)
+        hoister.hoist_subroutine(subroutine)
+    return node
@@ -0,0 +1,50 @@
+import time
+import typing
+
+from JackAST import Class
+
+# A pass takes the syntax tree of a class and returns the tree to continue with, which may be the same one.
+Pass = typing.Callable[[Class], Class]
+
+
+class PassManager:
+    """
+    Runs an ordered list of named passes over the syntax tree of a class.
+    Passes are run in the order they were registered, unless a position is given relative to another pass.
+    The time spent in each pass is accumulated in timings, keyed by pass name.
+    """
+
+    def __init__(self) -> None:
+        self.passes = []
+        self.timings = {}
+
+    def names(self) -> typing.List[str]:
+        """Returns the names of the registered passes, in the order they run."""
+        return [name for name, _ in self.passes]
+
+    def register(self, name: str, function: Pass, before: str = None, after: str = None) -> None:
+        """Adds a pass at the end, or right before or after the named pass."""
+        names = self.names()
+        if name in names:
+            raise ValueError(f"pass {name} is already registered")
+        position = len(self.passes)
+        for anchor, offset in ((before, 0), (after, 1)):
+            if anchor is not None:
+                if anchor not in names:
+                    raise ValueError(f"unknown pass {anchor}")
+                position = names.index(anchor) + offset
+        self.passes.insert(position, (name, function))
+
+    def unregister(self, name: str) -> None:
+        """Removes the named pass."""
+        if name not in self.names():
+            raise ValueError(f"unknown pass {name}")
+        self.passes = [entry for entry in self.passes if entry[0] != name]
+
+    def run(self, tree: Class) -> Class:
+        """Runs every pass over the tree, in order, and returns the resulting tree."""
+        for name, function in self.passes:
+            start = time.perf_counter()
+            tree = function(tree)
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+        return tree
@@ -0,0 +1,153 @@
+import typing
+
+from VMWriter import PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN, RAW, \
+    push_word, to_word
+
+# Arithmetic commands whose result is always a canonical boolean (-1 or 0).
+COMPARISONS = ("lt", "gt", "eq")
+
+# Segments a value can be pushed from without depending on pointer 1 or temp 0.
+STABLE_SEGMENTS = ("constant", "local", "argument", "this", "static")
+
+
+class PeepholeOptimizer:
+    """
+    Rewrites redundant instruction sequences in the VMWriter buffer into shorter equivalents.
+    Each subroutine is rewritten until no rule applies; comment lines are kept and matched through.
+    The number of instructions removed from each subroutine is collected in removed.
+    void_subroutines holds the VM names of the subroutines declared void, which some rules depend on.
+    """
+
+    def __init__(self, void_subroutines: typing.Iterable[str] = ()) -> None:
+        self.removed = {}
+        self.void_subroutines = set(void_subroutines)
+        # Whether the subroutine being optimized is declared void.
+        self.in_void_subroutine = False
+
+    def optimize(self, instructions: typing.List[tuple]) -> typing.List[tuple]:
+        """Returns the optimized instruction list of a whole class."""
+        result = []
+        start = 0
+        for end in range(1, len(instructions) + 1):
+            if end == len(instructions) or instructions[end][0] == FUNCTION:
+                result += self.optimize_subroutine(instructions[start:end])
+                start = end
+        return result
+
+    def optimize_subroutine(self, code: typing.List[tuple]) -> typing.List[tuple]:
+        """Applies the rules to a single subroutine until it stops shrinking."""
+        before = sum(instruction[0] != RAW for instruction in code)
+        self.in_void_subroutine = bool(code) and code[0][0] == FUNCTION and code[0][1] in self.void_subroutines
+        changed = True
+        while changed:
+            changed = False
+            references = {}
+            for opcode, name, _ in code:
+                if opcode in (GOTO, IF_GOTO):
+                    references[name] = references.get(name, 0) + 1
+            position = 0
+            while position < len(code):
+                rewrite = self.match(code, position, references)
+                if rewrite is None:
+                    position += 1
+                    continue
+                positions, replacement = rewrite
+                for opcode, name, _ in [code[index] for index in positions]:
+                    if opcode in (GOTO, IF_GOTO):
+                        references[name] -= 1
+                for opcode, name, _ in replacement:
+                    if opcode in (GOTO, IF_GOTO):
+                        references[name] = references.get(name, 0) + 1
+                code = self.replace(code, positions, replacement)
+                changed = True
+                # A rewrite can only enable rules that start a few instructions earlier.
+                position = max(positions[0] - 6, 0)
+        after = sum(instruction[0] != RAW for instruction in code)
+        if code and code[0][0] == FUNCTION and before != after:
+            self.removed[code[0][1]] = before - after
+        return code
+
+    @staticmethod
+    def window(code: typing.List[tuple], position: int, size: int) -> typing.List[int]:
+        """Returns the positions of up to size instructions starting at position, skipping comments."""
+        positions = []
+        while position < len(code) and len(positions) < size:
+            if code[position][0] != RAW:
+                positions.append(position)
+            position += 1
+        return positions
+
+    @staticmethod
+    def replace(code: typing.List[tuple], positions: typing.List[int], replacement: list) -> list:
+        """Replaces the instructions at positions with replacement, keeping the comments between them."""
+        kept = [code[position] for position in range(positions[0], positions[-1] + 1)
+                if position not in positions]
+        return code[:positions[0]] + replacement + kept + code[positions[-1] + 1:]
+
+    def match(self, code: typing.List[tuple], position: int, references: dict):
+        """Returns (positions, replacement) for the first rule that applies at position, or None."""
+        positions = self.window(code, position, 6)
+        if not positions or positions[0] != position:
+            return None
+        ops = [code[index] for index in positions]
+        opcode, name, number = ops[0]
+
+        # Labels nothing jumps to.
+        if opcode == LABEL and not references.get(name):
+            return positions[:1], []
+
+        # Unreachable code after an unconditional jump or a return.
+        if opcode in (GOTO, RETURN) and len(ops) > 1 and ops[1][0] not in (LABEL, FUNCTION):
+            return positions[1:2], []
+
+        # goto L; [label M]*; label L
+        if opcode == GOTO:
+            for op in ops[1:]:
+                if op[0] != LABEL:
+                    break
+                if op[1] == name:
+                    return positions[:1], []
+
+        # lt; if-goto T; goto F; label T  ->  lt; not; if-goto F; label T
+        if (opcode == ARITHMETIC and name in COMPARISONS and len(ops) > 3 and
+                ops[1][0] == IF_GOTO and ops[2][0] == GOTO and ops[3][:2] == (LABEL, ops[1][1])):
+            return positions[1:3], [(ARITHMETIC, "not", 0), (IF_GOTO, ops[2][1], 0)]
+
+        # push constant k; [neg | not]*; [if-goto L]  ->  the folded constant or jump.
+        if opcode == PUSH and name == "constant":
+            value = number
+            length = 1
+            while length < len(ops) and ops[length][0] == ARITHMETIC and ops[length][1] in ("neg", "not"):
+                value = to_word(-value) if ops[length][1] == "neg" else ~value
+                length += 1
+            if length < len(ops) and ops[length][0] == IF_GOTO:
+                return positions[:length + 1], [(GOTO, ops[length][1], 0)] if value else []
+            replacement = push_word(value)
+            if len(replacement) < length:
+                return positions[:length], replacement
+
+        # Array store of a simple value: skip the spill through temp 0.
+        # push v; [unary]; pop temp 0; pop pointer 1; push temp 0; pop that 0
+        #   ->  pop pointer 1; push v; [unary]; pop that 0
+        if opcode == PUSH and name in STABLE_SEGMENTS:
+            length = 2 if len(ops) > 1 and ops[1][0] == ARITHMETIC and ops[1][1] in ("neg", "not") else 1
+            if ops[length:length + 4] == [
+                    (POP, "temp", 0), (POP, "pointer", 1), (PUSH, "temp", 0), (POP, "that", 0)]:
+                return positions[:length + 4], [(POP, "pointer", 1)] + ops[:length] + [(POP, "that", 0)]
+
+        # A discarded value that has no side effects, e.g. the result of an inlined void subroutine in a
+        # do statement. temp 0 is only read back right after an array address is popped into pointer 1.
+        # push v; pop temp 0; (anything but pop pointer 1)  ->  (nothing)
+        if (opcode == PUSH and name in STABLE_SEGMENTS and len(ops) > 2 and ops[1] == (POP, "temp", 0) and
+                ops[2] != (POP, "pointer", 1)):
+            return positions[:2], []
+
+        # A do statement right before "return;" in a void subroutine: the call's result can be returned
+        # instead of 0, since every caller discards it. A subroutine declared with a return type may still
+        # end in "return;", and then its callers see the 0.
+        # call f n; pop temp 0; push constant 0; return  ->  call f n; return
+        if (opcode == CALL and self.in_void_subroutine and
+                ops[1:4] == [(POP, "temp", 0), (PUSH, "constant", 0), (RETURN, "", 0)]):
+            return positions[1:3], []
+
+        return None
@@ -0,0 +1,79 @@
+import bisect
+import json
+import typing
+
+from VMWriter import FUNCTION, RAW
+
+# A source map maps the VM commands of a .vm file, counted from 0 without comment lines (the order in which
+# VMEmulator loads them), to the Jack line and column they were generated from. It is stored next to the
+# .vm file as compact JSON:
+#   {"version": 1, "source": "Main.jack", "mappings": [index, line, column, index, line, column, ...]}
+# Each triple holds for the commands from its index up to the index of the next triple.
+FORMAT_VERSION = 1
+
+Mapping = typing.Tuple[int, int, int]
+
+
+def source_map_path(output_path: str) -> str:
+    """Returns the path of the source map written next to a .vm file."""
+    return output_path + ".map"
+
+
+def build(instructions: typing.Iterable[typing.Tuple[int, str, int]], tokenizer) -> typing.List[Mapping]:
+    """
+    Builds the (command index, line, column) mappings of the final instructions of a class from the markers
+    of VMWriter.write_marker, resolving token indices through the tokenizer. The code before the first
+    statement of a function, e.g. the function command and the method prologue, maps to that statement.
+    """
+    mappings = []
+    index = 0
+    function_start = None
+    for opcode, _, number in instructions:
+        if opcode == RAW:
+            if number:
+                line, column = tokenizer.position(number - 1)
+                start = index if function_start is None else function_start
+                function_start = None
+                if mappings and mappings[-1][0] == start:
+                    mappings[-1] = (start, line, column)
+                elif not mappings or mappings[-1][1:] != (line, column):
+                    mappings.append((start, line, column))
+            continue
+        if opcode == FUNCTION:
+            function_start = index
+        index += 1
+    return mappings
+
+
+def strip_markers(instructions: typing.List[tuple], comments: bool) -> typing.List[tuple]:
+    """Turns the markers back into plain comment lines, or drops every comment line if comments is unset."""
+    if comments:
+        return [(RAW, instruction[1], 0) if instruction[0] == RAW else instruction for instruction in instructions]
+    return [instruction for instruction in instructions if instruction[0] != RAW]
+
+
+def dumps(mappings: typing.List[Mapping], source: str) -> str:
+    """Serializes the mappings of a class compiled from the given source file name."""
+    flat = [value for mapping in mappings for value in mapping]
+    return json.dumps({"version": FORMAT_VERSION, "source": source, "mappings": flat}, separators=(",", ":"))
+
+
+def load(path: str) -> typing.Tuple[str, typing.List[Mapping]]:
+    """Reads a source map. Returns the source file name and the mappings. Raises ValueError if it is malformed."""
+    with open(path, 'r') as map_file:
+        try:
+            document = json.load(map_file)
+        except json.JSONDecodeError as error:
+            raise ValueError(f"{path}: not a source map: {error}") from None
+    if not isinstance(document, dict) or document.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: not a version {FORMAT_VERSION} source map")
+    flat = document["mappings"]
+    return document["source"], [tuple(flat[position:position + 3]) for position in range(0, len(flat), 3)]
+
+
+def locate(mappings: typing.List[Mapping], index: int) -> typing.Optional[typing.Tuple[int, int]]:
+    """Returns the line and column that the command at index maps to, or None if it precedes every mapping."""
+    position = bisect.bisect_right(mappings, (index, float("inf"), 0)) - 1
+    if position < 0:
+        return None
+    return mappings[position][1:]
@@ -1,16 +1,36 @@
 import typing
 
+# VM segment that holds the variables of each kind.
+SEGMENTS = {"STATIC": "static", "FIELD": "this", "ARG": "argument", "VAR": "local"}
+
+
+class Symbol:
+    """A resolved variable: everything the code generator needs to access it."""
+
+    __slots__ = ("name", "type", "kind", "index", "segment")
+
+    def __init__(self, name: str, type: str, kind: str, index: int) -> None:
+        self.name = name
+        self.type = type
+        self.kind = kind
+        self.index = index
+        self.segment = SEGMENTS[kind]
+
+
 class SymbolTable:
 
     def __init__(self) -> None:
         """Creates a new symbol table."""
         self.class_table = {}
         self.subroutine_table = {}
+        # Every name visible in the current subroutine, so that a lookup is a single probe.
+        self.scope = {}
         self.counters = {"FIELD": 0, "STATIC": 0, "ARG": 0, "VAR": 0}
 
     def start_subroutine(self) -> None:
         """Starts a new subroutine scope"""
         self.subroutine_table = {}
+        self.scope = dict(self.class_table)
         self.counters["VAR"] = 0
         self.counters["ARG"] = 0
 
@@ -21,44 +41,46 @@ class SymbolTable:
         Assigns it the index value of that kind, and adds 1 to the index.
         """
         if kind in ["STATIC", "FIELD"]:
-            self.class_table[name] = (kind, type, self.counters[kind])
+            symbol = Symbol(name, type, kind, self.counters[kind])
+            self.class_table[name] = symbol
+            if name not in self.subroutine_table:
+                self.scope[name] = symbol
             self.counters[kind] += 1
         elif kind in ["ARG", "VAR"]:
-            self.subroutine_table[name] = (kind, type, self.counters[kind])
+            symbol = Symbol(name, type, kind, self.counters[kind])
+            self.subroutine_table[name] = symbol
+            self.scope[name] = symbol
             self.counters[kind] += 1
         else:
             raise ValueError(f"Unknown type {type}")
 
+    def lookup(self, name: str) -> typing.Optional[Symbol]:
+        """Returns the record of the named variable, or None if it is not defined."""
+        return self.scope.get(name)
+
+    def resolve(self, name: str) -> Symbol:
+        """Returns the record of the named variable. Raises ValueError if it is not defined."""
+        symbol = self.scope.get(name)
+        if symbol is None:
+            raise ValueError(f"Unknown symbol {name}")
+        return symbol
+
     def var_count(self, kind: str) -> int:
         """Returns the number of variables of the given kind already defined in the table."""
         return self.counters[kind]
 
     def kind_of(self, name: str):
         """Returns the kind of the named identifier. If the identifier is not found, returns NONE."""
-        if name in self.subroutine_table:
-            return self.subroutine_table[name][0]
-        elif name in self.class_table:
-            return self.class_table[name][0]
-        else:
-            return None
+        symbol = self.scope.get(name)
+        return None if symbol is None else symbol.kind
 
     def type_of(self, name: str) -> str:
         """Returns the type of the named variable."""
-        if name in self.subroutine_table:
-            return self.subroutine_table[name][1]
-        elif name in self.class_table:
-            return self.class_table[name][1]
-        else:
-            raise ValueError(f"Unknown symbol {name}")
+        return self.resolve(name).type
 
     def index_of(self, name: str) -> int:
         """Returns the index of the named variable."""
-        if name in self.subroutine_table:
-            return self.subroutine_table[name][2]
-        elif name in self.class_table:
-            return self.class_table[name][2]
-        else:
-            raise ValueError(f"Unknown symbol {name}")
+        return self.resolve(name).index
 
     def get_local_variable_count(self):
         return self.counters["VAR"]
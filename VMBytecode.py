@@ -0,0 +1,239 @@
+import argparse
+import mmap
+import struct
+import sys
+import typing
+
+from VMWriter import PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN, RAW, FORMATS, VMWriter
+
+# Layout of a .vmb file, all little-endian:
+#   header        magic, format version, reserved, number of strings, number of instructions
+#   instructions  one fixed-width record each: opcode, kind, 16-bit operand, string index
+#   strings       offsets of the n strings (n + 1 entries, relative to the string data), then UTF-8 data
+# kind is the segment of a push or pop and the command of an arithmetic instruction. The string is the
+# name of a label, goto, if-goto, call or function and the text of a raw line; the operand is the index
+# of a push or pop, the argument count of a call and the local count of a function.
+MAGIC = b"JVMB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+INSTRUCTION = struct.Struct("<BBHI")
+OFFSET = struct.Struct("<I")
+
+SEGMENTS = ("constant", "argument", "local", "static", "this", "that", "pointer", "temp")
+ARITHMETIC_COMMANDS = ("add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not", "shiftleft", "shiftright")
+SEGMENT_CODES = {segment: code for code, segment in enumerate(SEGMENTS)}
+ARITHMETIC_CODES = {command: code for code, command in enumerate(ARITHMETIC_COMMANDS)}
+
+# Opcodes whose name operand goes into the string table, and the text command of each opcode.
+NAMED = frozenset((LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RAW))
+COMMANDS = {"push": PUSH, "pop": POP, "label": LABEL, "goto": GOTO, "if-goto": IF_GOTO, "call": CALL,
+            "function": FUNCTION, "return": RETURN}
+
+
+def encode(instructions: typing.Iterable[typing.Tuple[int, str, int]]) -> bytes:
+    """
+    Encodes VMWriter instructions. Raises ValueError for an unknown segment or arithmetic command, or an
+    operand that does not fit in 16 bits.
+    """
+    strings = {}
+    records = []
+    for opcode, name, number in instructions:
+        kind = 0
+        string = 0
+        if opcode == PUSH or opcode == POP:
+            kind = SEGMENT_CODES.get(name)
+            if kind is None:
+                raise ValueError(f"unknown segment {name!r}")
+        elif opcode == ARITHMETIC:
+            kind = ARITHMETIC_CODES.get(name)
+            if kind is None:
+                raise ValueError(f"unknown arithmetic command {name!r}")
+        elif opcode in NAMED:
+            string = strings.get(name)
+            if string is None:
+                string = strings[name] = len(strings)
+        if not 0 <= number <= 0xFFFF:
+            raise ValueError(f"operand {number} of {FORMATS[opcode].format(name, number).strip()!r} "
+                             f"does not fit in 16 bits")
+        records.append(INSTRUCTION.pack(opcode, kind, number, string))
+    data = [string.encode() for string in strings]
+    offsets = [0]
+    for encoded in data:
+        offsets.append(offsets[-1] + len(encoded))
+    return b"".join([HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(data), len(records)), *records,
+                     *(OFFSET.pack(offset) for offset in offsets), *data])
+
+
+class BytecodeReader:
+    """
+    Reads the instructions of a .vmb file without copying it: the buffer (bytes, a memoryview or an mmap)
+    is only wrapped in a memoryview, and records and strings are unpacked straight from it.
+    """
+
+    def __init__(self, buffer: typing.Union[bytes, bytearray, memoryview, mmap.mmap]) -> None:
+        self.mmap = None
+        self.view = memoryview(buffer)
+        if len(self.view) < HEADER.size:
+            raise ValueError("not a VM bytecode file: too short")
+        magic, version, _, self.n_strings, self.n_instructions = HEADER.unpack_from(self.view)
+        if magic != MAGIC:
+            raise ValueError("not a VM bytecode file: bad magic")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported VM bytecode version {version}")
+        self.offsets_start = HEADER.size + self.n_instructions * INSTRUCTION.size
+        self.data_start = self.offsets_start + (self.n_strings + 1) * OFFSET.size
+        if len(self.view) < self.data_start or len(self.view) != self.data_start + self.string_offset(self.n_strings):
+            raise ValueError("not a VM bytecode file: truncated")
+        self.strings = None
+
+    @classmethod
+    def from_file(cls, path: str) -> "BytecodeReader":
+        """Maps a .vmb file into memory. The reader keeps the mapping until close() is called."""
+        with open(path, 'rb') as bytecode_file:
+            mapping = mmap.mmap(bytecode_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            reader = cls(mapping)
+        except ValueError:
+            mapping.close()
+            raise
+        reader.mmap = mapping
+        return reader
+
+    def close(self) -> None:
+        self.view.release()
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def __len__(self) -> int:
+        return self.n_instructions
+
+    def string_offset(self, index: int) -> int:
+        return OFFSET.unpack_from(self.view, self.offsets_start + index * OFFSET.size)[0]
+
+    def string_table(self) -> typing.List[str]:
+        """Returns the string table, which is decoded the first time it is needed."""
+        if self.strings is None:
+            offsets = self.view[self.offsets_start:self.data_start]
+            data = self.view[self.data_start:]
+            positions = [offset for offset, in OFFSET.iter_unpack(offsets)]
+            self.strings = [str(data[start:end], "utf-8") for start, end in zip(positions, positions[1:])]
+            offsets.release()
+            data.release()
+        return self.strings
+
+    def instructions(self) -> typing.List[typing.Tuple[int, str, int]]:
+        """Returns the instructions as VMWriter (opcode, name, number) tuples."""
+        strings = self.string_table()
+        # The name of each opcode is looked up in its table. The kind and string fields that an opcode
+        # does not use are 0, so kind | string is the one that it does.
+        tables = [SEGMENTS, SEGMENTS, ARITHMETIC_COMMANDS, strings, strings, strings, strings, strings, ("",), strings]
+        records = self.view[HEADER.size:self.offsets_start]
+        try:
+            return [(opcode, tables[opcode][kind | string], number)
+                    for opcode, kind, number, string in INSTRUCTION.iter_unpack(records)]
+        except IndexError:
+            raise ValueError("not a VM bytecode file: bad instruction") from None
+        finally:
+            records.release()
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[int, str, int]]:
+        return iter(self.instructions())
+
+
+def decode(buffer: typing.Union[bytes, bytearray, memoryview, mmap.mmap]) -> typing.List[typing.Tuple[int, str, int]]:
+    """Decodes the instructions of a .vmb file held in memory."""
+    reader = BytecodeReader(buffer)
+    try:
+        return reader.instructions()
+    finally:
+        reader.close()
+
+
+def read_file(path: str) -> typing.List[typing.Tuple[int, str, int]]:
+    """Reads the instructions of a .vmb file."""
+    reader = BytecodeReader.from_file(path)
+    try:
+        return reader.instructions()
+    finally:
+        reader.close()
+
+
+def parse_line(line: str) -> typing.Tuple[int, str, int]:
+    """Parses a line of VM text as VMWriter writes it, without the newline. Comments and blank lines are raw."""
+    if not line or line.startswith("//"):
+        return RAW, line, 0
+    words = line.split(" ")
+    command = words[0]
+    opcode = COMMANDS.get(command)
+    if command in ARITHMETIC_CODES and len(words) == 1:
+        instruction = (ARITHMETIC, command, 0)
+    elif opcode == RETURN and len(words) == 1:
+        instruction = (RETURN, "", 0)
+    elif opcode in (LABEL, GOTO, IF_GOTO) and len(words) == 2:
+        instruction = (opcode, words[1], 0)
+    elif opcode in (PUSH, POP, CALL, FUNCTION) and len(words) == 3 and words[2].isdigit():
+        instruction = (opcode, words[1], int(words[2]))
+    else:
+        raise ValueError(f"not a VM command: {line!r}")
+    if FORMATS[instruction[0]].format(instruction[1], instruction[2]) != line + "\n":
+        raise ValueError(f"not in the form VMWriter writes: {line!r}")
+    return instruction
+
+
+def parse_text(text: str) -> typing.List[typing.Tuple[int, str, int]]:
+    """
+    Parses VM text in the exact form VMWriter writes it, so that writing the result back reproduces the
+    text byte for byte. Raises ValueError for anything else, rather than altering it silently.
+    """
+    if text and not text.endswith("\n"):
+        raise ValueError("VM text must end with a newline")
+    # Like VMWriter.to_text, each distinct line is only handled once.
+    instructions = {}
+    get_instruction = instructions.get
+    result = []
+    for number, line in enumerate(text.split("\n")[:-1], 1):
+        instruction = get_instruction(line)
+        if instruction is None:
+            try:
+                instruction = instructions[line] = parse_line(line)
+            except ValueError as error:
+                raise ValueError(f"line {number}: {error}") from None
+        result.append(instruction)
+    return result
+
+
+def to_text(instructions: typing.Iterable[typing.Tuple[int, str, int]]) -> str:
+    writer = VMWriter(None)
+    writer.set_instructions(instructions)
+    return writer.to_text()
+
+
+if "__main__" == __name__:
+    parser = argparse.ArgumentParser(prog="VMBytecode",
+                                     description="Converts .vm files into .vmb bytecode files, or back.")
+    parser.add_argument("paths", nargs="+", help=".vm files to encode, or .vmb files to decode")
+    parser.add_argument("--check", action="store_true",
+                        help="only check that each .vm file survives a round trip through the bytecode")
+    args = parser.parse_args()
+    failed = False
+    for path in args.paths:
+        try:
+            if path.endswith(".vmb"):
+                with open(path[:-1], 'w', newline='') as vm_file:
+                    vm_file.write(to_text(read_file(path)))
+                continue
+            with open(path, 'r', newline='') as vm_file:
+                text = vm_file.read()
+            data = encode(parse_text(text))
+            if args.check:
+                if to_text(decode(data)) != text:
+                    raise ValueError("the round trip changed the text")
+                print(f"{path}: ok ({len(text.encode())} -> {len(data)} bytes)")
+            else:
+                with open(path + "b", 'wb') as bytecode_file:
+                    bytecode_file.write(data)
+        except (OSError, ValueError) as error:
+            print(f"{path}: {error}", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,545 @@
+import argparse
+import os
+import sys
+import time
+import typing
+
+import SourceMap
+import VMBytecode
+import VMWriter
+
+# Hack RAM layout used by the standard VM mapping.
+SP, LCL, ARG, THIS, THAT = 0, 1, 2, 3, 4
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+HEAP_BASE = 2048
+# The stack grows up to the heap; a frame that would cross into it is a stack overflow.
+STACK_END = HEAP_BASE
+HEAP_END = 16384
+MEMORY_SIZE = 32768
+
+POINTER_SEGMENTS = {"local": LCL, "argument": ARG, "this": THIS, "that": THAT}
+
+# Decoded opcodes.
+(PUSH_CONSTANT, PUSH_POINTER_SEGMENT, PUSH_FIXED, POP_POINTER_SEGMENT, POP_FIXED, BINARY, UNARY,
+ LABEL, GOTO, IF_GOTO, CALL, CALL_BUILTIN, FUNCTION, RETURN) = range(14)
+
+
+def to_word(value: int) -> int:
+    """Wraps an integer to a signed 16-bit word."""
+    value &= 0xFFFF
+    return value - 0x10000 if value & 0x8000 else value
+
+
+BINARY_OPS = {
+    "add": lambda x, y: to_word(x + y),
+    "sub": lambda x, y: to_word(x - y),
+    "and": lambda x, y: x & y,
+    "or": lambda x, y: x | y,
+    "eq": lambda x, y: -1 if x == y else 0,
+    "gt": lambda x, y: -1 if x > y else 0,
+    "lt": lambda x, y: -1 if x < y else 0}
+
+UNARY_OPS = {
+    "neg": lambda x: to_word(-x),
+    "not": lambda x: ~x,
+    "shiftleft": lambda x: to_word(x << 1),
+    "shiftright": lambda x: x >> 1}
+
+
+# Text command of each VMWriter opcode, for loading instructions that were not read from text.
+COMMAND_WORDS = {VMWriter.PUSH: "push", VMWriter.POP: "pop", VMWriter.LABEL: "label", VMWriter.GOTO: "goto",
+                 VMWriter.IF_GOTO: "if-goto", VMWriter.CALL: "call", VMWriter.FUNCTION: "function",
+                 VMWriter.RETURN: "return"}
+
+
+def text_commands(text: str) -> typing.Iterator[list]:
+    """Yields the words of each command of VM text, without comments and blank lines."""
+    for line in text.splitlines():
+        line = line.split("//", 1)[0].split()
+        if line:
+            yield line
+
+
+def instruction_commands(instructions: typing.Iterable[typing.Tuple[int, str, int]]) -> typing.List[tuple]:
+    """Returns VMWriter instructions in the form of text_commands, without the raw lines."""
+    # An arithmetic instruction has no command word; its name is the command.
+    return [(COMMAND_WORDS.get(opcode) or name, name, number)
+            for opcode, name, number in instructions if opcode != VMWriter.RAW]
+
+
+class VMError(Exception):
+    """Raised when the program does something the VM cannot execute."""
+
+
+class Halt(Exception):
+    """Raised by Sys.halt and Sys.error to stop the program."""
+
+
+class VMEmulator:
+    """
+    Runs the .vm files of a program and measures their dynamic cost.
+    The machine follows the standard VM mapping onto the Hack RAM (stack at 256, heap at 2048);
+    OS classes that are not part of the program are provided by Python stubs, whose calls are counted
+    but whose instructions are not. Per function it collects the instructions executed, the number of
+    calls and the time spent in the function itself, not counting its callees.
+    """
+
+    def __init__(self, sources: typing.Dict[str, typing.Union[str, typing.Iterable]]) -> None:
+        """
+        Loads a program from a {class name: code} mapping, where the code is VM text or VMWriter
+        (opcode, name, number) instructions.
+        """
+        self.memory = [0] * MEMORY_SIZE
+        self.output = []
+        self.free_pointer = HEAP_BASE
+        self.code = []
+        self.functions = {}
+        self.static_bases = {}
+        # Index in code of the first command of each class.
+        self.class_starts = {}
+        self.builtins = self.os_stubs()
+        self.load(sources)
+        # Executions of each command of code, summed over all runs.
+        self.code_counts = [0] * len(self.code)
+        self.instruction_counts = {}
+        self.call_counts = {}
+        self.function_times = {}
+        self.executed = 0
+
+    @classmethod
+    def from_directory(cls, directory: str, bytecode: bool = False) -> "VMEmulator":
+        """
+        Loads every .vm file of a directory, or a single .vm or .vmb file. If bytecode is set, .vmb files are
+        loaded instead, straight from their instruction records.
+        """
+        if os.path.isdir(directory):
+            paths = [os.path.join(directory, filename) for filename in sorted(os.listdir(directory))]
+        else:
+            paths = [directory]
+            bytecode = bytecode or directory.endswith(".vmb")
+        sources = {}
+        for path in paths:
+            name, extension = os.path.splitext(os.path.basename(path))
+            if extension == ".vm" and not bytecode:
+                with open(path, 'r') as vm_file:
+                    sources[name] = vm_file.read()
+            elif extension == ".vmb" and bytecode:
+                try:
+                    sources[name] = VMBytecode.read_file(path)
+                except ValueError as error:
+                    raise VMError(f"{path}: {error}") from None
+        return cls(sources)
+
+    def load(self, sources: typing.Dict[str, typing.Union[str, typing.Iterable]]) -> None:
+        """Decodes the VM code of every class into one code list, resolving labels and calls."""
+        next_static = STATIC_BASE
+        pending_calls = []
+        for class_name, source in sources.items():
+            static_base = next_static
+            statics = 0
+            self.class_starts[class_name] = len(self.code)
+            labels = {}
+            pending_jumps = []
+            function = None
+            commands = text_commands(source) if isinstance(source, str) else instruction_commands(source)
+            for line in commands:
+                command = line[0]
+                if command in ("push", "pop"):
+                    segment, index = line[1], int(line[2])
+                    if segment == "static":
+                        statics = max(statics, index + 1)
+                        address = static_base + index
+                    elif segment == "temp":
+                        address = TEMP_BASE + index
+                    elif segment == "pointer":
+                        address = THIS + index
+                    else:
+                        address = None
+                    if command == "push":
+                        if segment == "constant":
+                            self.code.append((PUSH_CONSTANT, index))
+                        elif segment in POINTER_SEGMENTS:
+                            self.code.append((PUSH_POINTER_SEGMENT, POINTER_SEGMENTS[segment], index))
+                        else:
+                            self.code.append((PUSH_FIXED, address))
+                    else:
+                        if segment in POINTER_SEGMENTS:
+                            self.code.append((POP_POINTER_SEGMENT, POINTER_SEGMENTS[segment], index))
+                        elif address is not None:
+                            self.code.append((POP_FIXED, address))
+                        else:
+                            raise VMError(f"{class_name}: cannot pop into {segment}")
+                elif command in BINARY_OPS:
+                    self.code.append((BINARY, BINARY_OPS[command]))
+                elif command in UNARY_OPS:
+                    self.code.append((UNARY, UNARY_OPS[command]))
+                elif command == "label":
+                    labels[(function, line[1])] = len(self.code)
+                    self.code.append((LABEL,))
+                elif command in ("goto", "if-goto"):
+                    pending_jumps.append((len(self.code), (function, line[1])))
+                    self.code.append((GOTO if command == "goto" else IF_GOTO, None))
+                elif command == "call":
+                    pending_calls.append((len(self.code), line[1], int(line[2])))
+                    self.code.append(None)
+                elif command == "function":
+                    function = line[1]
+                    self.functions[function] = len(self.code)
+                    self.code.append((FUNCTION, function, int(line[2])))
+                elif command == "return":
+                    self.code.append((RETURN,))
+                else:
+                    raise VMError(f"{class_name}: unknown command {' '.join(map(str, line))}")
+            for position, label in pending_jumps:
+                if label not in labels:
+                    raise VMError(f"{class_name}: unknown label {label[1]} in {label[0]}")
+                self.code[position] = (self.code[position][0], labels[label])
+            self.static_bases[class_name] = static_base
+            next_static += statics
+        for position, name, n_args in pending_calls:
+            if name in self.functions:
+                self.code[position] = (CALL, self.functions[name], n_args, name)
+            elif name in self.builtins:
+                self.code[position] = (CALL_BUILTIN, self.builtins[name], n_args, name)
+            else:
+                raise VMError(f"call to unknown function {name}")
+
+    def run(self, entry: str = None, max_steps: int = 100_000_000) -> None:
+        """Calls the entry function (Sys.init, or else Main.main) and runs until it returns or halts."""
+        if entry is None:
+            entry = "Sys.init" if "Sys.init" in self.functions else "Main.main"
+        if entry not in self.functions:
+            raise VMError(f"the program has no function {entry}")
+        memory = self.memory
+        # Call the entry point with an empty frame whose return address is -1.
+        sp = STACK_BASE
+        memory[sp:sp + 5] = [-1, 0, 0, 0, 0]
+        sp += 5
+        memory[ARG] = sp - 5
+        memory[LCL] = sp
+        memory[SP] = sp
+        counts = [0] * len(self.code)
+        self.call_counts[entry] = self.call_counts.get(entry, 0) + 1
+        try:
+            self.execute(self.functions[entry], counts, [entry], max_steps)
+        except IndexError:
+            raise VMError("stack overflow or memory access out of range") from None
+        finally:
+            self.executed += sum(counts)
+            self.code_counts = [total + count for total, count in zip(self.code_counts, counts)]
+            self.count_by_function(counts)
+
+    def execute(self, pc: int, counts: list, call_stack: list, max_steps: int) -> None:
+        """
+        The interpreter loop. Execution counts are kept per instruction in counts. Time is charged to the
+        function on top of call_stack, and switches to another function on every call and return.
+        """
+        memory = self.memory
+        code = self.code
+        function_times = self.function_times
+        steps = 0
+        last_switch = time.perf_counter()
+        while pc >= 0:
+            steps += 1
+            if steps > max_steps:
+                raise VMError(f"program did not halt within {max_steps} instructions")
+            counts[pc] += 1
+            instruction = code[pc]
+            opcode = instruction[0]
+            pc += 1
+            if opcode == PUSH_CONSTANT:
+                sp = memory[SP]
+                memory[sp] = instruction[1]
+                memory[SP] = sp + 1
+            elif opcode == PUSH_POINTER_SEGMENT:
+                sp = memory[SP]
+                memory[sp] = memory[(memory[instruction[1]] + instruction[2]) & 0x7FFF]
+                memory[SP] = sp + 1
+            elif opcode == PUSH_FIXED:
+                sp = memory[SP]
+                memory[sp] = memory[instruction[1]]
+                memory[SP] = sp + 1
+            elif opcode == POP_POINTER_SEGMENT:
+                sp = memory[SP] - 1
+                memory[(memory[instruction[1]] + instruction[2]) & 0x7FFF] = memory[sp]
+                memory[SP] = sp
+            elif opcode == POP_FIXED:
+                sp = memory[SP] - 1
+                memory[instruction[1]] = memory[sp]
+                memory[SP] = sp
+            elif opcode == BINARY:
+                sp = memory[SP] - 1
+                memory[sp - 1] = instruction[1](memory[sp - 1], memory[sp])
+                memory[SP] = sp
+            elif opcode == UNARY:
+                sp = memory[SP]
+                memory[sp - 1] = instruction[1](memory[sp - 1])
+            elif opcode == LABEL:
+                pass
+            elif opcode == GOTO:
+                pc = instruction[1]
+            elif opcode == IF_GOTO:
+                sp = memory[SP] - 1
+                memory[SP] = sp
+                if memory[sp] != 0:
+                    pc = instruction[1]
+            elif opcode == FUNCTION:
+                sp = memory[SP]
+                n_locals = instruction[2]
+                if sp + n_locals > STACK_END:
+                    raise VMError("stack overflow")
+                memory[sp:sp + n_locals] = [0] * n_locals
+                memory[SP] = sp + n_locals
+            elif opcode == CALL:
+                _, target, n_args, name = instruction
+                sp = memory[SP]
+                if sp + 5 > STACK_END:
+                    raise VMError("stack overflow")
+                memory[sp:sp + 5] = [pc, memory[LCL], memory[ARG], memory[THIS], memory[THAT]]
+                memory[ARG] = sp - n_args
+                memory[LCL] = memory[SP] = sp + 5
+                pc = target
+                self.call_counts[name] = self.call_counts.get(name, 0) + 1
+                now = time.perf_counter()
+                caller = call_stack[-1]
+                function_times[caller] = function_times.get(caller, 0.0) + now - last_switch
+                last_switch = now
+                call_stack.append(name)
+            elif opcode == CALL_BUILTIN:
+                _, stub, n_args, name = instruction
+                sp = memory[SP] - n_args
+                self.call_counts[name] = self.call_counts.get(name, 0) + 1
+                try:
+                    result = stub(*memory[sp:sp + n_args])
+                except Halt:
+                    break
+                memory[sp] = 0 if result is None else to_word(result)
+                memory[SP] = sp + 1
+            elif opcode == RETURN:
+                frame = memory[LCL]
+                if not 5 <= frame <= MEMORY_SIZE:
+                    raise VMError(f"return from {call_stack[-1]} with a corrupted frame pointer (LCL = {frame})")
+                return_address = memory[frame - 5]
+                memory[memory[ARG]] = memory[memory[SP] - 1]
+                memory[SP] = memory[ARG] + 1
+                memory[THAT], memory[THIS], memory[ARG], memory[LCL] = memory[frame - 1:frame - 5:-1]
+                pc = return_address
+                now = time.perf_counter()
+                name = call_stack.pop()
+                function_times[name] = function_times.get(name, 0.0) + now - last_switch
+                last_switch = now
+        if call_stack:
+            name = call_stack[-1]
+            function_times[name] = function_times.get(name, 0.0) + time.perf_counter() - last_switch
+
+    def count_by_function(self, counts: list) -> None:
+        """Adds the per-instruction execution counts to the per-function totals."""
+        starts = sorted((position, name) for name, position in self.functions.items())
+        for index, (position, name) in enumerate(starts):
+            end = starts[index + 1][0] if index + 1 < len(starts) else len(counts)
+            total = sum(counts[position:end])
+            if total:
+                self.instruction_counts[name] = self.instruction_counts.get(name, 0) + total
+
+    def count_by_line(self, source_maps: typing.Dict[str, typing.Tuple[str, list]]) -> typing.Dict[tuple, int]:
+        """
+        Rolls the executed commands up into (source file, line) totals, using the source maps of the
+        classes, keyed by class name as SourceMap.load returns them. Classes without a map are left out.
+        """
+        lines = {}
+        for class_name, (source, mappings) in source_maps.items():
+            start = self.class_starts.get(class_name)
+            if start is None or not mappings:
+                continue
+            end = min((position for position in self.class_starts.values() if position > start),
+                      default=len(self.code))
+            bounds = [mapping[0] for mapping in mappings[1:]] + [end - start]
+            for (index, line, _), next_index in zip(mappings, bounds):
+                total = sum(self.code_counts[start + index:start + next_index])
+                if total:
+                    lines[(source, line)] = lines.get((source, line), 0) + total
+        return lines
+
+    def result(self) -> int:
+        """Returns the value the entry function returned."""
+        return self.memory[STACK_BASE]
+
+    def alloc(self, size: int) -> int:
+        if size < 0:
+            raise VMError("Memory.alloc: negative size")
+        address = self.free_pointer
+        self.free_pointer += max(size, 1)
+        if self.free_pointer > HEAP_END:
+            raise VMError("Memory.alloc: heap overflow")
+        return address
+
+    def string_value(self, address: int) -> str:
+        length = self.memory[address + 1]
+        return "".join(chr(self.memory[address + 2 + i]) for i in range(length))
+
+    def os_stubs(self) -> dict:
+        """Returns the Python stubs of the OS functions, by VM name."""
+        memory = self.memory
+
+        def divide(x, y):
+            if y == 0:
+                raise VMError("Math.divide: division by zero")
+            quotient = abs(x) // abs(y)
+            return quotient if (x < 0) == (y < 0) else -quotient
+
+        def string_new(max_length):
+            address = self.alloc(max_length + 2)
+            memory[address] = max_length
+            memory[address + 1] = 0
+            return address
+
+        def append_char(address, char):
+            length = memory[address + 1]
+            if length >= memory[address]:
+                raise VMError("String.appendChar: string is full")
+            memory[address + 2 + length] = char
+            memory[address + 1] = length + 1
+            return address
+
+        def set_char_at(address, index, char):
+            memory[address + 2 + index] = char
+
+        def erase_last_char(address):
+            memory[address + 1] = max(memory[address + 1] - 1, 0)
+
+        def int_value(address):
+            text = self.string_value(address)
+            digits = text[1:] if text.startswith("-") else text
+            value = 0
+            for char in digits:
+                if not char.isdigit():
+                    break
+                value = value * 10 + int(char)
+            return -value if text.startswith("-") else value
+
+        def set_int(address, value):
+            memory[address + 1] = 0
+            for char in str(value):
+                append_char(address, ord(char))
+
+        def write(text):
+            self.output.append(text)
+
+        def nothing(*args):
+            return 0
+
+        def halt():
+            raise Halt()
+
+        def error(code):
+            write(f"ERR{code}")
+            halt()
+
+        return {
+            "Math.multiply": lambda x, y: x * y,
+            "Math.divide": divide,
+            "Math.min": min,
+            "Math.max": max,
+            "Math.abs": abs,
+            "Math.sqrt": lambda x: int(max(x, 0) ** 0.5),
+            "Math.init": nothing,
+            "Memory.alloc": self.alloc,
+            "Memory.deAlloc": nothing,
+            "Memory.peek": lambda address: memory[address & 0x7FFF],
+            "Memory.poke": lambda address, value: memory.__setitem__(address & 0x7FFF, value),
+            "Memory.init": nothing,
+            "Array.new": self.alloc,
+            "Array.dispose": nothing,
+            "String.new": string_new,
+            "String.dispose": nothing,
+            "String.length": lambda address: memory[address + 1],
+            "String.charAt": lambda address, index: memory[address + 2 + index],
+            "String.setCharAt": set_char_at,
+            "String.appendChar": append_char,
+            "String.eraseLastChar": erase_last_char,
+            "String.intValue": int_value,
+            "String.setInt": set_int,
+            "String.backSpace": lambda: 129,
+            "String.doubleQuote": lambda: 34,
+            "String.newLine": lambda: 128,
+            "Output.printString": lambda address: write(self.string_value(address)),
+            "Output.printInt": lambda value: write(str(value)),
+            "Output.printChar": lambda char: write(chr(char)),
+            "Output.println": lambda: write("\n"),
+            "Output.backSpace": nothing,
+            "Output.moveCursor": nothing,
+            "Output.init": nothing,
+            "Screen.clearScreen": nothing,
+            "Screen.setColor": nothing,
+            "Screen.drawPixel": nothing,
+            "Screen.drawLine": nothing,
+            "Screen.drawRectangle": nothing,
+            "Screen.drawCircle": nothing,
+            "Screen.init": nothing,
+            "Keyboard.keyPressed": nothing,
+            "Keyboard.readChar": nothing,
+            "Keyboard.readLine": lambda message: string_new(0),
+            "Keyboard.readInt": nothing,
+            "Keyboard.init": nothing,
+            "Sys.wait": nothing,
+            "Sys.halt": halt,
+            "Sys.error": error,
+        }
+
+    def print_report(self, top: int = None) -> None:
+        """Prints the per-function instruction counts, call counts and times, most instructions first."""
+        names = sorted(set(self.instruction_counts) | set(self.call_counts),
+                       key=lambda name: (-self.instruction_counts.get(name, 0), name))
+        print(f"{'function':<40}{'instructions':>14}{'calls':>10}{'time':>12}")
+        for name in names[:top]:
+            time_spent = f"{self.function_times[name] * 1000:.2f} ms" if name in self.function_times else "os stub"
+            print(f"{name:<40}{self.instruction_counts.get(name, 0):>14}{self.call_counts.get(name, 0):>10}"
+                  f"{time_spent:>12}")
+        print(f"{self.executed} instruction(s) executed, {sum(self.call_counts.values())} call(s)")
+
+    def print_line_report(self, source_maps: typing.Dict[str, typing.Tuple[str, list]], top: int = None) -> None:
+        """Prints the instructions executed per Jack source line, most first."""
+        lines = self.count_by_line(source_maps)
+        print(f"{'line':<40}{'instructions':>14}")
+        for (source, line), total in sorted(lines.items(), key=lambda item: (-item[1], item[0]))[:top]:
+            print(f"{source + ':' + str(line):<40}{total:>14}")
+
+
+def read_source_maps(path: str) -> typing.Dict[str, typing.Tuple[str, list]]:
+    """Reads the source maps next to the .vm files of a directory, or next to a single .vm or .vmb file."""
+    if os.path.isdir(path):
+        paths = [os.path.join(path, filename) for filename in sorted(os.listdir(path)) if filename.endswith(".vm")]
+    else:
+        paths = [os.path.splitext(path)[0] + ".vm"]
+    return {os.path.splitext(os.path.basename(vm_path))[0]: SourceMap.load(SourceMap.source_map_path(vm_path))
+            for vm_path in paths if os.path.exists(SourceMap.source_map_path(vm_path))}
+
+
+if "__main__" == __name__:
+    parser = argparse.ArgumentParser(prog="VMEmulator",
+                                     description="Runs the .vm files of a compiled program and reports its cost.")
+    parser.add_argument("path", help="a directory of .vm files or a single .vm or .vmb file")
+    parser.add_argument("--bytecode", action="store_true",
+                        help="load the .vmb files that JackCompiler --bytecode writes instead of the .vm files")
+    parser.add_argument("--entry", help="function to start from (default: Sys.init if defined, else Main.main)")
+    parser.add_argument("--max-steps", type=int, default=100_000_000,
+                        help="stop with an error after this many instructions")
+    parser.add_argument("--top", type=int, help="only report the functions that executed the most instructions")
+    parser.add_argument("--lines", action="store_true",
+                        help="also report the instructions executed per Jack line, from the source maps that "
+                             "JackCompiler --source-map writes")
+    args = parser.parse_args()
+    try:
+        emulator = VMEmulator.from_directory(args.path, args.bytecode)
+        source_maps = read_source_maps(args.path) if args.lines else {}
+        emulator.run(args.entry, args.max_steps)
+    except (VMError, ValueError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        sys.exit(1)
+    if emulator.output:
+        print("".join(emulator.output))
+    emulator.print_report(args.top)
+    if args.lines:
+        emulator.print_line_report(source_maps, args.top)
@@ -1,50 +1,111 @@
 import typing
 
+# Opcodes of the buffered VM instructions. RAW holds a verbatim line (used for comments).
+PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN, RAW = range(10)
+
+# Text form of each opcode; {0} is the name operand and {1} the numeric operand.
+FORMATS = ("push {0} {1}\n", "pop {0} {1}\n", "{0}\n", "label {0}\n", "goto {0}\n",
+           "if-goto {0}\n", "call {0} {1}\n", "function {0} {1}\n", "return\n", "{0}\n")
+
+
+def to_word(value: int) -> int:
+    """Wraps an integer to a signed 16-bit word."""
+    value &= 0xFFFF
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def push_word(value: int) -> list:
+    """Returns the shortest instructions that push the given 16-bit value."""
+    if value >= 0:
+        return [(PUSH, "constant", value)]
+    if value == -32768:
+        return [(PUSH, "constant", 32767), (ARITHMETIC, "not", 0)]
+    return [(PUSH, "constant", -value), (ARITHMETIC, "neg", 0)]
+
 
 class VMWriter:
     """
     Writes VM commands into a file.
+    Commands are recorded in an instruction buffer of (opcode, name, number) tuples and serialized with
+    a single write when flush() is called, so passes can inspect and rewrite the instructions before
+    any text is produced.
     """
 
     def __init__(self, output_stream: typing.TextIO) -> None:
         """Creates a new file and prepares it for writing VM commands."""
         self.output_stream = output_stream
+        self.instructions = []
+
+    def set_instructions(self, instructions: typing.Iterable[typing.Tuple[int, str, int]]) -> None:
+        """Replaces the buffered instructions, e.g. with the output of an optimization pass."""
+        self.instructions = list(instructions)
+
+    def to_text(self) -> str:
+        """Serializes the buffered instructions into VM text."""
+        # Most instructions repeat within a class, so each distinct one is only formatted once.
+        lines = {}
+        get_line = lines.get
+        return "".join([get_line(instruction) or
+                        lines.setdefault(instruction, FORMATS[instruction[0]].format(instruction[1], instruction[2]))
+                        for instruction in self.instructions])
+
+    def flush(self) -> None:
+        """
+        Writes the whole buffer to the output stream with one write and empties it.
+        A writer without an output stream keeps its buffer, e.g. for whole-program passes.
+        """
+        if self.output_stream is None:
+            return
+        self.output_stream.write(self.to_text())
+        self.instructions = []
 
     def write_to_file(self, command):
-        self.output_stream.write(command + '\n')
+        self.instructions.append((RAW, command, 0))
+
+    def write_marker(self, command: str, token_index: int) -> None:
+        """
+        Writes a comment line that also marks where the code of a source token starts: its number is the
+        token index + 1, or 0 if there is no token. Passes keep comment lines in place, so the source map
+        can be built from the final code.
+        """
+        self.instructions.append((RAW, command, token_index + 1))
 
     def write_push(self, segment: str, index: int) -> None:
         """Writes a VM push command."""
-        self.write_to_file(f"push {segment} {index}")
+        self.instructions.append((PUSH, segment, index))
+
+    def write_constant(self, value: int) -> None:
+        """Writes the shortest VM commands that push a 16-bit value, which may be negative."""
+        self.instructions += push_word(value)
 
     def write_pop(self, segment: str, index: int) -> None:
         """Writes a VM pop command."""
-        self.write_to_file(f"pop {segment} {index}")
+        self.instructions.append((POP, segment, index))
 
     def write_arithmetic(self, command: str) -> None:
         """Writes a VM arithmetic command."""
-        self.write_to_file(command)
+        self.instructions.append((ARITHMETIC, command, 0))
 
     def write_label(self, label: str) -> None:
         """Writes a VM label command."""
-        self.write_to_file(f"label {label}")
+        self.instructions.append((LABEL, label, 0))
 
     def write_goto(self, label: str) -> None:
         """Writes a VM goto command."""
-        self.write_to_file(f"goto {label}")
+        self.instructions.append((GOTO, label, 0))
 
     def write_if(self, label: str) -> None:
         """Writes a VM if-goto command."""
-        self.write_to_file(f"if-goto {label}")
+        self.instructions.append((IF_GOTO, label, 0))
 
     def write_call(self, name: str, n_args: int) -> None:
         """Writes a VM call command."""
-        self.write_to_file(f"call {name} {n_args}")
+        self.instructions.append((CALL, name, n_args))
 
     def write_function(self, name: str, n_locals: int) -> None:
         """Writes a VM function command."""
-        self.write_to_file(f"function {name} {n_locals}")
+        self.instructions.append((FUNCTION, name, n_locals))
 
     def write_return(self) -> None:
         """Writes a VM return command."""
-        self.write_to_file("return")
+        self.instructions.append((RETURN, "", 0))
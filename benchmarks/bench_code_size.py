@@ -0,0 +1,156 @@
+"""
+Tracks the size of the generated code on the fixed Jack corpus in benchmarks/corpus.
+
+Every class is compiled with each configuration below, and for every subroutine the VM instruction count,
+call count, label count and Hack instruction count (as HackBackend translates it, without the shared
+routines it emits once per program) are recorded. These are compared against the checked-in baseline,
+benchmarks/code_size_baseline.json, and the run fails if any metric of any subroutine, or any total, grows
+by more than the threshold. After a deliberate change, --update rewrites the baseline so that the change
+shows up in the commit; --history appends the totals of each run, with the current commit, to a file.
+Usage: python benchmarks/bench_code_size.py [--threshold PERCENT] [--update] [--history sizes.jsonl]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ClassIndex import ClassIndex
+from CompilationEngine import CompilationEngine
+from DeadFunctionEliminator import split_functions
+from HackBackend import HackBackend
+from JackTokenizer import JackTokenizer
+from VMWriter import LABEL, CALL, RAW
+
+CORPUS = os.path.join(ROOT, "benchmarks", "corpus")
+BASELINE = os.path.join(ROOT, "benchmarks", "code_size_baseline.json")
+
+METRICS = ("vm_instructions", "calls", "labels", "hack_instructions")
+
+# CompilationEngine options of each measured configuration.
+CONFIGURATIONS = {
+    "default": {},
+    "optimized": {"optimize": True, "fold_constants": True, "pool_strings": True, "fast_arrays": True,
+                  "direct_branches": True, "hoist_invariants": True},
+}
+
+
+def hack_instructions(class_name: str, instructions: list) -> int:
+    """Returns the number of Hack instructions HackBackend translates a function into, not counting labels."""
+    backend = HackBackend()
+    backend.class_name = class_name
+    for instruction in instructions:
+        backend.write_instruction(*instruction)
+    return sum(1 for line in "".join(backend.lines).split("\n") if line and not line.startswith("("))
+
+
+def measure(corpus: str, options: dict) -> dict:
+    """Compiles every class of the corpus with the given options. Returns the metrics of each subroutine."""
+    class_index = ClassIndex.from_directory(corpus)
+    subroutines = {}
+    for filename in sorted(os.listdir(corpus)):
+        if not filename.endswith(".jack"):
+            continue
+        with open(os.path.join(corpus, filename)) as input_file:
+            tokenizer = JackTokenizer(input_file)
+        # Without an output stream the engine keeps its instruction buffer instead of writing it.
+        engine = CompilationEngine(tokenizer, None, class_index=class_index, **options)
+        engine.compile_class()
+        instructions = engine.vm_writer.instructions
+        for name, start, end in split_functions(instructions):
+            code = [instruction for instruction in instructions[start:end] if instruction[0] != RAW]
+            subroutines[name] = {
+                "vm_instructions": len(code),
+                "calls": sum(instruction[0] == CALL for instruction in code),
+                "labels": sum(instruction[0] == LABEL for instruction in code),
+                "hack_instructions": hack_instructions(engine.class_name, code)}
+    return subroutines
+
+
+def totals(subroutines: dict) -> dict:
+    return {metric: sum(metrics[metric] for metrics in subroutines.values()) for metric in METRICS}
+
+
+def growth(value: int, old: int) -> float:
+    """Returns the growth from old to value in percent; any growth from 0 counts as 100%."""
+    if old == 0:
+        return 100.0 if value else 0.0
+    return (value - old) / old * 100
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """
+    Prints the totals of every configuration against the baseline and every subroutine metric that grew by
+    more than threshold percent. Returns False if one did.
+    """
+    passed = True
+    print(f"{'':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for configuration, subroutines in results.items():
+        old_subroutines = baseline.get(configuration)
+        if old_subroutines is None:
+            print(f"{configuration}: not in the baseline")
+            continue
+        current, old = totals(subroutines), totals(old_subroutines)
+        for metric in METRICS:
+            change = growth(current[metric], old[metric])
+            regressed = change > threshold
+            passed = passed and not regressed
+            print(f"{configuration + ' ' + metric:<28}{old[metric]:>12}{current[metric]:>12}{change:>+9.1f}%"
+                  f"{'  REGRESSION' if regressed else ''}")
+        for name in sorted(set(subroutines) | set(old_subroutines)):
+            if name not in old_subroutines:
+                print(f"  {name}: new subroutine")
+            elif name not in subroutines:
+                print(f"  {name}: no longer compiled")
+            else:
+                for metric in METRICS:
+                    value, old_value = subroutines[name][metric], old_subroutines[name][metric]
+                    if growth(value, old_value) > threshold:
+                        passed = False
+                        print(f"  REGRESSION {name} {metric}: {old_value} -> {value}")
+    return passed
+
+
+def current_commit() -> str:
+    """Returns the commit the working tree is at, or "" outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compares the size of the generated code against a baseline.")
+    parser.add_argument("--corpus", default=CORPUS, help="directory of .jack files to compile")
+    parser.add_argument("--baseline", default=BASELINE, help="the baseline to compare against or --update")
+    parser.add_argument("--threshold", type=float, default=0.0,
+                        help="growth of a metric, in percent, that counts as a regression (default: 0, any growth)")
+    parser.add_argument("--update", action="store_true", help="write the current sizes as the new baseline")
+    parser.add_argument("--history", metavar="FILE",
+                        help="append the totals of this run, with the current commit, to FILE as a JSON line")
+    args = parser.parse_args()
+
+    results = {configuration: measure(args.corpus, options) for configuration, options in CONFIGURATIONS.items()}
+    if args.history:
+        with open(args.history, 'a') as history_file:
+            history_file.write(json.dumps({"commit": current_commit(),
+                                           "totals": {configuration: totals(subroutines)
+                                                      for configuration, subroutines in results.items()}}) + "\n")
+    if args.update:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"wrote the sizes of {sum(map(len, results.values()))} subroutine(s) to {args.baseline}")
+        return
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if not compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
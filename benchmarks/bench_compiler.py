@@ -0,0 +1,131 @@
+"""
+Benchmarks compiler throughput on a synthetic corpus from generate_corpus.py.
+
+Tokenization, parsing/codegen and output writing are timed separately for every class, and peak memory
+is measured in a separate pass with tracemalloc, which would otherwise slow down the timed runs.
+Results are saved as JSON; with --baseline they are compared against an earlier run.
+Usage: python benchmarks/bench_compiler.py [--output results.json] [--baseline results.json] [--repeats N]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CompilationEngine import CompilationEngine
+from JackTokenizer import JackTokenizer
+from generate_corpus import generate_corpus
+
+PHASES = ("tokenize", "compile", "write")
+
+
+def compile_once(paths: list, output_directory: str) -> dict:
+    """Compiles every class once and returns the CPU time spent in each phase."""
+    times = dict.fromkeys(PHASES, 0.0)
+    for path in paths:
+        start = time.process_time()
+        with open(path) as input_file:
+            tokenizer = JackTokenizer(input_file)
+        tokenized = time.process_time()
+        # Without an output stream the engine keeps its instruction buffer instead of writing it.
+        engine = CompilationEngine(tokenizer, None)
+        engine.compile_class()
+        compiled = time.process_time()
+        output_path = os.path.join(output_directory, os.path.basename(path)[:-len(".jack")] + ".vm")
+        with open(output_path, 'w') as output_file:
+            output_file.write(engine.vm_writer.to_text())
+        written = time.process_time()
+        times["tokenize"] += tokenized - start
+        times["compile"] += compiled - tokenized
+        times["write"] += written - compiled
+    return times
+
+
+def peak_memory(paths: list, output_directory: str) -> int:
+    """Returns the largest amount of memory, in bytes, allocated while compiling any single class."""
+    peak = 0
+    for path in paths:
+        tracemalloc.start()
+        compile_once([path], output_directory)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak
+
+
+def run(args: argparse.Namespace) -> dict:
+    """Generates the corpus, runs the benchmark and returns the results."""
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_corpus(directory, args.classes, args.subroutines, seed=args.seed)
+        source_bytes = sum(os.path.getsize(path) for path in paths)
+        compile_once(paths, directory)
+        runs = [compile_once(paths, directory) for _ in range(args.repeats)]
+        memory = peak_memory(paths, directory)
+        output_bytes = sum(os.path.getsize(path[:-len(".jack")] + ".vm") for path in paths)
+    phases = {}
+    for phase in PHASES + ("total",):
+        samples = [sum(times.values()) if phase == "total" else times[phase] for times in runs]
+        phases[phase] = {"best": min(samples), "median": statistics.median(samples)}
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "classes": args.classes, "subroutines": args.subroutines, "seed": args.seed,
+                 "repeats": args.repeats, "source_bytes": source_bytes, "output_bytes": output_bytes},
+        "phases": phases,
+        "peak_memory": memory,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Prints the change of every measurement against the baseline. Returns False if one regressed."""
+    if results["meta"]["source_bytes"] != baseline["meta"]["source_bytes"]:
+        print("warning: the baseline was measured on a different corpus")
+    passed = True
+    rows = [(f"{phase} (best)", results["phases"][phase]["best"], baseline["phases"][phase]["best"])
+            for phase in PHASES + ("total",)]
+    rows.append(("peak memory", results["peak_memory"], baseline["peak_memory"]))
+    for name, value, old in rows:
+        change = (value - old) / old * 100 if old else 0.0
+        regressed = change > threshold
+        passed = passed and not regressed
+        print(f"{name:<16}{old:>14.6g}{value:>14.6g}{change:>+9.1f}%{'  REGRESSION' if regressed else ''}")
+    return passed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the compiler on a synthetic Jack corpus.")
+    parser.add_argument("--classes", type=int, default=20)
+    parser.add_argument("--subroutines", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percentage slowdown against the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    results = run(args)
+    meta = results["meta"]
+    print(f"{meta['classes']} classes, {meta['source_bytes'] / 1e6:.2f} MB of source, "
+          f"{meta['output_bytes'] / 1e6:.2f} MB of VM code, best of {meta['repeats']} runs")
+    for phase in PHASES + ("total",):
+        best = results["phases"][phase]["best"]
+        print(f"{phase:<10}{best * 1000:10.1f} ms   {meta['source_bytes'] / best / 1e6:6.2f} MB/s")
+    print(f"peak memory per class: {results['peak_memory'] / 1e6:.2f} MB")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"\n{'':<16}{'baseline':>14}{'current':>14}{'change':>10}")
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmarks the VMWriter write path on a large generated class.
+
+The VM commands the engine issues for the class are recorded once and then replayed into the
+buffered VMWriter and into a writer that formats and writes every command on its own, the way
+VMWriter used to. Usage: python benchmarks/bench_vmwriter.py [subroutines] [repeats]
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CompilationEngine import CompilationEngine
+from JackTokenizer import JackTokenizer
+from VMWriter import VMWriter
+
+WRITE_METHODS = ("write_to_file", "write_push", "write_constant", "write_pop", "write_arithmetic", "write_label",
+                 "write_goto", "write_if", "write_call", "write_function", "write_return")
+
+
+class PerCommandWriter:
+    """The previous write path: one f-string and one output_stream.write call per command."""
+
+    def __init__(self, output_stream):
+        self.output_stream = output_stream
+
+    def write_to_file(self, command):
+        self.output_stream.write(command + '\n')
+
+    def write_push(self, segment, index):
+        self.write_to_file(f"push {segment} {index}")
+
+    def write_constant(self, value):
+        if value < 0:
+            self.write_push("constant", -value)
+            self.write_arithmetic("neg")
+        else:
+            self.write_push("constant", value)
+
+    def write_pop(self, segment, index):
+        self.write_to_file(f"pop {segment} {index}")
+
+    def write_arithmetic(self, command):
+        self.write_to_file(command)
+
+    def write_label(self, label):
+        self.write_to_file(f"label {label}")
+
+    def write_goto(self, label):
+        self.write_to_file(f"goto {label}")
+
+    def write_if(self, label):
+        self.write_to_file(f"if-goto {label}")
+
+    def write_call(self, name, n_args):
+        self.write_to_file(f"call {name} {n_args}")
+
+    def write_function(self, name, n_locals):
+        self.write_to_file(f"function {name} {n_locals}")
+
+    def write_return(self):
+        self.write_to_file("return")
+
+    def flush(self):
+        pass
+
+
+class NullWriter:
+    """Discards every command; measures the cost of replaying the calls themselves."""
+
+    def __init__(self, output_stream):
+        pass
+
+    def flush(self):
+        pass
+
+
+for _method in WRITE_METHODS:
+    setattr(NullWriter, _method, lambda self, *args: None)
+
+
+class RecordingWriter:
+    """Records the write_* calls the engine makes, so they can be replayed into other writers."""
+
+    def __init__(self):
+        self.calls = []
+        for method in WRITE_METHODS:
+            setattr(self, method, self.recorder(method))
+
+    def recorder(self, method):
+        return lambda *args: self.calls.append((method, args))
+
+    def flush(self):
+        pass
+
+
+def large_class(subroutines: int) -> str:
+    """Returns the source of a class with many string-heavy subroutines."""
+    lines = ["class Big {", "    field int a, b;"]
+    for i in range(subroutines):
+        lines += [f"    method int f{i}(int x) {{",
+                  "        var int i;",
+                  "        let i = 0;",
+                  "        while (i < x) {",
+                  f'            do Output.printString("subroutine {i} prints a fairly long message");',
+                  "            let a = (a + i) * (b - x);",
+                  "            let i = i + 1;",
+                  "        }",
+                  "        return a;",
+                  "    }"]
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def record(source: str) -> list:
+    """Compiles source and returns the writer calls made by the engine."""
+    engine = CompilationEngine(JackTokenizer(io.StringIO(source)), io.StringIO())
+    engine.vm_writer = RecordingWriter()
+    engine.compile_class()
+    return engine.vm_writer.calls
+
+
+def replay(writer_class, calls: list, path: str) -> float:
+    """Replays the calls into a writer over a real file and returns the CPU time it took."""
+    start = time.process_time()
+    with open(path, 'w') as output_file:
+        writer = writer_class(output_file)
+        for method, args in calls:
+            getattr(writer, method)(*args)
+        writer.flush()
+    return time.process_time() - start
+
+
+def main() -> None:
+    subroutines = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    calls = record(large_class(subroutines))
+    writers = (NullWriter, PerCommandWriter, VMWriter)
+    best = dict.fromkeys(writers, float("inf"))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "Big.vm")
+        outputs = {}
+        # Interleave the writers so that noise from other processes affects all of them alike.
+        for _ in range(repeats):
+            for writer_class in writers:
+                best[writer_class] = min(best[writer_class], replay(writer_class, calls, path))
+                with open(path) as output_file:
+                    outputs[writer_class] = output_file.read()
+    assert outputs[VMWriter] == outputs[PerCommandWriter], "buffered output differs from per-command output"
+    overhead, per_command, buffered = best[NullWriter], best[PerCommandWriter], best[VMWriter]
+    print(f"{len(calls)} commands, best of {repeats}")
+    print(f"replay overhead:    {overhead * 1000:8.2f} ms (included below)")
+    print(f"per-command writes: {per_command * 1000:8.2f} ms")
+    print(f"buffered VMWriter:  {buffered * 1000:8.2f} ms  ({per_command / buffered:.2f}x)")
+    print(f"write path only:    {(per_command - overhead) / max(buffered - overhead, 1e-9):.2f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Generates a seeded corpus of large, valid Jack classes for compiler benchmarks.
+
+Each class has many fields and statics, and subroutines with deep expressions, long string literals,
+array accesses, calls and nested if/while statements. The same seed always produces the same corpus.
+Usage: python benchmarks/generate_corpus.py <output dir> [--classes N] [--subroutines N] [--seed N]
+"""
+import argparse
+import os
+import random
+
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet",
+         "kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango")
+
+BINARY_OPS = ("+", "-", "*", "/", "&", "|", "<", ">", "=")
+
+
+class ClassGenerator:
+    """Writes the source of one random class. Only variables in scope and existing subroutines are used."""
+
+    def __init__(self, rng: random.Random, class_name: str, fields: int, subroutines: int,
+                 max_depth: int, string_length: int) -> None:
+        self.rng = rng
+        self.class_name = class_name
+        self.fields = [f"field{i}" for i in range(fields)]
+        self.statics = [f"static{i}" for i in range(max(fields // 4, 1))]
+        self.subroutines = subroutines
+        self.max_depth = max_depth
+        self.string_length = string_length
+        self.lines = []
+        # (name, number of arguments, is method) of the subroutines written so far.
+        self.callable = []
+        self.scope = []
+        self.locals = []
+        self.counters = []
+        self.arrays = []
+        self.in_method = False
+
+    def emit(self, depth: int, text: str) -> None:
+        self.lines.append("    " * depth + text)
+
+    def string_literal(self) -> str:
+        words = []
+        while len(" ".join(words)) < self.string_length:
+            words.append(self.rng.choice(WORDS))
+        return '"' + " ".join(words)[:self.string_length] + '"'
+
+    def variable(self) -> str:
+        return self.rng.choice(self.scope)
+
+    def assignable(self) -> str:
+        return self.rng.choice([name for name in self.scope if name not in self.counters])
+
+    def call(self, depth: int) -> str:
+        name, n_args, is_method = self.rng.choice(self.callable)
+        args = ", ".join(self.expression(depth + 1) for _ in range(n_args))
+        if is_method:
+            return f"{name}({args})"
+        return f"{self.class_name}.{name}({args})"
+
+    def term(self, depth: int) -> str:
+        choice = self.rng.random()
+        if depth >= self.max_depth or choice < 0.35:
+            return self.rng.choice([self.variable(), self.variable(), str(self.rng.randint(0, 32767)),
+                                    str(self.rng.randint(0, 16)), "true", "false", "null"])
+        if choice < 0.5:
+            return f"{self.rng.choice(self.arrays)}[{self.expression(depth + 1)}]"
+        if choice < 0.6:
+            return self.rng.choice("-~") + self.term(depth + 1)
+        if choice < 0.7 and self.callable:
+            return self.call(depth)
+        return f"({self.expression(depth + 1)})"
+
+    def expression(self, depth: int) -> str:
+        terms = [self.term(depth)]
+        for _ in range(self.rng.randint(0, 2)):
+            terms += [self.rng.choice(BINARY_OPS), self.term(depth)]
+        return " ".join(terms)
+
+    def statements(self, depth: int, nesting: int) -> None:
+        for _ in range(self.rng.randint(3, 7)):
+            choice = self.rng.random()
+            if choice < 0.35:
+                self.emit(depth, f"let {self.assignable()} = {self.expression(0)};")
+            elif choice < 0.45:
+                self.emit(depth, f"let {self.rng.choice(self.arrays)}[{self.expression(1)}] = {self.expression(0)};")
+            elif choice < 0.55:
+                self.emit(depth, f"do Output.printString({self.string_literal()});")
+            elif choice < 0.65 and self.callable:
+                self.emit(depth, f"do {self.call(0)};")
+            elif choice < 0.8 and nesting > 0:
+                self.emit(depth, f"if ({self.expression(0)}) {{")
+                self.statements(depth + 1, nesting - 1)
+                if self.rng.random() < 0.5:
+                    self.emit(depth, "} else {")
+                    self.statements(depth + 1, nesting - 1)
+                self.emit(depth, "}")
+            elif nesting > 0 and len(self.counters) < len(self.locals):
+                # Each loop gets its own counter, which the loop body never assigns, so loops terminate.
+                counter = self.rng.choice([local for local in self.locals if local not in self.counters])
+                self.counters.append(counter)
+                self.emit(depth, f"let {counter} = 0;")
+                self.emit(depth, f"while ({counter} < {self.rng.randint(2, 10)}) {{")
+                self.statements(depth + 1, nesting - 1)
+                self.emit(depth + 1, f"let {counter} = {counter} + 1;")
+                self.emit(depth, "}")
+                self.counters.pop()
+            else:
+                self.emit(depth, f"let {self.assignable()} = {self.expression(0)};")
+
+    def subroutine(self, index: int) -> None:
+        kind = self.rng.choice(["function", "method", "method"])
+        self.in_method = kind == "method"
+        name = f"{kind[0]}{index}"
+        arguments = [f"arg{i}" for i in range(self.rng.randint(0, 4))]
+        self.locals = [f"local{i}" for i in range(self.rng.randint(1, 6))]
+        self.scope = arguments + self.locals + self.statics + (self.fields if self.in_method else [])
+        self.arrays = ["buffer"] + (["table"] if self.in_method else [])
+        parameters = ", ".join(f"int {argument}" for argument in arguments)
+        self.emit(1, f"{kind} int {name}({parameters}) {{")
+        self.emit(2, f"var int {', '.join(self.locals)};")
+        self.emit(2, "var Array buffer;")
+        self.emit(2, f"let buffer = Array.new({self.rng.randint(8, 64)});")
+        callable_before = self.callable
+        if not self.in_method:
+            # Methods cannot be called without an object from a function.
+            self.callable = [entry for entry in self.callable if not entry[2]]
+        self.statements(2, self.rng.randint(1, 2))
+        self.callable = callable_before
+        self.emit(2, f"return {self.expression(0)};")
+        self.emit(1, "}")
+        self.callable.append((name, len(arguments), self.in_method))
+
+    def generate(self) -> str:
+        self.emit(0, f"/** Generated benchmark class {self.class_name}. */")
+        self.emit(0, f"class {self.class_name} {{")
+        self.emit(1, f"field int {', '.join(self.fields)};")
+        self.emit(1, "field Array table;")
+        self.emit(1, f"static int {', '.join(self.statics)};")
+        self.emit(1, f"constructor {self.class_name} new() {{")
+        self.emit(2, "let table = Array.new(32);")
+        self.emit(2, "return this;")
+        self.emit(1, "}")
+        for index in range(self.subroutines):
+            self.subroutine(index)
+        self.emit(0, "}")
+        return "\n".join(self.lines) + "\n"
+
+
+def generate_corpus(directory: str, classes: int = 20, subroutines: int = 30, fields: int = 24,
+                    max_depth: int = 3, string_length: int = 120, seed: int = 0) -> list:
+    """Writes the corpus into directory and returns the paths of the generated .jack files."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(classes):
+        class_name = f"Bench{index}"
+        source = ClassGenerator(rng, class_name, fields, subroutines, max_depth, string_length).generate()
+        path = os.path.join(directory, class_name + ".jack")
+        with open(path, 'w') as jack_file:
+            jack_file.write(source)
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generates a synthetic Jack corpus for benchmarks.")
+    parser.add_argument("directory")
+    parser.add_argument("--classes", type=int, default=20)
+    parser.add_argument("--subroutines", type=int, default=30)
+    parser.add_argument("--fields", type=int, default=24)
+    parser.add_argument("--depth", type=int, default=3, help="maximum expression nesting depth")
+    parser.add_argument("--string-length", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = generate_corpus(args.directory, args.classes, args.subroutines, args.fields, args.depth,
+                            args.string_length, args.seed)
+    print(f"wrote {len(paths)} class(es) to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+
+from BuildCache import BuildCache, MANIFEST_NAME
+from JackCompiler import code_version, compile_path, write_if_changed
+
+MAIN = "class Main { function int one() { return 1; } }\n"
+OPTIONS = {"optimize": False, "comments": True}
+
+
+def compile_and_record(directory) -> None:
+    """Compiles every stale file of directory as an incremental build does, and saves the manifest."""
+    cache = BuildCache(str(directory), code_version(), OPTIONS)
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".jack"):
+            job = str(directory / name), str(directory / name.replace(".jack", ".vm"))
+            if not cache.is_up_to_date(*job):
+                cache.update(*job, compile_path(*job).error is None)
+    cache.save()
+
+
+def test_unchanged_file_is_up_to_date(tmp_path):
+    (tmp_path / "Main.jack").write_text(MAIN)
+    (tmp_path / "Other.jack").write_text(MAIN.replace("Main", "Other"))
+    compile_and_record(tmp_path)
+    assert os.path.exists(tmp_path / MANIFEST_NAME)
+    cache = BuildCache(str(tmp_path), code_version(), OPTIONS)
+    assert cache.is_up_to_date(str(tmp_path / "Main.jack"), str(tmp_path / "Main.vm"))
+    (tmp_path / "Other.jack").write_text(MAIN.replace("Main", "Other").replace("1", "2"))
+    assert not cache.is_up_to_date(str(tmp_path / "Other.jack"), str(tmp_path / "Other.vm"))
+    # A .vm file that was edited or removed since the build is stale as well.
+    (tmp_path / "Main.vm").write_text("// edited\n")
+    assert not cache.is_up_to_date(str(tmp_path / "Main.jack"), str(tmp_path / "Main.vm"))
+
+
+def test_failed_file_is_never_up_to_date(tmp_path):
+    (tmp_path / "Main.jack").write_text("class Main { function int one() { return 1 +; } }\n")
+    compile_and_record(tmp_path)
+    assert BuildCache(str(tmp_path), code_version(), OPTIONS).entries == {}
+
+
+def test_other_options_or_compiler_version_discard_the_manifest(tmp_path):
+    (tmp_path / "Main.jack").write_text(MAIN)
+    compile_and_record(tmp_path)
+    job = str(tmp_path / "Main.jack"), str(tmp_path / "Main.vm")
+    assert BuildCache(str(tmp_path), code_version(), OPTIONS).is_up_to_date(*job)
+    assert not BuildCache(str(tmp_path), code_version(), dict(OPTIONS, optimize=True)).is_up_to_date(*job)
+    assert not BuildCache(str(tmp_path), code_version() + "0", OPTIONS).is_up_to_date(*job)
+
+
+def test_unchanged_output_keeps_its_mtime(tmp_path):
+    output = tmp_path / "Main.vm"
+    assert write_if_changed(str(output), "push constant 1\n")
+    os.utime(output, ns=(1_000_000_000, 1_000_000_000))
+    assert not write_if_changed(str(output), "push constant 1\n")
+    assert not write_if_changed(str(output), b"push constant 1\n")
+    assert os.stat(output).st_mtime_ns == 1_000_000_000
+    assert write_if_changed(str(output), "push constant 2\n")
+    assert os.stat(output).st_mtime_ns != 1_000_000_000
+    assert output.read_text() == "push constant 2\n"
@@ -0,0 +1,135 @@
+import builtins
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+import CompileServer
+from CompileServer import CompileServer as Server
+
+MAIN = "class Main { function void main() { return; } }\n"
+
+
+def make_server(tmp_path) -> Server:
+    (tmp_path / "Main.jack").write_text(MAIN)
+    return Server(str(tmp_path))
+
+
+def exchange(server: Server, data: bytes) -> dict:
+    """Sends data to serve_connection over a socket pair and returns the decoded reply."""
+    client, connection = socket.socketpair()
+    with client:
+        client.sendall(data)
+        server.serve_connection(connection)
+        return json.loads(client.makefile('rb').readline())
+
+
+def test_compile_request(tmp_path):
+    reply = make_server(tmp_path).handle({"command": "compile", "path": "Main.jack"})
+    assert reply["ok"]
+    assert os.path.exists(tmp_path / "Main.vm")
+
+
+def test_malformed_requests_get_error_replies(tmp_path):
+    server = make_server(tmp_path)
+    for message in ([1, 2], "compile", None, {"command": "compile", "path": 7}, {"command": "build"}):
+        reply = server.handle(message)
+        assert not reply["ok"] and reply["error"]
+
+
+def test_paths_outside_the_directory_are_refused(tmp_path):
+    (tmp_path / "project").mkdir()
+    server = make_server(tmp_path / "project")
+    (tmp_path / "Outside.jack").write_text(MAIN.replace("Main", "Outside"))
+    for path in ("../Outside.jack", str(tmp_path / "Outside.jack"), "Main.vm"):
+        assert not server.handle({"command": "compile", "path": path})["ok"]
+    assert not os.path.exists(tmp_path / "Outside.vm")
+
+
+def test_serve_connection_replies_to_bad_input(tmp_path):
+    server = make_server(tmp_path)
+    assert not exchange(server, b"not json\n")["ok"]
+    assert not exchange(server, b"[1]\n")["ok"]
+    assert exchange(server, b'{"command": "compile", "path": "Main.jack"}\n')["ok"]
+
+
+def test_serve_connection_reports_unexpected_errors(tmp_path, monkeypatch):
+    server = make_server(tmp_path)
+
+    def fail(paths):
+        raise RuntimeError("disk on fire")
+    monkeypatch.setattr(server, "compile", fail)
+    reply = exchange(server, b'{"command": "compile"}\n')
+    assert reply == {"ok": False, "error": "RuntimeError: disk on fire"}
+
+
+def test_idle_client_is_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(CompileServer, "REQUEST_TIMEOUT", 0.1)
+    server = make_server(tmp_path)
+    client, connection = socket.socketpair()
+    with client:
+        worker = threading.Thread(target=server.serve_connection, args=(connection,))
+        worker.start()
+        worker.join(2)
+        assert not worker.is_alive()
+
+
+def test_serve_refuses_to_replace_a_file_that_is_not_a_socket(tmp_path):
+    server = make_server(tmp_path)
+    source = tmp_path / "Main.jack"
+    with pytest.raises(FileExistsError):
+        server.serve(str(source))
+    assert source.read_text() == MAIN
+
+
+def test_serve_replaces_a_stale_socket(tmp_path, monkeypatch):
+    server = make_server(tmp_path)
+    socket_path = str(tmp_path / "server.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(socket_path)
+    monkeypatch.setattr(server, "poll", lambda: setattr(server, "running", False))
+    server.serve(socket_path)
+    assert not os.path.exists(socket_path)
+
+
+def test_poll_reads_only_the_changed_file(tmp_path, monkeypatch):
+    (tmp_path / "A.jack").write_text("class A { function int f() { return 1; } }\n")
+    (tmp_path / "B.jack").write_text("class B { function int g() { return 2; } }\n")
+    server = Server(str(tmp_path), resolve_calls=True)
+    assert len(server.poll()) == 2
+    (tmp_path / "B.jack").write_text("class B { function int g(int x, int y) { return x + y; } }\n")
+    opened = []
+    real_open = builtins.open
+
+    def recording_open(file, *args, **kwargs):
+        if str(file).endswith(".jack"):
+            opened.append(os.path.basename(file))
+        return real_open(file, *args, **kwargs)
+    monkeypatch.setattr(builtins, "open", recording_open)
+    assert [os.path.basename(result.input_path) for result in server.poll()] == ["B.jack"]
+    assert set(opened) == {"B.jack"}
+    assert server.class_index.lookup("B", "g") == ("FUNCTION", 2)
+    assert server.class_index.lookup("A", "f") == ("FUNCTION", 0)
+    os.remove(tmp_path / "B.jack")
+    server.poll()
+    assert server.class_index.lookup("B", "g") is None
+
+
+def test_poll_recompiles_the_callers_of_a_changed_class(tmp_path):
+    (tmp_path / "A.jack").write_text("class A { function void main() { do B.f(); return; } }\n")
+    (tmp_path / "B.jack").write_text("class B { function void f() { return; } }\n")
+    (tmp_path / "C.jack").write_text("class C { function void g() { return; } }\n")
+    server = Server(str(tmp_path), resolve_calls=True)
+    assert all(not result.report.get("warnings") for result in server.poll())
+
+    def poll() -> dict:
+        return {os.path.basename(result.input_path): result.report.get("warnings", []) for result in server.poll()}
+    (tmp_path / "B.jack").write_text("class B { method void f() { return; } }\n")
+    assert poll() == {"B.jack": [], "A.jack": ["A.main: method B.f is called without an object"]}
+    # A change that keeps the declarations of B leaves A alone.
+    (tmp_path / "B.jack").write_text("class B { method void f() { return; } } // unchanged declarations\n")
+    assert poll() == {"B.jack": []}
+    os.remove(tmp_path / "B.jack")
+    assert poll() == {"A.jack": ["A.main: unknown class B in call to B.f"]}
@@ -0,0 +1,115 @@
+"""
+Constant folding is checked against Python arithmetic: the shift and add chains of strength reduction are run
+on every edge-case operand by a small evaluator, and whole programs are compiled with and without folding and
+run in the VM emulator.
+"""
+import io
+import textwrap
+
+import pytest
+
+from ConstantFolder import fold_binary, reduce_strength
+from JackCompiler import compile_file
+from VMEmulator import VMEmulator
+from VMWriter import PUSH, POP, ARITHMETIC, to_word
+
+# The operands that wrap or round differently at the edges, and a sample of the rest.
+OPERANDS = sorted({-32768, -32767, -32766, -3, -2, -1, 0, 1, 2, 3, 32766, 32767} |
+                  set(range(-32768, 32768, 97)))
+
+OPERATIONS = {
+    "add": lambda x, y: to_word(x + y), "sub": lambda x, y: to_word(x - y), "and": lambda x, y: x & y,
+    "lt": lambda x, y: -1 if x < y else 0,
+}
+
+
+def evaluate(code: list, x: int) -> int:
+    """Runs the straight-line code of reduce_strength on x, the value on top of the stack, and returns the result."""
+    stack, temp = [x], {}
+    for opcode, name, number in code:
+        if opcode == PUSH:
+            stack.append(number if name == "constant" else temp[number])
+        elif opcode == POP:
+            temp[number] = stack.pop()
+        elif name in OPERATIONS:
+            y = stack.pop()
+            stack.append(OPERATIONS[name](stack.pop(), y))
+        else:
+            value = stack.pop()
+            stack.append({"neg": to_word(-value), "not": ~value, "shiftleft": to_word(value << 1),
+                          "shiftright": value >> 1}[name])
+    assert len(stack) == 1
+    return stack[0]
+
+
+@pytest.mark.parametrize("op", ["*", "/"])
+def test_strength_reduction_matches_the_library_call(op):
+    reduced = 0
+    for constant in range(-70, 71):
+        code = reduce_strength(op, constant)
+        if code is None:
+            continue
+        reduced += 1
+        for x in OPERANDS:
+            assert evaluate(code, x) == fold_binary(op, x, constant), (op, x, constant)
+    assert reduced > 10
+
+
+CONSTANT_ARITHMETIC = """
+    class Main {
+        function void show(int x) {
+            do Output.printInt(x);
+            do Output.printChar(32);
+            return;
+        }
+
+        function void main() {
+            var int i, x;
+            do Main.show(3 + (4 * 5) - (-2));
+            do Main.show(~(7 & 12) | 1);
+            do Main.show(32767 + 1);
+            do Main.show(300 * 300);
+            do Main.show(-7 / 2);
+            let i = -9;
+            while (i < 10) {
+                let x = i * 8;
+                do Main.show(x + (i * 10) + (i * -3) + (i / 4) + (i / -2) + (i * 0) + (i / 1));
+                let i = i + 3;
+            }
+            return;
+        }
+    }
+"""
+
+
+def compile_text(source: str, **options) -> list:
+    """Compiles a class source with options and returns its VM code as a list of lines."""
+    output = io.StringIO()
+    compile_file(io.StringIO(textwrap.dedent(source)), output, **options)
+    return output.getvalue().splitlines()
+
+
+def test_constant_subexpressions_are_folded():
+    code = compile_text(CONSTANT_ARITHMETIC, fold_constants=True)
+    # 3 + (4 * 5) - (-2), ~(7 & 12) | 1, 32767 + 1, 300 * 300 and -7 / 2 with 16-bit wraparound.
+    for constant in ("push constant 25", "push constant 5", "push constant 32767", "push constant 24464",
+                     "push constant 3"):
+        assert constant in code
+    calls = [sum(line in ("call Math.multiply 2", "call Math.divide 2")
+                 for line in compile_text(CONSTANT_ARITHMETIC, **options))
+             for options in ({}, {"fold_constants": True})]
+    # Only i * 0 is left to Math.multiply.
+    assert calls == [10, 1]
+
+
+def test_folded_program_prints_the_same():
+    emulators = []
+    for options in ({}, {"fold_constants": True}):
+        emulator = VMEmulator({"Main": "\n".join(compile_text(CONSTANT_ARITHMETIC, **options))})
+        emulator.run(max_steps=100_000)
+        emulators.append(emulator)
+    plain, folded = emulators
+    assert "".join(plain.output).startswith("25 -5 -32768 24464 -3 ")
+    assert folded.output == plain.output
+    # Of the four multiplications in each of the seven loop iterations, only i * 0 still calls Math.multiply.
+    assert (plain.call_counts["Math.multiply"], folded.call_counts["Math.multiply"]) == (30, 7)
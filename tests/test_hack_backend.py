@@ -0,0 +1,191 @@
+"""
+The assembly of HackBackend is checked by running it: a small assembler and Hack CPU below execute the
+program from the bootstrap until it reaches the halt loop, and the tests inspect the RAM it leaves.
+"""
+import pytest
+
+from HackBackend import HackBackend, parse_vm
+from VMWriter import to_word
+
+# The computations of the Hack C-instruction, written as the assembler spells them.
+COMPUTATIONS = {
+    "0": "0", "1": "1", "-1": "-1", "D": "D", "A": "A", "M": "M", "!D": "~D", "!A": "~A", "!M": "~M",
+    "-D": "-D", "-A": "-A", "-M": "-M", "D+1": "D+1", "A+1": "A+1", "M+1": "M+1", "D-1": "D-1", "A-1": "A-1",
+    "M-1": "M-1", "D+A": "D+A", "D+M": "D+M", "D-A": "D-A", "D-M": "D-M", "A-D": "A-D", "M-D": "M-D",
+    "D&A": "D&A", "D&M": "D&M", "D|A": "D|A", "D|M": "D|M",
+}
+JUMPS = {"": "False", "JGT": "v>0", "JEQ": "v==0", "JGE": "v>=0", "JLT": "v<0", "JNE": "v!=0", "JLE": "v<=0",
+         "JMP": "True"}
+PREDEFINED = {"SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4, "SCREEN": 16384, "KBD": 24576,
+              **{f"R{register}": register for register in range(16)}}
+
+
+def assemble(asm: str) -> tuple:
+    """Returns the program of the assembly, as (constant, computation, destination, jump) tuples, and its symbols."""
+    lines = [line.strip() for line in asm.splitlines() if line.strip()]
+    symbols = dict(PREDEFINED)
+    address = 0
+    for line in lines:
+        if line.startswith("("):
+            symbols[line[1:-1]] = address
+        else:
+            address += 1
+    variables = 16
+    program = []
+    for line in lines:
+        if line.startswith("("):
+            continue
+        if line.startswith("@"):
+            value = line[1:]
+            if not value.isdigit() and value not in symbols:
+                symbols[value] = variables
+                variables += 1
+            program.append((int(value) if value.isdigit() else symbols[value], None, "", None))
+            continue
+        destination, _, rest = line.rpartition("=")
+        computation, _, jump = rest.partition(";")
+        assert computation in COMPUTATIONS and jump in JUMPS and set(destination) <= set("AMD"), line
+        program.append((None, eval(f"lambda A, D, M: {COMPUTATIONS[computation]}"), destination,
+                        eval(f"lambda v: {JUMPS[jump]}")))
+    # The stack starts at 256, so the variables must end below it.
+    assert variables <= 256
+    return program, symbols
+
+
+def run(asm: str, max_steps: int = 200_000) -> tuple:
+    """Runs the assembly until it reaches the halt loop. Returns the RAM and the symbols."""
+    program, symbols = assemble(asm)
+    ram = [0] * 32768
+    a = d = pc = 0
+    for _ in range(max_steps):
+        if pc == symbols["$HALT"]:
+            return ram, symbols
+        constant, computation, destination, jump = program[pc]
+        pc += 1
+        if constant is not None:
+            a = constant
+            continue
+        value = to_word(computation(a, d, ram[a] if 0 <= a < 32768 else 0))
+        if "M" in destination:
+            ram[a] = value
+        if "D" in destination:
+            d = value
+        if jump(value):
+            pc = a
+        if "A" in destination:
+            a = value
+    pytest.fail("the program did not halt")
+
+
+def translate(**classes: str) -> str:
+    return HackBackend().translate({name: parse_vm(text) for name, text in classes.items()})
+
+
+def push(value: int) -> str:
+    """Returns the VM code that pushes any 16-bit value."""
+    if value >= 0:
+        return f"push constant {value}\n"
+    if value == -32768:
+        return "push constant 32767\nneg\npush constant 1\nsub\n"
+    return f"push constant {-value}\nneg\n"
+
+
+EDGES = [-32768, -32767, -16385, -2, -1, 0, 1, 2, 16384, 32766, 32767]
+
+
+def test_comparisons_are_exact_where_x_minus_y_overflows():
+    pairs = [(x, y) for x in EDGES for y in EDGES]
+    code = ["function Main.main 0"]
+    for number, (x, y) in enumerate(pairs):
+        # Packs the three results into one static: 1 for x < y, 2 for x > y and 4 for x = y.
+        for operation, bit in (("lt", 1), ("gt", 2), ("eq", 4)):
+            code.append(f"{push(x)}{push(y)}{operation}\npush constant {bit}\nand")
+        code.append(f"add\nadd\npop static {number}")
+    code.append("push constant 0\nreturn")
+    ram, symbols = run(translate(Main="\n".join(code)))
+    for number, (x, y) in enumerate(pairs):
+        assert ram[symbols[f"Main.{number}"]] == (x < y) + 2 * (x > y) + 4 * (x == y), (x, y)
+
+
+def test_shift_right_keeps_the_sign():
+    code = ["function Main.main 0"]
+    for number, x in enumerate(EDGES):
+        code.append(f"{push(x)}shiftright\npop static {number}")
+    code.append("push constant 0\nreturn")
+    ram, symbols = run(translate(Main="\n".join(code)))
+    assert [ram[symbols[f"Main.{number}"]] for number in range(len(EDGES))] == [x >> 1 for x in EDGES]
+
+
+CALLS = """
+function Sys.init 0
+    push constant 100
+    call Main.seven 0
+    call Main.combine 2
+    pop static 0
+    call Main.seven 0
+    pop static 1
+    push constant 0
+    return
+
+function Main.seven 0
+    push constant 7
+    return
+
+function Main.combine 9
+    push argument 0
+    push argument 1
+    push constant 10
+    push constant 20
+    push constant 30
+    push constant 40
+    push constant 50
+    push constant 60
+    push constant 70
+    pop local 8
+    pop local 7
+    pop local 6
+    pop local 5
+    pop local 4
+    pop local 3
+    pop local 2
+    pop local 1
+    pop local 0
+    push local 8
+    push local 7
+    sub
+    push local 6
+    add
+    push local 0
+    push local 1
+    sub
+    add
+    push local 2
+    call Main.seven 0
+    add
+    add
+    pop local 3
+    push local 3
+    return
+"""
+
+
+def test_calls_with_and_without_arguments_and_small_and_large_pops():
+    ram, symbols = run(translate(Main=CALLS))
+    # (70 - 60 + 50) + (100 - 7) + (10 + 7)
+    assert ram[symbols["Main.0"]] == 170 and ram[symbols["Main.1"]] == 7
+    # Every call returned its stack and segments to the caller: the bootstrap call left only its result.
+    assert ram[0] == 257 and ram[256] == 0
+    assert [ram[register] for register in (1, 2, 3, 4)] == [0, 0, 0, 0]
+
+
+def test_bootstrap_prefers_sys_init():
+    main = "function Main.main 0\npush constant 2\npop static 0\npush constant 0\nreturn"
+    sys_init = "function Sys.init 0\npush constant 1\npop static 0\npush constant 0\nreturn"
+    ram, symbols = run(translate(Main=main, Sys=sys_init))
+    assert (ram[symbols["Sys.0"]], ram[symbols["Main.0"]]) == (1, 0)
+    ram, symbols = run(translate(Main=main))
+    assert ram[symbols["Main.0"]] == 2
+    with pytest.raises(ValueError):
+        translate(Main=main.replace("Main.main", "Main.start"))
+    with pytest.raises(ValueError):
+        translate(Main=main.replace("push constant 2", "call Main.missing 0"))
@@ -0,0 +1,141 @@
+"""
+The inliner is checked on a multi-class program: which calls it replaces, how it remaps the segments of the
+inlined code and what it reports. The program must print the same in the VM emulator before and after inlining.
+"""
+import io
+import textwrap
+
+from Inliner import Inliner
+from JackCompiler import compile_instructions
+from VMEmulator import VMEmulator
+from VMWriter import VMWriter, PUSH, POP, LABEL, CALL, FUNCTION
+
+MAIN = """
+    class Main {
+        function void main() {
+            var Point p;
+            var int i;
+            let p = Point.new(3, 4);
+            do Output.printInt(p.getX());
+            do Output.printInt(p.sum());
+            do p.setX(10);
+            do Output.printInt(p.getX());
+            let i = -2;
+            while (i < 3) {
+                do Output.printInt(Main.sign(i));
+                do Output.printInt(Main.twiceSum(i, 5));
+                let i = i + 1;
+            }
+            do Output.printInt(Main.sign(-5) + Main.sign(5));
+            do Output.printInt(Counter.next());
+            do Output.printInt(Counter.next());
+            do Output.printInt(Counter.twice());
+            return;
+        }
+
+        function int sign(int n) {
+            if (n < 0) {
+                return -1;
+            }
+            if (n > 0) {
+                return 1;
+            }
+            return 0;
+        }
+
+        function int twiceSum(int a, int b) {
+            var int t;
+            let t = a + b;
+            return t + t;
+        }
+    }
+"""
+POINT = """
+    class Point {
+        field int x, y;
+
+        constructor Point new(int ax, int ay) {
+            let x = ax;
+            let y = ay;
+            return this;
+        }
+
+        method int getX() {
+            return x;
+        }
+
+        method int sum() {
+            return x + y;
+        }
+
+        method void setX(int value) {
+            let x = value;
+            return;
+        }
+    }
+"""
+COUNTER = """
+    class Counter {
+        static int count;
+
+        function int next() {
+            let count = count + 1;
+            return count;
+        }
+
+        function int twice() {
+            return Counter.next() + Counter.next();
+        }
+    }
+"""
+
+
+def compile_program(classes: list) -> dict:
+    """Compiles the given class sources into instruction lists keyed by class name."""
+    programs = {}
+    for source in classes:
+        instructions, _ = compile_instructions(io.StringIO(textwrap.dedent(source)))
+        programs[instructions[0][1].split(".")[0]] = instructions
+    return programs
+
+
+def run(programs: dict) -> VMEmulator:
+    sources = {}
+    for class_name, instructions in programs.items():
+        writer = VMWriter(None)
+        writer.set_instructions(instructions)
+        sources[class_name] = writer.to_text()
+    emulator = VMEmulator(sources)
+    emulator.run(max_steps=100_000)
+    return emulator
+
+
+def test_inlined_program_prints_the_same():
+    programs = compile_program([MAIN, POINT, COUNTER])
+    plain, inlined = run(programs), run(Inliner(threshold=40).inline(programs))
+    assert " ".join(plain.output) == "3 7 10 -1 6 -1 8 0 10 1 12 1 14 0 1 2 7"
+    assert inlined.output == plain.output
+    assert sum(inlined.call_counts.values()) < sum(plain.call_counts.values())
+
+
+def test_inlined_calls():
+    programs = compile_program([MAIN, POINT, COUNTER])
+    inliner = Inliner(threshold=40)
+    inlined = inliner.inline(programs)
+    main = inlined["Main"][:next(index for index, instruction in enumerate(inlined["Main"])
+                                 if instruction[:2] == (FUNCTION, "Main.sign"))]
+    calls = [instruction[1] for instruction in main if instruction[0] == CALL]
+    assert calls == ["Point.new"] + ["Output.printInt"] * 6 + ["Counter.next", "Output.printInt"] * 2 + \
+        ["Counter.twice", "Output.printInt"]
+    # The callee locals a and b, and t of twiceSum, are added after the caller's own two.
+    assert main[0] == (FUNCTION, "Main.main", 5)
+    # this of the inlined methods becomes that, so the caller's this is left alone.
+    assert (POP, "pointer", 1) in main and (PUSH, "that", 1) in main
+    assert not any(instruction[0] in (PUSH, POP) and (instruction[1] == "this" or instruction[1:] == ("pointer", 0))
+                   for instruction in main)
+    # Each inlined copy of sign, with its several returns, gets labels of its own.
+    labels = [instruction[1] for instruction in main if instruction[0] == LABEL]
+    assert len(labels) == len(set(labels))
+    assert len([label for label in labels if label.startswith("Main.sign$inline")]) == 3
+    assert "not inlined Counter.next into Main.main: its statics belong to another class" in inliner.decisions
+    assert "inlined Counter.next into Counter.twice x2" in inliner.decisions
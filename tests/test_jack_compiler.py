@@ -0,0 +1,219 @@
+import io
+import json
+import os
+import runpy
+import sys
+
+import pytest
+
+import ClassIndex
+import JackCompiler
+from JackCompiler import compile_instructions, compile_path, profile_json
+
+HELPER_CALL = """
+class Main {
+    function void main() {
+        do helper();
+        return;
+    }
+    function void helper() {
+        return;
+    }
+}
+"""
+
+
+def run_cli(monkeypatch, *arguments: str) -> None:
+    """Runs JackCompiler.py as the command line would, with the given arguments."""
+    monkeypatch.setattr(sys, "argv", ["JackCompiler.py", *arguments])
+    try:
+        runpy.run_path(JackCompiler.__file__, run_name="__main__")
+    except SystemExit as error:
+        assert not error.code
+
+
+def test_cli_resolves_unqualified_function_calls(tmp_path, monkeypatch):
+    (tmp_path / "Main.jack").write_text(HELPER_CALL)
+    run_cli(monkeypatch, "--jobs", "1", "--no-comments", str(tmp_path))
+    # By default every unqualified call is taken for a method call on this, as it always was.
+    default_text = (tmp_path / "Main.vm").read_text()
+    assert "push pointer 0" in default_text.splitlines()
+    run_cli(monkeypatch, "--jobs", "1", "--no-comments", "--resolve-calls", str(tmp_path))
+    resolved_text = (tmp_path / "Main.vm").read_text()
+    code = resolved_text.splitlines()
+    assert "call Main.helper 0" in code and "push pointer 0" not in code
+    # The in-memory API gives the same code as the CLI, with and without resolving calls.
+    assert JackCompiler.compile_source(HELPER_CALL, comments=False) == default_text
+    assert JackCompiler.compile_source(HELPER_CALL, resolve_calls=True, comments=False) == resolved_text
+    shape = "class Shape { method int area() { return 0; } }"
+    for resolve_calls, text in ((False, default_text), (True, resolved_text)):
+        outputs = JackCompiler.compile_sources([("Main", HELPER_CALL), ("Shape", shape)], resolve_calls=resolve_calls,
+                                               comments=False)
+        assert outputs["Main"] == text
+
+
+def test_compile_source_is_not_cached_across_changes_of_the_class_index():
+    index = ClassIndex.ClassIndex()
+    # Main is not in the index, so helper is taken for a method called on this.
+    assert "push pointer 0" in JackCompiler.compile_source(HELPER_CALL, class_index=index).splitlines()
+    index.add_source(HELPER_CALL)
+    code = JackCompiler.compile_source(HELPER_CALL, class_index=index).splitlines()
+    assert "call Main.helper 0" in code and "push pointer 0" not in code
+
+
+LIBRARY = "class Lib { function int twice(int x) { return x + x; } function int four() { return twice(2); } }"
+
+
+def test_compile_sources_reuses_classes_across_batches():
+    first = [("Lib", LIBRARY), ("Main", "class Main { function void main() { do Lib.four(); return; } }")]
+    second = [("Lib", LIBRARY), ("Game", "class Game { function void run() { do Lib.twice(3); return; } }"),
+              ("Main", "class Main { function void main() { do Game.run(); return; } }")]
+    JackCompiler.compile_sources(first, resolve_calls=True)
+    before = JackCompiler.cached_instructions.cache_info()
+    outputs = JackCompiler.compile_sources(second, resolve_calls=True)
+    after = JackCompiler.cached_instructions.cache_info()
+    # Lib names no other class of either batch, so it is keyed the same way in both and compiled once.
+    assert (after.hits - before.hits, after.misses - before.misses) == (1, 2)
+    assert "call Lib.twice 1" in outputs["Lib"].splitlines()
+    # A change in the declarations of a class that a source names is a different key.
+    changed = [("Lib", LIBRARY.replace("function int twice", "method int twice")), second[1]]
+    outputs = JackCompiler.compile_sources(changed, resolve_calls=True)
+    assert JackCompiler.cached_instructions.cache_info().misses - after.misses == 2
+    assert "push pointer 0" in outputs["Lib"].splitlines()
+
+
+def test_incremental_build_that_is_up_to_date_skips_the_class_index(tmp_path, monkeypatch):
+    (tmp_path / "Main.jack").write_text(HELPER_CALL)
+    run_cli(monkeypatch, "--jobs", "1", "--incremental", "--resolve-calls", str(tmp_path))
+
+    def fail(directory):
+        pytest.fail("the class index was built for an up-to-date build")
+    monkeypatch.setattr(ClassIndex.ClassIndex, "from_directory", fail)
+    run_cli(monkeypatch, "--jobs", "1", "--incremental", "--resolve-calls", str(tmp_path))
+    assert os.path.exists(tmp_path / "Main.vm")
+
+
+PROFILED = """
+class Main {
+    function void show(int x) {
+        do Output.printInt(x);
+        do Output.printChar(32);
+        return;
+    }
+
+    function void main() {
+        var int i;
+        let i = 3;
+        do Main.show(i * 5);
+        do Main.show(i / 2);
+        do Main.show(i * i);
+        do Output.printString("hello");
+        return;
+    }
+}
+"""
+
+
+def test_profile_does_not_change_the_code():
+    for options in ({}, {"fold_constants": True, "optimize": True}):
+        instructions, _ = compile_instructions(io.StringIO(PROFILED), **options)
+        profiled, report = compile_instructions(io.StringIO(PROFILED), profile=True, **options)
+        assert profiled == instructions
+        show, main = report["subroutines"]["Main.show"], report["subroutines"]["Main.main"]
+        # -O drops the discarded result of the last do and the push constant 0 of the void return.
+        assert show["instructions"] == (7 if options else 9)
+        assert (show["multiply"], show["divide"], show["string_bytes"]) == (0, 0, 0)
+        assert (main["string_bytes"], main["tokens"] > show["tokens"]) == (5, True)
+        # The strength-reduced i * 5 and i / 2 no longer call the library; i * i still does.
+        assert (main["multiply"], main["divide"]) == ((1, 0) if options else (2, 1))
+
+
+def test_profile_times_each_phase(tmp_path):
+    source = tmp_path / "Main.jack"
+    source.write_text(PROFILED)
+    result = compile_path(str(source), str(tmp_path / "Main.vm"), {"profile": True})
+    assert result.error is None
+    assert list(result.report["phases"]) == ["tokenize", "compile", "io"]
+    assert all(elapsed >= 0 for elapsed in result.report["phases"].values())
+    profile = json.loads(profile_json([result]))
+    assert profile["files"][0]["subroutines"]["Main.main"]["instructions"] > 0
+    assert compile_path(str(source), str(tmp_path / "Plain.vm")).error is None
+    assert (tmp_path / "Main.vm").read_text() == (tmp_path / "Plain.vm").read_text()
+
+
+PROGRAM = {
+    "Main": "class Main {\n    function void main() {\n        var Point p;\n        let p = Point.new(1, 2);\n"
+            "        do Output.printInt(p.sum());\n        return;\n    }\n}\n",
+    "Point": "class Point {\n    field int x, y;\n    constructor Point new(int ax, int ay) {\n"
+             "        let x = ax;\n        let y = ay;\n        return this;\n    }\n"
+             "    method int sum() {\n        return x + y;\n    }\n}\n",
+    "Broken": "class Broken {\n    function int f() {\n        return 1 +;\n    }\n}\n",
+    "Square": "class Square {\n    function int of(int n) {\n        return n * n;\n    }\n}\n",
+    "Typo": "class Typo {\n    function void g() {\n        let = 2;\n        return;\n    }\n}\n",
+}
+
+
+def build(directory, workers: int) -> list:
+    """Writes PROGRAM into directory and compiles it as the CLI would, with the given number of workers."""
+    directory.mkdir()
+    jobs = []
+    for class_name, source in PROGRAM.items():
+        (directory / f"{class_name}.jack").write_text(source)
+        jobs.append((str(directory / f"{class_name}.jack"), str(directory / f"{class_name}.vm")))
+    options = {"optimize": True, "class_index": ClassIndex.ClassIndex.from_directory(str(directory))}
+    return JackCompiler.compile_paths(jobs, workers, options)
+
+
+def test_parallel_build_matches_serial_build(tmp_path):
+    serial = build(tmp_path / "serial", 1)
+    parallel = build(tmp_path / "parallel", 2)
+    assert [os.path.basename(result.input_path) for result in parallel] == [f"{name}.jack" for name in PROGRAM]
+    for class_name in ("Main", "Point", "Square"):
+        assert ((tmp_path / "parallel" / f"{class_name}.vm").read_bytes() ==
+                (tmp_path / "serial" / f"{class_name}.vm").read_bytes())
+    # Each error is reported for its own file, and stops no other file from being written.
+    errors = {os.path.basename(result.input_path): result.error for result in parallel}
+    assert errors == {os.path.basename(result.input_path): result.error for result in serial}
+    assert errors["Main.jack"] is errors["Point.jack"] is errors["Square.jack"] is None
+    assert "3:19: expected an expression, found ';'" in errors["Broken.jack"]
+    assert "3:13: expected a variable name, found '='" in errors["Typo.jack"]
+    assert not (tmp_path / "parallel" / "Broken.vm").exists()
+
+
+WHOLE_PROGRAM = {
+    "Main": "class Main {\n    function void main() {\n        do Game.run();\n        return;\n    }\n}\n",
+    "Game": "class Game {\n    function void run() {\n        return;\n    }\n"
+            "    function void callback() {\n        do Game.helper();\n        return;\n    }\n"
+            "    function void helper() {\n        return;\n    }\n"
+            "    function void unused() {\n        do Game.deadHelper();\n        return;\n    }\n"
+            "    function void deadHelper() {\n        return;\n    }\n}\n",
+    "Sys": "class Sys {\n    function void init() {\n        do Memory.init();\n        do Main.main();\n"
+           "        do Sys.halt();\n        return;\n    }\n    function void halt() {\n        return;\n    }\n"
+           "    function void error(int code) {\n        return;\n    }\n}\n",
+    "Memory": "class Memory {\n    function void init() {\n        return;\n    }\n"
+              "    function int peek(int address) {\n        return 0;\n    }\n}\n",
+}
+
+
+def test_whole_program_build_drops_unreachable_functions(tmp_path, monkeypatch, capsys):
+    for class_name, source in WHOLE_PROGRAM.items():
+        (tmp_path / f"{class_name}.jack").write_text(source)
+    run_cli(monkeypatch, "--jobs", "1", "--whole-program", "--keep", "Game.callback", str(tmp_path))
+    functions = set()
+    for class_name in WHOLE_PROGRAM:
+        functions.update(line.split()[1] for line in (tmp_path / f"{class_name}.vm").read_text().splitlines()
+                         if line.startswith("function "))
+    # Main.main and Sys.init are entry points, as is the OS bootstrap Memory.init; --keep adds Game.callback.
+    assert functions == {"Main.main", "Game.run", "Game.callback", "Game.helper", "Sys.init", "Sys.halt",
+                         "Memory.init"}
+    report = capsys.readouterr().out.splitlines()
+    assert report[-5:] == [
+        "removed Game.deadHelper (3 instruction(s)): only called from unreachable Game.unused",
+        "removed Game.unused (5 instruction(s)): never called",
+        "removed Memory.peek (3 instruction(s)): never called",
+        "removed Sys.error (3 instruction(s)): never called",
+        "4 unreachable function(s) removed, 14 instruction(s)"]
+    run_cli(monkeypatch, "--jobs", "1", "--whole-program", str(tmp_path))
+    report = capsys.readouterr().out.splitlines()
+    assert "removed Game.callback (5 instruction(s)): never called" in report
+    assert "removed Game.helper (3 instruction(s)): only called from unreachable Game.callback" in report
@@ -0,0 +1,96 @@
+import io
+
+import pytest
+
+from JackAST import Constant, Let, Return
+from JackParser import JackParser, JackSyntaxError
+from JackTokenizer import JackTokenizer
+
+
+def parse(source: str):
+    return JackParser(JackTokenizer(io.StringIO(source))).parse_class()
+
+
+def syntax_errors(source: str) -> list:
+    """Returns the (line, column, message) triples of the errors reported for source."""
+    with pytest.raises(JackSyntaxError) as error:
+        parse(source)
+    return error.value.errors
+
+
+def test_parses_a_class():
+    tree = parse("class Main { function int f() { let x = 2; return x; } }")
+    statements = tree.subroutines[0].statements
+    assert [type(statement) for statement in statements] == [Let, Return]
+    assert statements[0].value == Constant(2)
+
+
+def test_bad_token_in_an_expression_list():
+    errors = syntax_errors("""class Main {
+    function void main() {
+        do Output.printInt(1, ), 2);
+        let x = ;
+        return;
+    }
+}
+""")
+    # The rest of the do statement is skipped up to its semicolon, and the next statement is parsed.
+    assert errors == [(3, 31, "expected an expression, found ')'"), (4, 17, "expected an expression, found ';'")]
+
+
+def test_token_that_is_not_a_statement():
+    errors = syntax_errors("""class Main {
+    function void main() {
+        foo = 1;
+        let x = 3;
+        bar;
+        return;
+    }
+
+    function void g() {
+        baz
+    }
+}
+""")
+    assert errors == [(3, 9, "expected a statement, found 'foo'"), (5, 9, "expected a statement, found 'bar'"),
+                      (10, 9, "expected a statement, found 'baz'")]
+
+
+@pytest.mark.parametrize("source, error", [
+    ("class", (1, 6, "expected a class name, found the end of the input")),
+    ("class Main {", (1, 13, "expected '}' at the end of the class, found the end of the input")),
+    ("class Main { function void main() {\n    let x = (1 +",
+     (2, 17, "expected an expression, found the end of the input")),
+    ("class Main { function void main() {\n    while (true) { do f(); ",
+     (2, 27, "expected '}', found the end of the input")),
+])
+def test_truncated_input_is_reported_once(source, error):
+    # Everything left open fails at the end of the input, just past the last token, and is reported once.
+    assert syntax_errors(source) == [error]
+
+
+def test_all_errors_of_a_file_are_reported_in_one_pass():
+    errors = syntax_errors("""class Main {
+    field int x
+    method void a() {
+        let x = 1 +;
+        if (x { let x = 2; }
+        return;
+    }
+    garbage;
+    function int b() {
+        while (x < ) { do f(; }
+        return x;
+    }
+    method void c() { let 3 = x; return; }
+}
+""")
+    assert errors == [
+        (3, 5, "expected ',', found 'method'"),
+        (4, 20, "expected an expression, found ';'"),
+        (5, 15, "expected ')', found '{'"),
+        (8, 5, "expected a class member in class Main, found 'garbage'"),
+        # The block of the while statement is skipped with its condition, so do f(; is not reported.
+        (10, 20, "expected an expression, found ')'"),
+        (13, 27, "expected a variable name, found '3'"),
+    ]
@@ -0,0 +1,504 @@
+"""
+Semantic tests of the optional code transformations: each program is compiled with the option off and on,
+run in the VM emulator, and must print the same output either way.
+"""
+import itertools
+import textwrap
+
+import VMBytecode
+from Inliner import Inliner
+from JackCompiler import compile_path, compile_source
+from PeepholeOptimizer import PeepholeOptimizer, STABLE_SEGMENTS
+from VMEmulator import VMEmulator
+from VMWriter import PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN, RAW
+
+
+def run(classes: list, **options) -> str:
+    """Compiles the given class sources with options, runs the program and returns what it printed."""
+    sources = {}
+    for source in classes:
+        source = textwrap.dedent(source)
+        instructions = compile_source(source, as_instructions=True, **options)
+        sources[instructions[0][1].split(".")[0]] = instructions
+    emulator = VMEmulator(sources)
+    emulator.run(max_steps=1_000_000)
+    return "".join(emulator.output)
+
+
+def check_same_output(classes: list, expected: str, **options) -> None:
+    """Checks that the program prints expected both without and with options."""
+    assert run(classes) == expected
+    assert run(classes, **options) == expected
+
+
+STATIC_ALIAS = """
+    class Main {
+        static int s;
+
+        function void main() {
+            var Array ram;
+            var int i, sum;
+            let s = 5;
+            let ram = 0;
+            let i = 0;
+            let sum = 0;
+            while (i < 3) {
+                let sum = sum + (s * 2);
+                let ram[16] = ram[16] + 1;
+                let i = i + 1;
+            }
+            do Output.printInt(sum);
+            return;
+        }
+    }
+"""
+
+FIELD_ALIAS = """
+    class Main {
+        field int count;
+
+        constructor Main new() {
+            let count = 1;
+            return this;
+        }
+
+        method int total() {
+            var Array object;
+            var int i, sum;
+            let object = this;
+            let i = 0;
+            let sum = 0;
+            while (i < 4) {
+                let sum = sum + (count * 3);
+                let object[0] = object[0] + 1;
+                let i = i + 1;
+            }
+            return sum;
+        }
+
+        function void main() {
+            var Main main;
+            let main = Main.new();
+            do Output.printInt(main.total());
+            return;
+        }
+    }
+"""
+
+INVARIANT_LOOP = """
+    class Main {
+        function void main() {
+            var Array a;
+            var int i, n, sum;
+            let a = Array.new(4);
+            let a[0] = 7;
+            let n = 6;
+            let i = 0;
+            let sum = 0;
+            while (i < (n * 2)) {
+                let sum = sum + a[0] + (n * n);
+                let i = i + 1;
+            }
+            do Output.printInt(sum);
+            return;
+        }
+    }
+"""
+
+
+DO_BEFORE_RETURN = """
+    class Main {
+        static int calls;
+
+        function int five() {
+            let calls = calls + 1;
+            return 5;
+        }
+
+        function int untyped() {
+            do Main.five();
+            return;
+        }
+
+        function void log() {
+            do Main.five();
+            return;
+        }
+
+        function void main() {
+            do Output.printInt(Main.untyped());
+            do Main.log();
+            do Output.printInt(calls);
+            return;
+        }
+    }
+"""
+
+
+def test_peephole_keeps_zero_result_of_non_void_subroutine():
+    check_same_output([DO_BEFORE_RETURN], "02", optimize=True)
+
+
+def test_peephole_returns_call_result_in_void_subroutine():
+    instructions = compile_source(textwrap.dedent(DO_BEFORE_RETURN), as_instructions=True, optimize=True,
+                                  comments=False)
+    log = instructions.index((FUNCTION, "Main.log", 0))
+    assert instructions[log + 1:log + 3] == [(CALL, "Main.five", 0), (RETURN, "", 0)]
+
+
+PEEPHOLE = """
+    class Main {
+        function int pick(int x) {
+            if (x < 3) {
+                return 1;
+            } else {
+                return 2;
+            }
+        }
+
+        function void nothing() {
+            return;
+        }
+
+        function void main() {
+            var Array a;
+            var int i, x;
+            let a = Array.new(2);
+            let i = 0;
+            let x = -(-5);
+            while (true) {
+                let i = i + 1;
+                do Main.nothing();
+                do Output.printInt(Main.pick(i));
+                if (i = 4) {
+                    let a[0] = x;
+                    let a[1] = ~x;
+                    do Output.printInt(a[0] + a[1]);
+                    return;
+                } else {
+                }
+            }
+            return;
+        }
+    }
+"""
+
+UNARY = ((ARITHMETIC, "neg", 0), (ARITHMETIC, "not", 0))
+ARRAY_STORE_SPILL = [(POP, "temp", 0), (POP, "pointer", 1), (PUSH, "temp", 0), (POP, "that", 0)]
+
+
+def peephole_patterns(instructions: list) -> set:
+    """Returns the names of the peephole rules whose pattern occurs in instructions."""
+    code = [instruction for instruction in instructions if instruction[0] != RAW]
+    targets = {name for opcode, name, _ in code if opcode in (GOTO, IF_GOTO)}
+    found = set()
+    for position, (opcode, name, _) in enumerate(code):
+        rest = code[position + 1:position + 6]
+        labels = [label for _, label, _ in itertools.takewhile(lambda op: op[0] == LABEL, rest)]
+        if opcode == LABEL and name not in targets:
+            found.add("unreferenced label")
+        if opcode in (GOTO, RETURN) and rest and rest[0][0] not in (LABEL, FUNCTION):
+            found.add("unreachable code")
+        if opcode == GOTO and name in labels:
+            found.add("goto next label")
+        if (opcode == ARITHMETIC and name in ("lt", "gt", "eq") and
+                [op[0] for op in rest[:3]] == [IF_GOTO, GOTO, LABEL] and rest[2][1] == rest[0][1]):
+            found.add("comparison jump")
+        if ((opcode, name) == (PUSH, "constant") and len(rest) > 1 and rest[0] in UNARY and
+                (rest[1] in UNARY or rest[1][0] == IF_GOTO)):
+            found.add("constant")
+        if opcode == PUSH and name in STABLE_SEGMENTS:
+            value = rest[1:] if rest[:1] and rest[0] in UNARY else rest
+            if value[:4] == ARRAY_STORE_SPILL:
+                found.add("array store spill")
+            elif rest[:1] == [(POP, "temp", 0)] and rest[1:2] != [(POP, "pointer", 1)]:
+                found.add("discarded value")
+    return found
+
+
+def test_peephole_rules():
+    classes = {"Main": compile_source(textwrap.dedent(PEEPHOLE), as_instructions=True, comments=False)}
+    # Inlining do Main.nothing() leaves a push constant 0 whose value is discarded.
+    inlined = Inliner().inline(classes)
+    optimized = {"Main": PeepholeOptimizer().optimize(inlined["Main"])}
+    outputs = []
+    for program in (classes, inlined, optimized):
+        emulator = VMEmulator(program)
+        emulator.run(max_steps=10_000)
+        outputs.append("".join(emulator.output))
+    assert outputs == ["1122-1"] * 3
+    # The code generator never leaves a label unreferenced; the labels of the if statements only lose their
+    # jumps when the other rules drop them.
+    assert peephole_patterns(inlined["Main"]) == {
+        "unreachable code", "goto next label", "comparison jump", "constant", "array store spill",
+        "discarded value"}
+    assert (LABEL, "EndIf1", 0) in classes["Main"] and (LABEL, "EndIf1", 0) not in optimized["Main"]
+    assert peephole_patterns(optimized["Main"]) == set()
+    check_same_output([PEEPHOLE], "1122-1", optimize=True)
+
+
+POOLED_STRINGS = """
+    class Main {
+        static int first;
+
+        function void greet(int i) {
+            if (i = 2) {
+                do Output.printString("two");
+            }
+            do Output.printString("hi");
+            return;
+        }
+
+        function void main() {
+            var Array words;
+            var int i;
+            let first = 9;
+            let words = Array.new(3);
+            let i = 0;
+            while (i < 3) {
+                do Main.greet(i);
+                let words[i] = "hi";
+                let i = i + 1;
+            }
+            do Output.printInt(first);
+            do Output.printString(words[2]);
+            return;
+        }
+    }
+"""
+
+
+def test_pooled_strings():
+    check_same_output([POOLED_STRINGS], "hihitwohi9hi", pool_strings=True)
+    check_same_output([POOLED_STRINGS], "hihitwohi9hi", pool_strings=True, fast_arrays=True, optimize=True)
+
+
+def test_pooled_strings_are_built_once():
+    source = textwrap.dedent(POOLED_STRINGS)
+    sources = {"Main": compile_source(source, as_instructions=True, pool_strings=True)}
+    emulator = VMEmulator(sources)
+    emulator.run()
+    assert "".join(emulator.output) == "hihitwohi9hi"
+    assert emulator.call_counts["String.new"] == 2
+
+
+ARRAYS = """
+    class Main {
+        static Array a, b;
+
+        function int touch(int i) {
+            let b[i] = b[i] + 100;
+            return i;
+        }
+
+        function int swap() {
+            var Array old;
+            let old = a;
+            let a = b;
+            let b = old;
+            return 5;
+        }
+
+        function void show(Array array, int length) {
+            var int i;
+            let i = 0;
+            while (i < length) {
+                do Output.printInt(array[i]);
+                do Output.printChar(32);
+                let i = i + 1;
+            }
+            return;
+        }
+
+        function void main() {
+            var Array alias;
+            let a = Array.new(4);
+            let b = Array.new(4);
+            let alias = a;
+            let a[0] = 1;
+            let a[1] = a[0] + 1;
+            let a[2] = a[1] + a[0];
+            let alias[3] = a[2] + alias[1];
+            let a[a[0]] = a[3] - a[a[0] - 1];
+            let b[0] = Main.touch(1);
+            let a[Main.touch(2)] = b[1] + b[2];
+            let a[0] = Main.swap();
+            let a[b[0] - 4] = -a[0];
+            let a[3] = ~a[2];
+            do Main.show(a, 4);
+            do Main.show(b, 4);
+            return;
+        }
+    }
+"""
+
+
+def test_fast_arrays():
+    expected = "1 -1 100 -101 5 4 200 5 "
+    check_same_output([ARRAYS], expected, fast_arrays=True)
+    check_same_output([ARRAYS], expected, fast_arrays=True, optimize=True, fold_constants=True)
+
+
+# Conditions at the edges of the inverse comparisons, with calls that must not be skipped by & and |, and
+# while loops on a value that is neither 0 nor -1, which the default code leaves at once.
+BRANCHES = """
+    class Main {
+        static int calls;
+
+        function boolean f(boolean b) {
+            let calls = calls + 1;
+            return b;
+        }
+
+        function void show(boolean b) {
+            if (b) {
+                do Output.printChar(84);
+            } else {
+                do Output.printChar(70);
+            }
+            return;
+        }
+
+        function void main() {
+            var int x, y, i;
+            let x = 32767;
+            do Main.show(~(x < 32767));
+            if (~(x < 32767)) { do Output.printChar(97); }
+            let x = 32766;
+            if (~(x < 32767)) { do Output.printChar(98); } else { do Output.printChar(99); }
+            let x = -32767;
+            if (~(-32767 < x)) { do Output.printChar(100); }
+            let x = x - 1;
+            if (~(-32767 < x)) { do Output.printChar(101); }
+            if (-32767 < x) { do Output.printChar(102); }
+            if (~(x > 32767)) { do Output.printChar(103); }
+            let x = 5;
+            let y = 5;
+            if ((x = 1) = (y = 2)) { do Output.printChar(104); }
+            do Main.show((x = 1) = (y = 2));
+            if (Main.f(false) & Main.f(true)) { do Output.printChar(105); }
+            if (Main.f(true) | Main.f(false)) { do Output.printChar(106); }
+            if ((x = 5) & Main.f(true)) { do Output.printChar(107); }
+            if ((x = 4) | Main.f(false)) { do Output.printChar(108); }
+            do Output.printInt(calls);
+            if ((x = 5) & (y < 6)) { do Output.printChar(109); }
+            if ((x = 4) | ~(y > 4)) { do Output.printChar(110); } else { do Output.printChar(111); }
+            if (x) { do Output.printChar(112); }
+            if (~x) { do Output.printChar(113); }
+            let i = 3;
+            while (i) {
+                let i = i - 1;
+                do Output.printInt(i);
+            }
+            let i = -1;
+            while (i) {
+                let i = i + 1;
+                do Output.printInt(i);
+            }
+            let i = 0;
+            while ((i < 4) & ~(i = 2) | (i = 2)) {
+                let i = i + 1;
+            }
+            do Output.printInt(i);
+            let i = 32767;
+            while (~(i < 32767) | (i < 2)) {
+                let i = i - 1;
+            }
+            do Output.printChar(32);
+            do Output.printInt(i);
+            let i = -32767;
+            let i = i - 1;
+            while (~(-32767 < i)) {
+                let i = i + 1;
+            }
+            do Output.printChar(32);
+            do Output.printInt(i);
+            return;
+        }
+    }
+"""
+
+
+def test_direct_branches():
+    expected = "TacdeghTjk6mopq04 32766 -32766"
+    check_same_output([BRANCHES], expected, direct_branches=True)
+    check_same_output([BRANCHES], expected, direct_branches=True, fold_constants=True, optimize=True)
+    code = compile_source(textwrap.dedent(BRANCHES), comments=False, direct_branches=True).splitlines()
+    labels = {line.split()[1].rstrip("0123456789") for line in code if line.startswith("label")}
+    assert {"Skip", "WhileBody", "WhileTest", "WhileEnd"} <= labels
+    # The loop on ~(i < 32767) tests i > 32766 instead; x > 32767 has no inverse and is kept.
+    pairs = set(zip(code, code[1:]))
+    assert ("push constant 32766", "gt") in pairs and ("push constant 32767", "gt") in pairs
+
+
+def test_bytecode_runs_like_text(tmp_path):
+    programs = {"Main": ARRAYS, "Strings": POOLED_STRINGS.replace("Main", "Strings")}
+    for class_name, source in programs.items():
+        (tmp_path / (class_name + ".jack")).write_text(textwrap.dedent(source))
+    for options in ({}, {"pool_strings": True, "fold_constants": True, "optimize": True}):
+        for class_name in programs:
+            path = tmp_path / class_name
+            result = compile_path(f"{path}.jack", f"{path}.vm", options, bytecode=True)
+            assert result.error is None
+            assert VMBytecode.to_text(VMBytecode.read_file(f"{path}.vmb")) == (tmp_path / f"{class_name}.vm").read_text()
+        outputs = []
+        for bytecode in (False, True):
+            emulator = VMEmulator.from_directory(str(tmp_path), bytecode)
+            emulator.run("Main.main")
+            emulator.run("Strings.main")
+            outputs.append("".join(emulator.output))
+        assert outputs == ["1 -1 100 -101 5 4 200 5 hihitwohi9hi"] * 2
+
+
+def test_hoisting_keeps_static_aliased_by_array_store():
+    check_same_output([STATIC_ALIAS], "36", hoist_invariants=True)
+
+
+def test_hoisting_keeps_field_aliased_by_array_store():
+    check_same_output([FIELD_ALIAS], "30", hoist_invariants=True)
+
+
+VARIANT_LOOP = """
+    class Main {
+        function void main() {
+            var Array a;
+            var int i, n, sum;
+            let a = Array.new(2);
+            let a[0] = 1;
+            let n = 2;
+            let i = 0;
+            let sum = 0;
+            while (i < 3) {
+                let sum = sum + (n * n) + a[0];
+                let n = n + 1;
+                let a[0] = a[0] + 1;
+                let i = i + 1;
+            }
+            do Output.printInt(sum);
+            return;
+        }
+    }
+"""
+
+
+def split_at_loop(source: str, **options) -> tuple:
+    """Compiles a class with one while loop and returns its function command and the code before and in the loop."""
+    code = compile_source(textwrap.dedent(source), comments=False, **options).splitlines()
+    start, end = code.index("label L1"), code.index("label L2")
+    return code[0], code[1:start], code[start:end]
+
+
+def test_hoisting_invariant_loop():
+    check_same_output([INVARIANT_LOOP], str(12 * (7 + 36)), hoist_invariants=True)
+    assert split_at_loop(INVARIANT_LOOP)[0] == "function Main.main 4"
+    function, before, loop = split_at_loop(INVARIANT_LOOP, hoist_invariants=True)
+    # n * 2, a[0] and n * n each get a local and are computed once before the loop.
+    assert function == "function Main.main 7"
+    assert before.count("call Math.multiply 2") == 2 and "push that 0" in before
+    assert "call Math.multiply 2" not in loop and "push that 0" not in loop
+
+
+def test_hoisting_keeps_operands_assigned_in_the_loop():
+    # n changes in the loop and a[0] is stored to, so neither n * n nor a[0] may be hoisted.
+    check_same_output([VARIANT_LOOP], "35", hoist_invariants=True)
+    assert split_at_loop(VARIANT_LOOP, hoist_invariants=True) == split_at_loop(VARIANT_LOOP)
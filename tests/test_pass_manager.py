@@ -0,0 +1,96 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from CompilationEngine import CompilationEngine
+from JackAST import Class, Constant
+from JackTokenizer import JackTokenizer
+from PassManager import PassManager
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "corpus")
+
+# Digests of the VM text that the compiler wrote for the corpus before it was split into a parser, passes
+# and a code generator. Without options, and so without passes, the output must not change.
+CORPUS_DIGESTS = {
+    "List.jack": "f10eec65c73914f8",
+    "Main.jack": "b920fa4284a007af",
+    "Math.jack": "c74e71c785df21ca",
+    "Memory.jack": "7d5b75f3bcd7eaff",
+    "Screen.jack": "e0095fb545ce836a",
+    "Sort.jack": "522b0cf6d3b34723",
+    "Square.jack": "ec9cec8858f3682b",
+}
+
+
+def compile_corpus_file(filename: str, passes: list = ()) -> CompilationEngine:
+    """Compiles a corpus class with the given extra (name, pass) pairs registered and returns the engine."""
+    with open(os.path.join(CORPUS, filename), 'r') as jack_file:
+        tokenizer = JackTokenizer(jack_file)
+    engine = CompilationEngine(tokenizer, io.StringIO())
+    for name, function in passes:
+        engine.passes.register(name, function)
+    engine.compile_class()
+    return engine
+
+
+@pytest.mark.parametrize("filename", sorted(CORPUS_DIGESTS))
+def test_output_without_passes_is_unchanged(filename):
+    engine = compile_corpus_file(filename)
+    assert engine.passes.names() == [] and "passes" not in engine.report
+    text = engine.vm_writer.output_stream.getvalue()
+    assert hashlib.blake2b(text.encode(), digest_size=8).hexdigest() == CORPUS_DIGESTS[filename]
+    # A pass that leaves the tree alone leaves the output alone as well.
+    seen = []
+    engine = compile_corpus_file(filename, [("identity", lambda tree: seen.append(tree.name) or tree)])
+    assert engine.vm_writer.output_stream.getvalue() == text
+    assert seen == [filename[:-len(".jack")]]
+    assert list(engine.report["passes"]) == ["identity"]
+
+
+def test_passes_run_in_registration_order_and_are_timed():
+    calls = []
+
+    def recorder(name: str):
+        def run(tree: Class) -> Class:
+            calls.append(name)
+            return tree
+        return run
+    manager = PassManager()
+    manager.register("fold", recorder("fold"))
+    manager.register("hoist", recorder("hoist"))
+    manager.register("first", recorder("first"), before="fold")
+    manager.register("middle", recorder("middle"), after="fold")
+    assert manager.names() == ["first", "fold", "middle", "hoist"]
+    tree = Class("Main", [], [])
+    assert manager.run(tree) is tree
+    manager.unregister("middle")
+    manager.run(tree)
+    assert calls == ["first", "fold", "middle", "hoist", "first", "fold", "hoist"]
+    assert sorted(manager.timings) == ["first", "fold", "hoist", "middle"]
+    assert all(elapsed >= 0 for elapsed in manager.timings.values())
+
+
+def test_registering_the_same_or_an_unknown_pass_fails():
+    manager = PassManager()
+    manager.register("fold", lambda tree: tree)
+    with pytest.raises(ValueError):
+        manager.register("fold", lambda tree: tree)
+    with pytest.raises(ValueError):
+        manager.register("hoist", lambda tree: tree, after="inline")
+    with pytest.raises(ValueError):
+        manager.unregister("inline")
+
+
+def test_engine_runs_a_registered_pass_after_the_built_in_ones():
+    source = "class Main { function int f() { return 2 * 3; } }"
+    engine = CompilationEngine(JackTokenizer(io.StringIO(source)), io.StringIO(), fold_constants=True)
+    returned = []
+    engine.passes.register("inspect", lambda tree: returned.append(tree.subroutines[0].statements[0].value) or tree)
+    engine.passes.register("setup", lambda tree: tree, before="fold-constants")
+    engine.compile_class()
+    assert engine.passes.names() == ["setup", "fold-constants", "inspect"]
+    assert list(engine.report["passes"]) == ["setup", "fold-constants", "inspect"]
+    # The pass sees the tree that constant folding left.
+    assert returned == [Constant(6)]
@@ -0,0 +1,75 @@
+import runpy
+import sys
+
+import pytest
+
+import SourceMap
+import VMEmulator
+from JackCompiler import compile_path
+from VMWriter import PUSH, RAW
+
+LOOP = """class Main {
+    function void main() {
+        var int i, x;
+        let i = 0;
+        let x = 1;
+        while (i < 5) {
+            let x = x * 3;
+            let i = i + 1;
+        }
+        do Output.printInt(x);
+        return;
+    }
+}
+"""
+
+# Instructions executed per line: the function command goes with the first statement, the loop test runs
+# six times, and the jump back to the test and the end label of the loop go with the last line of the body.
+LINE_COUNTS = {4: 3, 5: 2, 6: 6 * 6, 7: 5 * 4, 8: 5 * 5 + 1, 10: 3, 11: 2}
+
+
+@pytest.mark.parametrize("comments", [True, False])
+def test_commands_are_attributed_to_their_lines(tmp_path, comments):
+    (tmp_path / "Main.jack").write_text(LOOP)
+    result = compile_path(str(tmp_path / "Main.jack"), str(tmp_path / "Main.vm"),
+                          {"source_map": True, "comments": comments})
+    assert result.error is None
+    text = (tmp_path / "Main.vm").read_text()
+    assert ("// while (" in text) == comments
+    source, mappings = SourceMap.load(SourceMap.source_map_path(str(tmp_path / "Main.vm")))
+    assert source == "Main.jack"
+    # Comment lines are not counted, so the map is the same either way.
+    commands = [line for line in text.splitlines() if not line.startswith("//")]
+    assert SourceMap.locate(mappings, 0) == (4, 9)
+    assert SourceMap.locate(mappings, commands.index("call Math.multiply 2")) == (7, 13)
+    assert SourceMap.locate(mappings, commands.index("call Output.printInt 1")) == (10, 9)
+    assert SourceMap.locate(mappings, len(commands) - 1) == (11, 9)
+    emulator = VMEmulator.VMEmulator.from_directory(str(tmp_path))
+    emulator.run()
+    assert emulator.output == ["243"]
+    counts = emulator.count_by_line(VMEmulator.read_source_maps(str(tmp_path)))
+    assert counts == {("Main.jack", line): total for line, total in LINE_COUNTS.items()}
+    assert sum(counts.values()) == emulator.executed
+
+
+def test_locate_before_the_first_mapping():
+    assert SourceMap.locate([(2, 1, 1), (5, 3, 9)], 1) is None
+    assert SourceMap.locate([(2, 1, 1), (5, 3, 9)], 4) == (1, 1)
+
+
+def test_strip_markers():
+    instructions = [(RAW, "// let x = 1;", 7), (PUSH, "constant", 1), (RAW, "// comment", 0)]
+    assert SourceMap.strip_markers(instructions, True) == [
+        (RAW, "// let x = 1;", 0), (PUSH, "constant", 1), (RAW, "// comment", 0)]
+    assert SourceMap.strip_markers(instructions, False) == [(PUSH, "constant", 1)]
+
+
+def test_lines_report(tmp_path, monkeypatch, capsys):
+    (tmp_path / "Main.jack").write_text(LOOP)
+    assert compile_path(str(tmp_path / "Main.jack"), str(tmp_path / "Main.vm"), {"source_map": True}).error is None
+    monkeypatch.setattr(sys, "argv", ["VMEmulator.py", str(tmp_path), "--lines"])
+    runpy.run_path(VMEmulator.__file__, run_name="__main__")
+    report = capsys.readouterr().out.splitlines()
+    rows = report[report.index(f"{'line':<40}{'instructions':>14}") + 1:]
+    assert [row.split() for row in rows] == [
+        [f"Main.jack:{line}", str(total)] for line, total in sorted(LINE_COUNTS.items(), key=lambda item: -item[1])]
@@ -0,0 +1,66 @@
+import io
+import os
+
+import pytest
+
+from JackTokenizer import JackTokenizer, KEYWORD, IDENTIFIER, END
+
+
+def tokenize(source: str) -> JackTokenizer:
+    return JackTokenizer(io.StringIO(source))
+
+
+def test_accessors_need_a_current_token():
+    tokenizer = tokenize("class Main { }")
+    for accessor in (tokenizer.token_type_code, tokenizer.keyword, tokenizer.get_offset):
+        with pytest.raises(RuntimeError):
+            accessor()
+
+
+def test_accessors_follow_advance():
+    tokenizer = tokenize("class Main")
+    tokenizer.advance()
+    assert tokenizer.token_type_code() == KEYWORD
+    assert tokenizer.keyword() == "CLASS"
+    tokenizer.advance()
+    assert tokenizer.token_type_code() == IDENTIFIER
+    tokenizer.advance()
+    assert tokenizer.at_end()
+    assert tokenizer.token_type_code() == END
+    assert tokenizer.keyword() == ""
+
+
+def test_position_counts_characters():
+    tokenizer = tokenize('let s = "\u00e9t\u00e9 \u2603";\n  do  f(); // \u00e9\nreturn;')
+    positions = []
+    while tokenizer.has_more_tokens():
+        tokenizer.advance()
+        positions.append((tokenizer.get_token(), tokenizer.position()))
+    assert positions[3:5] == [('"\u00e9t\u00e9 \u2603"', (1, 9)), (";", (1, 16))]
+    assert positions[5] == ("do", (2, 3))
+    assert positions[-2:] == [("return", (3, 1)), (";", (3, 7))]
+    tokenizer.advance()
+    assert tokenizer.position() == (3, 8)
+
+
+def test_position_counts_characters_in_files(tmp_path):
+    path = tmp_path / "Main.jack"
+    path.write_text('/* \u00e9 */ class Main {\n}\n', encoding="utf-8")
+    with open(path, 'r') as jack_file:
+        tokenizer = JackTokenizer(jack_file)
+    tokenizer.advance()
+    assert tokenizer.position() == (1, 9)
+    tokenizer.advance()
+    assert tokenizer.position() == (1, 15)
+
+
+def test_reads_streams_that_are_not_regular_files():
+    read_end, write_end = os.pipe()
+    with os.fdopen(write_end, 'w') as writer:
+        writer.write("class A {\n  field int x;\n}\n")
+    with os.fdopen(read_end, 'r') as reader:
+        tokenizer = JackTokenizer(reader)
+    assert tokenizer.get_tokens_list() == ["class", "A", "{", "field", "int", "x", ";", "}"]
+    tokenizer.advance()
+    tokenizer.advance()
+    assert tokenizer.position() == (1, 7)
@@ -0,0 +1,39 @@
+import pytest
+
+from VMEmulator import VMEmulator, VMError
+
+CORRUPTED_FRAME = """
+function Main.main 0
+push constant 0
+pop pointer 1
+push constant %d
+pop that 1
+push constant 0
+return
+"""
+
+
+def run(code: str) -> VMEmulator:
+    emulator = VMEmulator({"Main": code})
+    emulator.run(max_steps=1000)
+    return emulator
+
+
+def test_return():
+    emulator = run("function Main.main 0\npush constant 7\ncall Output.printInt 1\npush constant 0\nreturn\n")
+    assert emulator.output == ["7"]
+
+
+@pytest.mark.parametrize("frame", [2, 0, -1])
+def test_corrupted_frame_pointer(frame):
+    with pytest.raises(VMError, match="corrupted frame pointer"):
+        run(CORRUPTED_FRAME % frame)
+
+
+def test_unbounded_recursion_overflows_the_stack():
+    emulator = VMEmulator({"Main": "function Main.main 1\ncall Main.main 0\nreturn\n"})
+    with pytest.raises(VMError, match="stack overflow"):
+        emulator.run(max_steps=100_000)
+    assert len(emulator.memory) == 32768
+    # No frame was written past the stack, into the heap and the memory maps above it.
+    assert not any(emulator.memory[2048:])